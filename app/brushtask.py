@@ -3,14 +3,15 @@ import sys
 import time
 import traceback
 from datetime import datetime
+from threading import Lock
 from time import sleep
 
 from apscheduler.schedulers.background import BackgroundScheduler
 
 import log
-from app.helper import SqlHelper, DictHelper
+from app.helper import SqlHelper, DictHelper, RssHelper
 from app.sites import Sites
-from config import BRUSH_REMOVE_TORRENTS_INTERVAL
+from config import BRUSH_REMOVE_TORRENTS_INTERVAL, BRUSH_RSS_SEEN_DAYS, BRUSH_RSS_SEEN_MAX
 from app.downloader import Qbittorrent, Transmission
 from app.message import Message
 from app.rss import Rss
@@ -18,6 +19,8 @@ from app.utils import StringUtils
 from app.utils.types import BrushDeleteType, SystemDictType
 from app.utils.commons import singleton
 
+lock = Lock()
+
 
 @singleton
 class BrushTask(object):
@@ -25,11 +28,15 @@ class BrushTask(object):
     sites = None
     _scheduler = None
     _brush_tasks = []
-    _torrents_cache = []
     _qb_client = "qbittorrent"
     _tr_client = "transmission"
+    # qbittorrent中出错或数据迁移中的种子状态，这些种子不检查删种条件
+    _qb_skip_states = ["error", "missingFiles", "moving", "checkingResumeData", "unknown"]
+    # 已连接的下载器客户端 {下载器ID: (下载器参数, 客户端)}
+    _downloaders = {}
 
     def __init__(self):
+        self._downloaders = {}
         self.init_config()
 
     def init_config(self):
@@ -136,13 +143,20 @@ class BrushTask(object):
                                            downloadercfg=downloader_cfg,
                                            dlcount=rss_rule.get("dlcount")):
             return
-        rss_result = Rss.parse_rssxml(rss_url)
+        # 刷流规则变化后重新处理RSS中已有的种子
+        RssHelper().reset_on_change("brush_%s" % taskid, [rss_rule, rss_free])
+        rss_result = Rss.parse_rssxml(rss_url, key="brush_%s" % taskid)
         if len(rss_result) == 0:
-            log_warn("【Brush】%s RSS未下载到数据" % site_name)
+            log_info("【Brush】%s RSS没有新数据" % site_name)
             return
         else:
             log_info("【Brush】%s RSS获取数据：%s" % (site_name, len(rss_result)))
         success_count = 0
+        # 已处理过的种子
+        seen_enclosures = SqlHelper.get_brushtask_rss_seen(taskid, [res.get('enclosure') for res in rss_result])
+        # 本次已下载或不符合选种规则的种子，下载失败、出错或未检查到的种子下次继续处理
+        new_enclosures = []
+        processed_items = []
 
         for res in rss_result:
             try:
@@ -159,10 +173,9 @@ class BrushTask(object):
                 # 发布时间
                 pubdate = res.get('pubdate')
 
-                if enclosure not in self._torrents_cache:
-                    self._torrents_cache.append(enclosure)
-                else:
+                if enclosure in seen_enclosures:
                     log.debug("【Brush】%s 已处理过" % torrent_name)
+                    processed_items.append(res)
                     continue
 
                 # 检查种子是否符合选种规则
@@ -174,6 +187,9 @@ class BrushTask(object):
                                              pubdate=pubdate,
                                              cookie=cookie,
                                              ua=ua):
+                    seen_enclosures.add(enclosure)
+                    new_enclosures.append(enclosure)
+                    processed_items.append(res)
                     continue
                 # 开始下载
                 log.debug("【Brush】%s 符合条件，开始下载..." % torrent_name)
@@ -188,6 +204,9 @@ class BrushTask(object):
                                            upspeed=rss_rule.get("upspeed"),
                                            downspeed=rss_rule.get("downspeed"),
                                            taskname=task_name):
+                    seen_enclosures.add(enclosure)
+                    new_enclosures.append(enclosure)
+                    processed_items.append(res)
                     # 计数
                     success_count += 1
                     # 再判断一次
@@ -200,6 +219,12 @@ class BrushTask(object):
             except Exception as err:
                 log.console(str(err) + " - " + traceback.format_exc())
                 continue
+        # 登记已处理的种子，并清理过期记录
+        RssHelper().update_processed(rss_url, processed_items, key="brush_%s" % taskid)
+        SqlHelper.insert_brushtask_rss_seen(taskid, new_enclosures)
+        SqlHelper.truncate_brushtask_rss_seen(taskid,
+                                              expire_time=time.time() - BRUSH_RSS_SEEN_DAYS * 24 * 3600,
+                                              max_count=BRUSH_RSS_SEEN_MAX)
         log_info("【Brush】任务 %s 本次添加了 %s 个下载" % (task_name, success_count))
 
     def remove_tasks_torrents(self):
@@ -207,213 +232,263 @@ class BrushTask(object):
         根据条件检查所有任务下载完成的种子，按条件进行删除，并更新任务数据
         由定时服务调用
         """
-        # 遍历所有任务
+        # 按下载器汇总任务，每个下载器只查询一次种子
+        downloader_tasks = {}
         for taskinfo in self._brush_tasks:
             if taskinfo.get("state") != "Y":
                 continue
             try:
-                # 总上传量
-                total_uploaded = 0
-                # 总下载量
-                total_downloaded = 0
-                # 可以删种的种子
-                delete_ids = []
-                # 需要更新状态的种子
-                update_torrents = []
-                # 任务信息
-                taskid = taskinfo.get("id")
-                task_name = taskinfo.get("name")
-                download_id = taskinfo.get("downloader")
-                remove_rule = taskinfo.get("remove_rule")
-                sendmessage = True if taskinfo.get("sendmessage") == "Y" else False
                 # 当前任务种子详情
-                task_torrents = SqlHelper.get_brushtask_torrents(taskid)
+                task_torrents = SqlHelper.get_brushtask_torrents(taskinfo.get("id"))
                 torrent_ids = [item[6] for item in task_torrents if item[6]]
                 if not torrent_ids:
                     continue
                 # 下载器参数
-                downloader_cfg = self.get_downloader_config(download_id)
+                downloader_cfg = self.get_downloader_config(taskinfo.get("downloader"))
                 if not downloader_cfg:
-                    log_warn("【Brush】任务 %s 下载器不存在" % task_name)
+                    log_warn("【Brush】任务 %s 下载器不存在" % taskinfo.get("name"))
                     continue
-                # 下载器类型
-                client_type = downloader_cfg.get("type")
-                # qbittorrent
-                if client_type == self._qb_client:
-                    downloader = Qbittorrent(user_config=downloader_cfg)
-                    # 检查完成状态的
-                    torrents, has_err = downloader.get_torrents(ids=torrent_ids, status=["completed"])
-                    # 看看是否有错误, 有错误的话就不处理了
-                    if has_err:
-                        log_warn("【BRUSH】任务 %s 获取种子状态失败" % task_name)
-                        continue
-                    remove_torrent_ids = list(
-                        set(torrent_ids).difference(set([torrent.get("hash") for torrent in torrents])))
-                    for torrent in torrents:
-                        # ID
-                        torrent_id = torrent.get("hash")
-                        # 已开始时间 秒
-                        dltime = int(time.time() - torrent.get("added_on"))
-                        # 已做种时间 秒
-                        seeding_time = torrent.get('seeding_time') or 0
-                        # 分享率
-                        ratio = torrent.get("ratio") or 0
-                        # 上传量
-                        uploaded = torrent.get("uploaded") or 0
-                        total_uploaded += uploaded
-                        # 平均上传速度 Byte/s
-                        avg_upspeed = int(uploaded / dltime)
-                        # 下载量
-                        downloaded = torrent.get("downloaded")
-                        total_downloaded += downloaded
-                        need_delete, delete_type = self.__check_remove_rule(remove_rule=remove_rule,
-                                                                            seeding_time=seeding_time,
-                                                                            ratio=ratio,
-                                                                            uploaded=uploaded,
-                                                                            avg_upspeed=avg_upspeed)
-                        if need_delete:
-                            log_info("【Brush】%s 做种达到删种条件：%s，删除任务..." % (torrent.get('name'), delete_type.value))
-                            if sendmessage:
-                                msg_title = "【刷流任务 {} 删除做种】".format(task_name)
-                                msg_text = "删除原因：{}\n种子名称：{}".format(delete_type.value, torrent.get('name'))
-                                self.message.sendmsg(title=msg_title, text=msg_text)
-
-                            if torrent_id not in delete_ids:
-                                delete_ids.append(torrent_id)
-                                update_torrents.append(("%s,%s" % (uploaded, downloaded), taskid, torrent_id))
-                    # 检查下载中状态的
-                    torrents, has_err = downloader.get_torrents(ids=torrent_ids, status=["downloading"])
-                    # 看看是否有错误, 有错误的话就不处理了
-                    if has_err:
-                        log_warn("【BRUSH】任务 %s 获取种子状态失败" % task_name)
-                        continue
-                    remove_torrent_ids = list(
-                        set(remove_torrent_ids).difference(set([torrent.get("hash") for torrent in torrents])))
-                    for torrent in torrents:
-                        # ID
-                        torrent_id = torrent.get("hash")
-                        # 下载耗时 秒
-                        dltime = int(time.time() - torrent.get("added_on"))
-                        # 上传量 Byte
-                        uploaded = torrent.get("uploaded") or 0
-                        total_uploaded += uploaded
-                        # 平均上传速度 Byte/s
-                        avg_upspeed = int(uploaded / dltime)
-                        # 下载量
-                        downloaded = torrent.get("downloaded")
-                        total_downloaded += downloaded
-                        need_delete, delete_type = self.__check_remove_rule(remove_rule=remove_rule,
-                                                                            dltime=dltime,
-                                                                            avg_upspeed=avg_upspeed)
-                        if need_delete:
-                            log_info("【Brush】%s 达到删种条件：%s，删除下载任务..." % (torrent.get('name'), delete_type.value))
-                            if sendmessage:
-                                msg_title = "【刷流任务 {} 删除做种】".format(task_name)
-                                msg_text = "删除原因：{}\n种子名称：{}".format(delete_type.value, torrent.get('name'))
-                                self.message.sendmsg(title=msg_title, text=msg_text)
-
-                            if torrent_id not in delete_ids:
-                                delete_ids.append(torrent_id)
-                                update_torrents.append(("%s,%s" % (uploaded, downloaded), taskid, torrent_id))
-                # transmission
-                else:
-                    # 将查询的torrent_ids转为数字型
-                    torrent_ids = [int(x) for x in torrent_ids if str(x).isdigit()]
-                    # 检查完成状态
-                    downloader = Transmission(user_config=downloader_cfg)
-                    torrents, has_err = downloader.get_torrents(ids=torrent_ids, status=["seeding", "seed_pending"])
-                    # 看看是否有错误, 有错误的话就不处理了
-                    if has_err:
-                        log_warn("【BRUSH】任务 %s 获取种子状态失败" % task_name)
-                        continue
-                    remove_torrent_ids = list(set(torrent_ids).difference(set([torrent.id for torrent in torrents])))
-                    for torrent in torrents:
-                        # ID
-                        torrent_id = torrent.id
-                        # 做种时间
-                        date_done = torrent.date_done if torrent.date_done else torrent.date_added
-                        dltime = (datetime.now().astimezone() - torrent.date_added).seconds
-                        seeding_time = (datetime.now().astimezone() - date_done).seconds
-                        # 下载量
-                        downloaded = int(torrent.total_size * torrent.progress / 100)
-                        total_downloaded += downloaded
-                        # 分享率
-                        ratio = torrent.ratio or 0
-                        # 上传量
-                        uploaded = int(downloaded * torrent.ratio)
-                        total_uploaded += uploaded
-                        # 平均上传速度
-                        avg_upspeed = int(uploaded / dltime)
-                        need_delete, delete_type = self.__check_remove_rule(remove_rule=remove_rule,
-                                                                            seeding_time=seeding_time,
-                                                                            ratio=ratio,
-                                                                            uploaded=uploaded,
-                                                                            avg_upspeed=avg_upspeed)
-                        if need_delete:
-                            log_info("【Brush】%s 做种达到删种条件：%s，删除任务..." % (torrent.name, delete_type.value))
-                            if sendmessage:
-                                msg_title = "【刷流任务 {} 删除做种】".format(task_name)
-                                msg_text = "删除原因：{}\n种子名称：{}".format(delete_type.value, torrent.name)
-                                self.message.sendmsg(title=msg_title, text=msg_text)
-
-                            if torrent_id not in delete_ids:
-                                delete_ids.append(torrent_id)
-                                update_torrents.append(("%s,%s" % (uploaded, downloaded), taskid, torrent_id))
-                    # 检查下载状态
-                    torrents, has_err = downloader.get_torrents(ids=torrent_ids,
-                                                                status=["downloading", "download_pending", "stopped"])
-                    # 看看是否有错误, 有错误的话就不处理了
-                    if has_err:
-                        log_warn("【BRUSH】任务 %s 获取种子状态失败" % task_name)
-                        continue
-                    remove_torrent_ids = list(
-                        set(remove_torrent_ids).difference(set([torrent.id for torrent in torrents])))
-                    for torrent in torrents:
-                        # ID
-                        torrent_id = torrent.id
-                        # 下载耗时
-                        dltime = (datetime.now().astimezone() - torrent.date_added).seconds
-                        # 下载量
-                        downloaded = int(torrent.total_size * torrent.progress / 100)
-                        total_downloaded += downloaded
-                        # 上传量
-                        uploaded = int(downloaded * torrent.ratio)
-                        total_uploaded += uploaded
-                        # 平均上传速度
-                        avg_upspeed = int(uploaded / dltime)
-                        need_delete, delete_type = self.__check_remove_rule(remove_rule=remove_rule,
-                                                                            dltime=dltime,
-                                                                            avg_upspeed=avg_upspeed)
-                        if need_delete:
-                            log_info("【Brush】%s 达到删种条件：%s，删除下载任务..." % (torrent.name, delete_type.value))
-                            if sendmessage:
-                                msg_title = "【刷流任务 {} 删除做种】".format(task_name)
-                                msg_text = "删除原因：{}\n种子名称：{}".format(delete_type.value, torrent.name)
-                                self.message.sendmsg(title=msg_title, text=msg_text)
-
-                            if torrent_id not in delete_ids:
-                                delete_ids.append(torrent_id)
-                                update_torrents.append(("%s,%s" % (uploaded, downloaded), taskid, torrent_id))
-                # 手工删除的种子，清除对应记录
-                if remove_torrent_ids:
-                    log_info("【Brush】任务 %s 的这些下载任务在下载器中不存在，将删除任务记录：%s" % (task_name, remove_torrent_ids))
-                    for remove_torrent_id in remove_torrent_ids:
-                        SqlHelper.delete_brushtask_torrent(taskid, remove_torrent_id)
-                # 更新种子状态为已删除
-                SqlHelper.update_brushtask_torrent_state(update_torrents)
-                # 删除下载器种子
-                if delete_ids:
-                    downloader.delete_torrents(delete_file=True, ids=delete_ids)
-                    log_info("【Brush】任务 %s 共删除 %s 个刷流下载任务" % (task_name, len(delete_ids)))
-                else:
-                    log_info("【Brush】任务 %s 本次检查未删除下载任务" % task_name)
-                # 更新上传下载量和删除种子数
-                SqlHelper.add_brushtask_upload_count(brush_id=taskid,
-                                                     upload_size=total_uploaded,
-                                                     download_size=total_downloaded,
-                                                     remove_count=len(delete_ids) + len(remove_torrent_ids))
+                if downloader_cfg.get("id") not in downloader_tasks:
+                    downloader_tasks[downloader_cfg.get("id")] = {"cfg": downloader_cfg, "tasks": []}
+                downloader_tasks[downloader_cfg.get("id")]["tasks"].append((taskinfo, torrent_ids))
             except Exception as e:
                 log.console(str(e) + " - " + traceback.format_exc())
+        for downloader_task in downloader_tasks.values():
+            downloader_cfg = downloader_task.get("cfg")
+            downloader = self.__get_downloader(downloader_cfg)
+            torrents, has_err = downloader.get_torrents()
+            # 看看是否有错误, 有错误的话就不处理了
+            if has_err:
+                self.__reset_downloader(downloader_cfg)
+                log_warn("【BRUSH】下载器 %s 获取种子状态失败" % downloader_cfg.get("name"))
+                continue
+            for taskinfo, torrent_ids in downloader_task.get("tasks"):
+                try:
+                    self.__remove_task_torrents(taskinfo=taskinfo,
+                                                downloader=downloader,
+                                                client_type=downloader_cfg.get("type"),
+                                                torrent_ids=torrent_ids,
+                                                torrents=torrents)
+                except Exception as e:
+                    log.console(str(e) + " - " + traceback.format_exc())
+
+    def __remove_task_torrents(self, taskinfo, downloader, client_type, torrent_ids, torrents):
+        """
+        检查一个任务的种子，按条件进行删除，并更新任务数据
+        :param taskinfo: 任务信息
+        :param downloader: 下载器客户端
+        :param client_type: 下载器类型
+        :param torrent_ids: 任务的下载任务ID
+        :param torrents: 下载器中的所有种子
+        """
+        # 总上传量
+        total_uploaded = 0
+        # 总下载量
+        total_downloaded = 0
+        # 可以删种的种子
+        delete_ids = []
+        # 需要更新状态的种子
+        update_torrents = []
+        # 任务信息
+        taskid = taskinfo.get("id")
+        task_name = taskinfo.get("name")
+        remove_rule = taskinfo.get("remove_rule")
+        sendmessage = True if taskinfo.get("sendmessage") == "Y" else False
+        # qbittorrent
+        if client_type == self._qb_client:
+            task_torrent_ids = set(torrent_ids)
+            task_torrents = [torrent for torrent in torrents if torrent.get("hash") in task_torrent_ids]
+            # 只有下载器中已不存在的种子才删除任务记录
+            remove_torrent_ids = list(
+                task_torrent_ids.difference(set([torrent.get("hash") for torrent in task_torrents])))
+            # 与下载器completed/downloading过滤一致，按剩余下载量区分已完成和下载中（含暂停/停止状态）
+            task_torrents = [torrent for torrent in task_torrents
+                             if torrent.get("state") not in self._qb_skip_states]
+            # 检查完成状态的
+            torrents = [torrent for torrent in task_torrents if self.__is_qb_completed(torrent)]
+            for torrent in torrents:
+                # ID
+                torrent_id = torrent.get("hash")
+                # 已开始时间 秒
+                dltime = int(time.time() - torrent.get("added_on"))
+                # 已做种时间 秒
+                seeding_time = torrent.get('seeding_time') or 0
+                # 分享率
+                ratio = torrent.get("ratio") or 0
+                # 上传量
+                uploaded = torrent.get("uploaded") or 0
+                total_uploaded += uploaded
+                # 平均上传速度 Byte/s
+                avg_upspeed = int(uploaded / dltime)
+                # 下载量
+                downloaded = torrent.get("downloaded")
+                total_downloaded += downloaded
+                need_delete, delete_type = self.__check_remove_rule(remove_rule=remove_rule,
+                                                                    seeding_time=seeding_time,
+                                                                    ratio=ratio,
+                                                                    uploaded=uploaded,
+                                                                    avg_upspeed=avg_upspeed)
+                if need_delete:
+                    log_info("【Brush】%s 做种达到删种条件：%s，删除任务..." % (torrent.get('name'), delete_type.value))
+                    if sendmessage:
+                        msg_title = "【刷流任务 {} 删除做种】".format(task_name)
+                        msg_text = "删除原因：{}\n种子名称：{}".format(delete_type.value, torrent.get('name'))
+                        self.message.sendmsg(title=msg_title, text=msg_text)
+
+                    if torrent_id not in delete_ids:
+                        delete_ids.append(torrent_id)
+                        update_torrents.append(("%s,%s" % (uploaded, downloaded), taskid, torrent_id))
+            # 检查下载中状态的
+            torrents = [torrent for torrent in task_torrents if not self.__is_qb_completed(torrent)]
+            for torrent in torrents:
+                # ID
+                torrent_id = torrent.get("hash")
+                # 下载耗时 秒
+                dltime = int(time.time() - torrent.get("added_on"))
+                # 上传量 Byte
+                uploaded = torrent.get("uploaded") or 0
+                total_uploaded += uploaded
+                # 平均上传速度 Byte/s
+                avg_upspeed = int(uploaded / dltime)
+                # 下载量
+                downloaded = torrent.get("downloaded")
+                total_downloaded += downloaded
+                need_delete, delete_type = self.__check_remove_rule(remove_rule=remove_rule,
+                                                                    dltime=dltime,
+                                                                    avg_upspeed=avg_upspeed)
+                if need_delete:
+                    log_info("【Brush】%s 达到删种条件：%s，删除下载任务..." % (torrent.get('name'), delete_type.value))
+                    if sendmessage:
+                        msg_title = "【刷流任务 {} 删除做种】".format(task_name)
+                        msg_text = "删除原因：{}\n种子名称：{}".format(delete_type.value, torrent.get('name'))
+                        self.message.sendmsg(title=msg_title, text=msg_text)
+
+                    if torrent_id not in delete_ids:
+                        delete_ids.append(torrent_id)
+                        update_torrents.append(("%s,%s" % (uploaded, downloaded), taskid, torrent_id))
+        # transmission
+        else:
+            # 将查询的torrent_ids转为数字型
+            torrent_ids = [int(x) for x in torrent_ids if str(x).isdigit()]
+            task_torrent_ids = set(torrent_ids)
+            task_torrents = [torrent for torrent in torrents if torrent.id in task_torrent_ids]
+            # 只有下载器中已不存在的种子才删除任务记录
+            remove_torrent_ids = list(task_torrent_ids.difference(set([torrent.id for torrent in task_torrents])))
+            # 检查完成状态
+            torrents = [torrent for torrent in task_torrents if torrent.status in ["seeding", "seed_pending"]]
+            for torrent in torrents:
+                # ID
+                torrent_id = torrent.id
+                # 做种时间
+                date_done = torrent.date_done if torrent.date_done else torrent.date_added
+                dltime = (datetime.now().astimezone() - torrent.date_added).seconds
+                seeding_time = (datetime.now().astimezone() - date_done).seconds
+                # 下载量
+                downloaded = int(torrent.total_size * torrent.progress / 100)
+                total_downloaded += downloaded
+                # 分享率
+                ratio = torrent.ratio or 0
+                # 上传量
+                uploaded = int(downloaded * torrent.ratio)
+                total_uploaded += uploaded
+                # 平均上传速度
+                avg_upspeed = int(uploaded / dltime)
+                need_delete, delete_type = self.__check_remove_rule(remove_rule=remove_rule,
+                                                                    seeding_time=seeding_time,
+                                                                    ratio=ratio,
+                                                                    uploaded=uploaded,
+                                                                    avg_upspeed=avg_upspeed)
+                if need_delete:
+                    log_info("【Brush】%s 做种达到删种条件：%s，删除任务..." % (torrent.name, delete_type.value))
+                    if sendmessage:
+                        msg_title = "【刷流任务 {} 删除做种】".format(task_name)
+                        msg_text = "删除原因：{}\n种子名称：{}".format(delete_type.value, torrent.name)
+                        self.message.sendmsg(title=msg_title, text=msg_text)
+
+                    if torrent_id not in delete_ids:
+                        delete_ids.append(torrent_id)
+                        update_torrents.append(("%s,%s" % (uploaded, downloaded), taskid, torrent_id))
+            # 检查下载状态
+            torrents = [torrent for torrent in task_torrents
+                        if torrent.status in ["downloading", "download_pending", "stopped"]]
+            for torrent in torrents:
+                # ID
+                torrent_id = torrent.id
+                # 下载耗时
+                dltime = (datetime.now().astimezone() - torrent.date_added).seconds
+                # 下载量
+                downloaded = int(torrent.total_size * torrent.progress / 100)
+                total_downloaded += downloaded
+                # 上传量
+                uploaded = int(downloaded * torrent.ratio)
+                total_uploaded += uploaded
+                # 平均上传速度
+                avg_upspeed = int(uploaded / dltime)
+                need_delete, delete_type = self.__check_remove_rule(remove_rule=remove_rule,
+                                                                    dltime=dltime,
+                                                                    avg_upspeed=avg_upspeed)
+                if need_delete:
+                    log_info("【Brush】%s 达到删种条件：%s，删除下载任务..." % (torrent.name, delete_type.value))
+                    if sendmessage:
+                        msg_title = "【刷流任务 {} 删除做种】".format(task_name)
+                        msg_text = "删除原因：{}\n种子名称：{}".format(delete_type.value, torrent.name)
+                        self.message.sendmsg(title=msg_title, text=msg_text)
+
+                    if torrent_id not in delete_ids:
+                        delete_ids.append(torrent_id)
+                        update_torrents.append(("%s,%s" % (uploaded, downloaded), taskid, torrent_id))
+        # 手工删除的种子，清除对应记录
+        if remove_torrent_ids:
+            log_info("【Brush】任务 %s 的这些下载任务在下载器中不存在，将删除任务记录：%s" % (task_name, remove_torrent_ids))
+            for remove_torrent_id in remove_torrent_ids:
+                SqlHelper.delete_brushtask_torrent(taskid, remove_torrent_id)
+        # 更新种子状态为已删除
+        SqlHelper.update_brushtask_torrent_state(update_torrents)
+        # 删除下载器种子
+        if delete_ids:
+            downloader.delete_torrents(delete_file=True, ids=delete_ids)
+            log_info("【Brush】任务 %s 共删除 %s 个刷流下载任务" % (task_name, len(delete_ids)))
+        else:
+            log_info("【Brush】任务 %s 本次检查未删除下载任务" % task_name)
+        # 更新上传下载量和删除种子数
+        SqlHelper.add_brushtask_upload_count(brush_id=taskid,
+                                             upload_size=total_uploaded,
+                                             download_size=total_downloaded,
+                                             remove_count=len(delete_ids) + len(remove_torrent_ids))
+
+    @staticmethod
+    def __is_qb_completed(torrent):
+        """
+        判断qbittorrent种子是否已下载完成
+        """
+        if torrent.get("amount_left") is not None:
+            return torrent.get("amount_left") == 0
+        return (torrent.get("progress") or 0) >= 1
+
+    def __get_downloader(self, downloadercfg):
+        """
+        获取下载器客户端，同一下载器复用已登录的会话，下载器配置变化时重新连接
+        """
+        with lock:
+            downloader_info = self._downloaders.get(downloadercfg.get("id"))
+            if downloader_info and downloader_info[0] == downloadercfg:
+                return downloader_info[1]
+            if downloadercfg.get("type") == self._qb_client:
+                downloader = Qbittorrent(user_config=downloadercfg)
+                connected = downloader.qbc is not None
+            else:
+                downloader = Transmission(user_config=downloadercfg)
+                connected = downloader.trc is not None
+            if connected:
+                self._downloaders[downloadercfg.get("id")] = (dict(downloadercfg), downloader)
+            return downloader
+
+    def __reset_downloader(self, downloadercfg):
+        """
+        下载器请求出错时丢弃已缓存的客户端，下次使用时重新登录
+        """
+        with lock:
+            self._downloaders.pop(downloadercfg.get("id"), None)
 
     def __is_allow_new_torrent(self, taskid, taskname, downloadercfg, seedsize, dlcount):
         """
@@ -465,20 +540,17 @@ class BrushTask(object):
         """
         if not downloadercfg:
             return 0
+        downloader = self.__get_downloader(downloadercfg)
         if downloadercfg.get("type") == self._qb_client:
-            downloader = Qbittorrent(user_config=downloadercfg)
             if not downloader.qbc:
                 return None
-            dlitems = downloader.get_downloading_torrents()
-            if dlitems is not None:
-                return int(len(dlitems))
         else:
-            downloader = Transmission(user_config=downloadercfg)
             if not downloader.trc:
                 return None
-            dlitems = downloader.get_downloading_torrents()
-            if dlitems is not None:
-                return int(len(dlitems))
+        dlitems = downloader.get_downloading_torrents()
+        if dlitems is not None:
+            return int(len(dlitems))
+        self.__reset_downloader(downloadercfg)
         return None
 
     def __download_torrent(self,
@@ -516,7 +588,7 @@ class BrushTask(object):
         # 添加下载
         if downloadercfg.get("type") == self._qb_client:
             # 初始化下载器
-            downloader = Qbittorrent(user_config=downloadercfg)
+            downloader = self.__get_downloader(downloadercfg)
             if not downloader.qbc:
                 log_error("【Brush】任务 %s 下载器 %s 无法连接" % (taskname, downloadercfg.get("name")))
                 return False
@@ -546,7 +618,7 @@ class BrushTask(object):
                         break
         else:
             # 初始化下载器
-            downloader = Transmission(user_config=downloadercfg)
+            downloader = self.__get_downloader(downloadercfg)
             if not downloader.trc:
                 log_error("【Brush】任务 %s 下载器 %s 无法连接" % (taskname, downloadercfg.get("name")))
                 return False
@@ -561,6 +633,7 @@ class BrushTask(object):
                 if download_id and tag:
                     downloader.set_torrent_tag(tid=download_id, tag=tag)
         if not download_id:
+            self.__reset_downloader(downloadercfg)
             log_warn("【Brush】%s 添加下载任务出错，可能原因：Cookie过期/任务已存在/触发了站点首次种子下载" % title)
             return False
         else:
@@ -1,2 +1,3 @@
 from .main_db import MainDb
 from .media_db import MediaDb
+from .meta_db import MetaDb
@@ -2,14 +2,28 @@
 
 import sqlite3
 import threading
-from queue import Empty, Queue
+from queue import Empty, Full, Queue
 import log
 
 
 class SQLit3PoolConnection:
+    # 连接初始化参数：WAL模式下读写互不阻塞，synchronous=NORMAL在WAL下仍可保证一致性
+    PRAGMAS = [
+        "PRAGMA journal_mode=WAL",
+        "PRAGMA synchronous=NORMAL",
+        # 页缓存16MB
+        "PRAGMA cache_size=-16000",
+        # 内存映射256MB
+        "PRAGMA mmap_size=268435456",
+        "PRAGMA temp_store=MEMORY"
+    ]
+
     @staticmethod
     def create_conn(**config):
-        return sqlite3.connect(**config)
+        conn = sqlite3.connect(**config)
+        for pragma in SQLit3PoolConnection.PRAGMAS:
+            conn.execute(pragma)
+        return conn
 
 
 dbcs = {
@@ -19,20 +33,26 @@ dbcs = {
 
 class DBPool(object):
     """
-    数据库连接池
+    数据库连接池，连接数不超过max_active，连接复用以便复用连接上缓存的预编译语句
     """
 
     def __init__(self, max_active=5, max_wait=10, init_size=0, db_type="SQLite3", **config):
         self.__free_conns = Queue(max_active)
+        self.max_active = max_active
         self.max_wait = max_wait
         self.db_type = db_type
         self.config = config
+        # 已创建的连接数
+        self.__active_count = 0
         self.__lock = threading.Lock()
         if init_size > max_active:
             init_size = max_active
         for i in range(init_size):
             log.debug("【Db】初始化数据库连接%s" % str(i))
-            self.free(self._create_conn())
+            conn = self._create_conn()
+            if conn:
+                self.__active_count += 1
+                self.free(conn)
 
     def __del__(self):
         print("__del__ Pool..")
@@ -46,8 +66,9 @@ class DBPool(object):
         self.__lock.acquire()
         while self.__free_conns and not self.__free_conns.empty():
             try:
-                con = self.__free_conns.get()
+                con = self.__free_conns.get_nowait()
                 con.close()
+                self.__active_count -= 1
             except Empty:
                 break
         self.__free_conns = None
@@ -63,27 +84,36 @@ class DBPool(object):
 
     def get(self, timeout=None):
         """
-        获取一个连接
+        获取一个连接，没有空闲连接且连接数已达上限时等待其它线程归还
         @param timeout:超时时间
         """
         log.debug("【Db】获取连接...")
-        conn = None
         if timeout is None:
             timeout = self.max_wait
         try:
-            self.__lock.acquire()
-            if self.__free_conns.empty():  # 如果容器是空的，直接创建一个连接
-                conn = self._create_conn()
-            else:
-                try:
-                    conn = self.__free_conns.get(timeout=timeout)
-                except Exception as err:
-                    # 此处应该考虑获取不到连接处理事务问题, 此处先打印
-                    # to do
-                    log.warn("【Db】获取连接失败: %s" % str(err))
-            return conn
-        finally:
-            self.__lock.release()
+            return self.__free_conns.get_nowait()
+        except Empty:
+            pass
+        # 连接数未达上限，直接创建一个连接
+        with self.__lock:
+            create_flag = self.__active_count < self.max_active
+            if create_flag:
+                self.__active_count += 1
+        if create_flag:
+            try:
+                return self._create_conn()
+            except Exception as err:
+                with self.__lock:
+                    self.__active_count -= 1
+                log.error("【Db】创建连接失败: %s" % str(err))
+                return None
+        # 等待空闲连接，不持有锁以免阻塞归还
+        try:
+            return self.__free_conns.get(timeout=timeout)
+        except Empty as err:
+            # 此处应该考虑获取不到连接处理事务问题, 此处先打印
+            log.warn("【Db】获取连接失败: 等待%s秒无空闲连接 %s" % (timeout, str(err)))
+            return None
 
     def free(self, conn):
         """
@@ -93,16 +123,10 @@ class DBPool(object):
         if conn is None:
             return
         try:
-            self.__lock.acquire()
-            if self.__free_conns.full():  # 如果当前连接池已满，直接关闭连接
-                conn.close()
-                log.debug("【Db】关闭连接")
-                return
-            try:
-                log.debug("【Db】回收连接")
-                self.__free_conns.put_nowait(conn)
-            except Exception as err:
-                log.error("【WARN】当前线程池已满，无法放回, 直接释放！%s" % str(err))
-                conn.close()
-        finally:
-            self.__lock.release()
+            log.debug("【Db】回收连接")
+            self.__free_conns.put_nowait(conn)
+        except (Full, AttributeError) as err:
+            log.error("【WARN】当前线程池已满，无法放回, 直接释放！%s" % str(err))
+            with self.__lock:
+                self.__active_count -= 1
+            conn.close()
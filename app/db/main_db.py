@@ -1,5 +1,6 @@
 import os
 import threading
+from contextlib import contextmanager
 
 import log
 from config import Config
@@ -7,7 +8,15 @@ from app.utils.commons import singleton
 from app.db.db_pool import DBPool
 from app.utils import PathUtils
 
-lock = threading.Lock()
+# 写锁，SQLite同一时间只允许一个写事务，读操作在WAL模式下无需加锁
+lock = threading.RLock()
+
+
+class Transaction:
+    """
+    事务执行结果，退出事务后success表示是否已提交
+    """
+    success = True
 
 
 @singleton
@@ -15,8 +24,11 @@ class MainDb:
     __connection = None
     __db_path = None
     __pools = None
+    # 当前线程的事务上下文
+    __local = None
 
     def __init__(self):
+        self.__local = threading.local()
         self.init_config()
         self.__init_tables()
         self.__cleardata()
@@ -30,7 +42,7 @@ class MainDb:
         self.__db_path = os.path.join(config.get_config_path(), 'user.db')
         self.__pools = DBPool(
             max_active=5, max_wait=20, init_size=5, db_type="SQLite3",
-            **{'database': self.__db_path, 'check_same_thread': False, 'timeout': 15})
+            **{'database': self.__db_path, 'check_same_thread': False, 'timeout': 15, 'cached_statements': 256})
 
     def __init_tables(self):
         conn = self.__pools.get()
@@ -317,6 +329,14 @@ class MainDb:
                                    LST_MOD_DATE     TEXT);''')
             cursor.execute(
                 '''CREATE INDEX IF NOT EXISTS INDX_SITE_BRUSH_TORRENTS_TASKID ON SITE_BRUSH_TORRENTS (TASK_ID);''')
+            # 刷流任务已处理过的RSS种子
+            cursor.execute('''CREATE TABLE IF NOT EXISTS SITE_BRUSH_RSS_SEEN
+                                   (TASK_ID    TEXT     NOT NULL,
+                                   ENCLOSURE    TEXT     NOT NULL,
+                                   SEEN_TIME    INTEGER,
+                                   PRIMARY KEY (TASK_ID, ENCLOSURE));''')
+            cursor.execute(
+                '''CREATE INDEX IF NOT EXISTS INDX_SITE_BRUSH_RSS_SEEN_TIME ON SITE_BRUSH_RSS_SEEN (TASK_ID, SEEN_TIME);''')
             # 自定义下载器表
             cursor.execute('''CREATE TABLE IF NOT EXISTS SITE_BRUSH_DOWNLOADERS
                                    (ID INTEGER PRIMARY KEY AUTOINCREMENT     NOT NULL,
@@ -437,37 +457,52 @@ class MainDb:
             config['app']['init_files'] = init_files
             Config().save_config(config)
 
+    def __get_transaction_conn(self):
+        """
+        获取当前线程事务中的连接，不在事务中时返回None
+        """
+        return getattr(self.__local, "conn", None)
+
     def __excute(self, sql, data=None):
         if not sql:
             return False
-        with lock:
-            conn = self.__pools.get()
+        if data:
+            return self.__write(sql, lambda cursor: cursor.execute(sql, data), data)
+        return self.__write(sql, lambda cursor: cursor.execute(sql))
+
+    def __excute_many(self, sql, data_list):
+        if not sql or not data_list:
+            return False
+        return self.__write(sql, lambda cursor: cursor.executemany(sql, data_list))
+
+    def __write(self, sql, func, data=None):
+        """
+        执行写操作，在事务中时不单独提交
+        """
+        conn = self.__get_transaction_conn()
+        if conn:
             cursor = conn.cursor()
             try:
-                if data:
-                    cursor.execute(sql, data)
-                else:
-                    cursor.execute(sql)
-                conn.commit()
+                func(cursor)
             except Exception as e:
                 log.error(f"【Db】执行SQL出错：sql:{sql}; parameters:{data}; {e}")
+                self.__local.failed = True
                 return False
             finally:
                 cursor.close()
-                self.__pools.free(conn)
             return True
-
-    def __excute_many(self, sql, data_list):
-        if not sql or not data_list:
-            return False
         with lock:
             conn = self.__pools.get()
+            if not conn:
+                log.error(f"【Db】获取数据库连接失败，SQL未执行：sql:{sql}; parameters:{data}")
+                return False
             cursor = conn.cursor()
             try:
-                cursor.executemany(sql, data_list)
+                func(cursor)
                 conn.commit()
             except Exception as e:
-                log.error(f"【Db】执行SQL出错：sql:{sql}; {e}")
+                log.error(f"【Db】执行SQL出错：sql:{sql}; parameters:{data}; {e}")
+                conn.rollback()
                 return False
             finally:
                 cursor.close()
@@ -477,22 +512,62 @@ class MainDb:
     def __select(self, sql, data):
         if not sql:
             return False
+        conn = self.__get_transaction_conn()
+        in_transaction = conn is not None
+        if not in_transaction:
+            conn = self.__pools.get()
+            if not conn:
+                log.error(f"【Db】获取数据库连接失败，SQL未执行：sql:{sql}; parameters:{data}")
+                return []
+        cursor = conn.cursor()
+        try:
+            if data:
+                res = cursor.execute(sql, data)
+            else:
+                res = cursor.execute(sql)
+            ret = res.fetchall()
+        except Exception as e:
+            log.error(f"【Db】执行SQL出错：sql:{sql}; parameters:{data}; {e}")
+            return []
+        finally:
+            cursor.close()
+            if not in_transaction:
+                self.__pools.free(conn)
+        return ret
+
+    @contextmanager
+    def transaction(self):
+        """
+        开启事务，事务内当前线程的所有SQL使用同一连接执行，退出时统一提交，出错时回滚，可嵌套
+        :return: 事务执行结果，退出后通过success判断是否已提交，嵌套时返回外层事务的结果
+        """
+        if self.__get_transaction_conn():
+            yield self.__local.trans
+            return
         with lock:
             conn = self.__pools.get()
-            cursor = conn.cursor()
+            if not conn:
+                raise Exception("【Db】获取数据库连接失败，无法开启事务")
+            trans = Transaction()
+            self.__local.conn = conn
+            self.__local.trans = trans
+            self.__local.failed = False
             try:
-                if data:
-                    res = cursor.execute(sql, data)
+                yield trans
+                if self.__local.failed:
+                    log.warn("【Db】事务中有SQL执行失败，已回滚")
+                    conn.rollback()
+                    trans.success = False
                 else:
-                    res = cursor.execute(sql)
-                ret = res.fetchall()
-            except Exception as e:
-                log.error(f"【Db】执行SQL出错：sql:{sql}; parameters:{data}; {e}")
-                return []
+                    conn.commit()
+            except Exception:
+                conn.rollback()
+                trans.success = False
+                raise
             finally:
-                cursor.close()
+                self.__local.conn = None
+                self.__local.trans = None
                 self.__pools.free(conn)
-            return ret
 
     def select_by_sql(self, sql, data=None):
         """
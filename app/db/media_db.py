@@ -24,6 +24,11 @@ class MediaDb:
         with lock:
             cursor = self._mediadb.cursor()
             try:
+                # WAL模式下同步时不阻塞查询，批量写入时无需每条记录都同步到磁盘
+                cursor.execute('''PRAGMA journal_mode=WAL;''')
+                cursor.execute('''PRAGMA synchronous=NORMAL;''')
+                cursor.execute('''SELECT COUNT(1) FROM sqlite_master WHERE type = 'table' AND name = 'MEDIASYNC_EPISODES';''')
+                episodes_exists = cursor.fetchone()[0]
                 # 媒体库同步信息表
                 cursor.execute('''CREATE TABLE IF NOT EXISTS MEDIASYNC_STATISTICS
                                                    (ID INTEGER PRIMARY KEY AUTOINCREMENT     NOT NULL,
@@ -56,6 +61,39 @@ class MediaDb:
                     '''CREATE INDEX IF NOT EXISTS INDX_MEDIASYNC_ITEMS_OT ON MEDIASYNC_ITEMS (ORGIN_TITLE);''')
                 cursor.execute('''CREATE INDEX IF NOT EXISTS INDX_MEDIASYNC_ITEMS_TI ON MEDIASYNC_ITEMS (TMDBID);''')
                 cursor.execute('''CREATE INDEX IF NOT EXISTS INDX_MEDIASYNC_ITEMS_II ON MEDIASYNC_ITEMS (ITEM_ID);''')
+                # 全量同步时的临时表，同步完成后一次性替换媒体数据表
+                cursor.execute('''CREATE TABLE IF NOT EXISTS MEDIASYNC_ITEMS_STAGING
+                                                                   (SERVER   TEXT,
+                                                                   LIBRARY    TEXT,
+                                                                   ITEM_ID  TEXT,
+                                                                   ITEM_TYPE    TEXT,
+                                                                   TITLE    TEXT,
+                                                                   ORGIN_TITLE     TEXT,
+                                                                   YEAR     TEXT,
+                                                                   TMDBID     TEXT,
+                                                                   IMDBID     TEXT,
+                                                                   PATH     TEXT,
+                                                                   NOTE     TEXT,
+                                                                   JSON     TEXT);''')
+                # 剧集索引：剧集TMDBID、季、集
+                cursor.execute('''CREATE TABLE IF NOT EXISTS MEDIASYNC_EPISODES
+                                                   (SERVER   TEXT,
+                                                   TMDBID    TEXT,
+                                                   SEASON    INTEGER,
+                                                   EPISODE    INTEGER,
+                                                   ITEM_ID    TEXT);''')
+                cursor.execute(
+                    '''CREATE UNIQUE INDEX IF NOT EXISTS INDX_MEDIASYNC_EPISODES_TSE ON MEDIASYNC_EPISODES (SERVER, TMDBID, SEASON, EPISODE);''')
+                cursor.execute('''CREATE INDEX IF NOT EXISTS INDX_MEDIASYNC_EPISODES_II ON MEDIASYNC_EPISODES (ITEM_ID);''')
+                cursor.execute('''CREATE TABLE IF NOT EXISTS MEDIASYNC_EPISODES_STAGING
+                                                   (SERVER   TEXT,
+                                                   TMDBID    TEXT,
+                                                   SEASON    INTEGER,
+                                                   EPISODE    INTEGER,
+                                                   ITEM_ID    TEXT);''')
+                # 剧集索引为新建时，已有的同步数据不含剧集，清除同步记录使下次同步按全量进行
+                if not episodes_exists:
+                    cursor.execute('''DELETE FROM MEDIASYNC_STATISTICS;''')
                 self._mediadb.commit()
             except Exception as e:
                 log.error(f"【Db】创建数据库错误：{e}")
@@ -80,6 +118,30 @@ class MediaDb:
                 cursor.close()
             return True
 
+    def __excute_batch(self, sqls):
+        """
+        在一个事务中执行多条语句
+        :param sqls: [(sql, 数据列表或None)]，数据列表不为空时按executemany执行
+        """
+        if not sqls:
+            return False
+        with lock:
+            cursor = self._mediadb.cursor()
+            try:
+                for sql, data in sqls:
+                    if data:
+                        cursor.executemany(sql, data)
+                    else:
+                        cursor.execute(sql)
+                self._mediadb.commit()
+            except Exception as e:
+                print(str(e))
+                self._mediadb.rollback()
+                return False
+            finally:
+                cursor.close()
+            return True
+
     def __select(self, sql, data):
         if not sql:
             return False
@@ -118,6 +180,148 @@ class MediaDb:
                               iteminfo.get("json")
                               ))
 
+    @staticmethod
+    def __episode_values(server_type, episode):
+        return (server_type,
+                str(episode.get("tmdbid")),
+                int(episode.get("season")),
+                int(episode.get("episode")),
+                episode.get("id"))
+
+    @staticmethod
+    def __item_values(server_type, iteminfo):
+        return (server_type,
+                iteminfo.get("library"),
+                iteminfo.get("id"),
+                iteminfo.get("type"),
+                iteminfo.get("title"),
+                iteminfo.get("originalTitle"),
+                iteminfo.get("year"),
+                iteminfo.get("tmdbid"),
+                iteminfo.get("imdbid"),
+                iteminfo.get("path"),
+                iteminfo.get("json"))
+
+    def begin_staging(self):
+        """
+        开始全量同步，清空临时表
+        """
+        return self.__excute_batch([("DELETE FROM MEDIASYNC_ITEMS_STAGING", None),
+                                    ("DELETE FROM MEDIASYNC_EPISODES_STAGING", None)])
+
+    def insert_staging(self, server_type, items):
+        """
+        批量写入临时表
+        """
+        if not server_type or not items:
+            return False
+        return self.__excute_batch([("INSERT INTO MEDIASYNC_ITEMS_STAGING "
+                                     "(SERVER, LIBRARY, ITEM_ID, ITEM_TYPE, TITLE, ORGIN_TITLE, YEAR, TMDBID, IMDBID, PATH, JSON) "
+                                     "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                     [self.__item_values(server_type, item) for item in items])])
+
+    def insert_staging_episodes(self, server_type, episodes):
+        """
+        批量写入剧集临时表
+        """
+        if not server_type or not episodes:
+            return False
+        return self.__excute_batch([("INSERT OR REPLACE INTO MEDIASYNC_EPISODES_STAGING "
+                                     "(SERVER, TMDBID, SEASON, EPISODE, ITEM_ID) VALUES (?, ?, ?, ?, ?)",
+                                     [self.__episode_values(server_type, episode) for episode in episodes])])
+
+    def commit_staging(self):
+        """
+        全量同步完成，在一个事务中用临时表替换媒体数据，查询时不会看到中间状态
+        """
+        return self.__excute_batch([("DELETE FROM MEDIASYNC_ITEMS", None),
+                                    ("INSERT INTO MEDIASYNC_ITEMS "
+                                     "(SERVER, LIBRARY, ITEM_ID, ITEM_TYPE, TITLE, ORGIN_TITLE, YEAR, TMDBID, IMDBID, PATH, JSON) "
+                                     "SELECT SERVER, LIBRARY, ITEM_ID, ITEM_TYPE, TITLE, ORGIN_TITLE, YEAR, TMDBID, IMDBID, PATH, JSON "
+                                     "FROM MEDIASYNC_ITEMS_STAGING", None),
+                                    ("DELETE FROM MEDIASYNC_ITEMS_STAGING", None),
+                                    ("DELETE FROM MEDIASYNC_EPISODES", None),
+                                    ("INSERT OR REPLACE INTO MEDIASYNC_EPISODES "
+                                     "(SERVER, TMDBID, SEASON, EPISODE, ITEM_ID) "
+                                     "SELECT SERVER, TMDBID, SEASON, EPISODE, ITEM_ID "
+                                     "FROM MEDIASYNC_EPISODES_STAGING", None),
+                                    ("DELETE FROM MEDIASYNC_EPISODES_STAGING", None)])
+
+    def upsert(self, server_type, items):
+        """
+        增量同步，批量新增或更新媒体数据
+        """
+        if not server_type or not items:
+            return False
+        return self.__excute_batch([("DELETE FROM MEDIASYNC_ITEMS WHERE SERVER = ? AND ITEM_ID = ?",
+                                     [(server_type, item.get("id")) for item in items]),
+                                    ("INSERT INTO MEDIASYNC_ITEMS "
+                                     "(SERVER, LIBRARY, ITEM_ID, ITEM_TYPE, TITLE, ORGIN_TITLE, YEAR, TMDBID, IMDBID, PATH, JSON) "
+                                     "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                     [self.__item_values(server_type, item) for item in items])])
+
+    def upsert_episodes(self, server_type, episodes):
+        """
+        批量新增或更新剧集索引
+        :param episodes: [{id, tmdbid, season, episode}]
+        """
+        if not server_type or not episodes:
+            return False
+        return self.__excute_batch([("INSERT OR REPLACE INTO MEDIASYNC_EPISODES "
+                                     "(SERVER, TMDBID, SEASON, EPISODE, ITEM_ID) VALUES (?, ?, ?, ?, ?)",
+                                     [self.__episode_values(server_type, episode) for episode in episodes])])
+
+    def delete_episodes(self, server_type, itemid=None, tmdbid=None):
+        """
+        按剧集项目ID或剧集TMDBID删除剧集索引
+        """
+        if not server_type:
+            return False
+        if tmdbid:
+            return self.__excute("DELETE FROM MEDIASYNC_EPISODES WHERE SERVER = ? AND TMDBID = ?",
+                                 (server_type, str(tmdbid)))
+        if itemid:
+            return self.__excute("DELETE FROM MEDIASYNC_EPISODES WHERE SERVER = ? AND ITEM_ID = ?",
+                                 (server_type, itemid))
+        return False
+
+    def get_episodes(self, server_type, tmdbid):
+        """
+        查询剧集索引中某剧集已有的季集
+        :return: {季: [集]}，索引中没有该剧集时为空
+        """
+        if not server_type or not tmdbid:
+            return {}
+        ret = self.__select("SELECT SEASON, EPISODE FROM MEDIASYNC_EPISODES WHERE SERVER = ? AND TMDBID = ?",
+                            (server_type, str(tmdbid)))
+        episodes = {}
+        for season, episode in ret or []:
+            episodes.setdefault(season, []).append(episode)
+        return episodes
+
+    def get_item(self, server_type, itemid):
+        """
+        按项目ID查询已同步的媒体
+        :return: ITEM_TYPE, TMDBID
+        """
+        if not server_type or not itemid:
+            return None
+        ret = self.__select("SELECT ITEM_TYPE, TMDBID FROM MEDIASYNC_ITEMS WHERE SERVER = ? AND ITEM_ID = ?",
+                            (server_type, itemid))
+        return ret[0] if ret else None
+
+    def get_counts(self, server_type):
+        """
+        统计已同步的媒体数量
+        :return: 总数，电影数，电视剧数
+        """
+        ret = self.__select("SELECT ITEM_TYPE, COUNT(1) FROM MEDIASYNC_ITEMS WHERE SERVER = ? GROUP BY ITEM_TYPE",
+                            (server_type,))
+        counts = {item[0]: item[1] for item in ret or []}
+        return sum(counts.values()), \
+            counts.get("Movie", 0) + counts.get("movie", 0), \
+            counts.get("Series", 0) + counts.get("show", 0)
+
     def delete(self, server_type, itemid):
         if not server_type or not itemid:
             return False
@@ -129,9 +333,14 @@ class MediaDb:
             return self.__excute("DELETE FROM MEDIASYNC_ITEMS WHERE SERVER = ? AND LIBRARY = ?",
                                  (server_type, library))
         else:
-            return self.__excute("DELETE FROM MEDIASYNC_ITEMS")
+            return self.__excute_batch([("DELETE FROM MEDIASYNC_ITEMS", None),
+                                        ("DELETE FROM MEDIASYNC_EPISODES", None)])
 
-    def statistics(self, server_type, total_count, movie_count, tv_count):
+    def statistics(self, server_type, total_count, movie_count, tv_count, update_time=None):
+        """
+        登记同步情况
+        :param update_time: 同步时间戳，为空时为当前时间，增量同步时从该时间开始获取变化的数据
+        """
         if not server_type:
             return False
         self.__excute("DELETE FROM MEDIASYNC_STATISTICS WHERE SERVER = ?", (server_type,))
@@ -142,7 +351,7 @@ class MediaDb:
                                                         movie_count,
                                                         tv_count,
                                                         time.strftime('%Y-%m-%d %H:%M:%S',
-                                                                      time.localtime(time.time()))))
+                                                                      time.localtime(update_time or time.time()))))
 
     def exists(self, server_type, title, year, tmdbid):
         if not server_type or not title:
@@ -162,6 +371,19 @@ class MediaDb:
                 return True
         return False
 
+    def get_sync_time(self, server_type):
+        """
+        获取上次同步的时间戳，未同步过时返回None
+        """
+        ret = self.get_statistics(server_type)
+        if not ret or not ret[0][3]:
+            return None
+        try:
+            return time.mktime(time.strptime(ret[0][3], '%Y-%m-%d %H:%M:%S'))
+        except Exception as e:
+            print(str(e))
+            return None
+
     def get_statistics(self, server_type):
         if not server_type:
             return None
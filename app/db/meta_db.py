@@ -0,0 +1,167 @@
+import os
+import pickle
+import re
+import sqlite3
+import threading
+
+import log
+from app.utils.commons import singleton
+from config import Config
+
+lock = threading.Lock()
+
+
+@singleton
+class MetaDb:
+    _db_path = None
+    _metadb = None
+
+    def __init__(self):
+        self._db_path = os.path.join(Config().get_config_path(), 'meta.db')
+        self._metadb = sqlite3.connect(database=self._db_path, timeout=5, check_same_thread=False)
+        self.__init_tables()
+
+    def __init_tables(self):
+        with lock:
+            cursor = self._metadb.cursor()
+            try:
+                # WAL模式下读写互不阻塞，批量写入时无需每条记录都同步到磁盘
+                cursor.execute('''PRAGMA journal_mode=WAL;''')
+                cursor.execute('''PRAGMA synchronous=NORMAL;''')
+                # TMDB缓存表
+                cursor.execute('''CREATE TABLE IF NOT EXISTS TMDB_CACHE
+                                                   (CACHE_KEY TEXT PRIMARY KEY     NOT NULL,
+                                                   TMDBID    TEXT,
+                                                   TITLE    TEXT,
+                                                   EXPIRE_TIME    INTEGER,
+                                                   DATA    BLOB);''')
+                cursor.execute('''CREATE INDEX IF NOT EXISTS INDX_TMDB_CACHE_EXPIRE ON TMDB_CACHE (EXPIRE_TIME);''')
+                # 标题按前缀检索，索引不区分大小写以便LIKE使用索引
+                cursor.execute('''DROP INDEX IF EXISTS INDX_TMDB_CACHE_TITLE;''')
+                cursor.execute('''CREATE INDEX IF NOT EXISTS INDX_TMDB_CACHE_TITLE_NOCASE
+                                  ON TMDB_CACHE (TITLE COLLATE NOCASE);''')
+                cursor.execute('''CREATE INDEX IF NOT EXISTS INDX_TMDB_CACHE_TMDBID ON TMDB_CACHE (TMDBID);''')
+                self._metadb.commit()
+            except Exception as e:
+                log.error(f"【Db】创建数据库错误：{e}")
+            finally:
+                cursor.close()
+
+    def __excute(self, sql, data=None, many=False):
+        if not sql:
+            return False
+        with lock:
+            cursor = self._metadb.cursor()
+            try:
+                if many:
+                    cursor.executemany(sql, data)
+                elif data:
+                    cursor.execute(sql, data)
+                else:
+                    cursor.execute(sql)
+                self._metadb.commit()
+            except Exception as e:
+                print(str(e))
+                return False
+            finally:
+                cursor.close()
+            return True
+
+    def __select(self, sql, data=None):
+        if not sql:
+            return []
+        with lock:
+            cursor = self._metadb.cursor()
+            try:
+                if data:
+                    res = cursor.execute(sql, data)
+                else:
+                    res = cursor.execute(sql)
+                ret = res.fetchall()
+            except Exception as e:
+                print(str(e))
+                return []
+            finally:
+                cursor.close()
+            return ret
+
+    def get_db_path(self):
+        return self._db_path
+
+    def is_empty(self):
+        ret = self.__select("SELECT 1 FROM TMDB_CACHE LIMIT 1")
+        return not ret
+
+    def get(self, key):
+        """
+        查询单条缓存，不存在时返回None
+        """
+        if not key:
+            return None
+        ret = self.__select("SELECT DATA FROM TMDB_CACHE WHERE CACHE_KEY = ?", (key,))
+        if not ret:
+            return None
+        try:
+            return pickle.loads(ret[0][0])
+        except Exception as e:
+            print(str(e))
+            return None
+
+    def upsert(self, items):
+        """
+        批量新增或更新缓存
+        :param items: [(key, tmdbid, title, expire_time, data)]
+        """
+        if not items:
+            return True
+        return self.__excute("INSERT INTO TMDB_CACHE (CACHE_KEY, TMDBID, TITLE, EXPIRE_TIME, DATA) "
+                             "VALUES (?, ?, ?, ?, ?) "
+                             "ON CONFLICT(CACHE_KEY) DO UPDATE SET "
+                             "TMDBID = excluded.TMDBID, "
+                             "TITLE = excluded.TITLE, "
+                             "EXPIRE_TIME = excluded.EXPIRE_TIME, "
+                             "DATA = excluded.DATA",
+                             [(key, tmdbid, title, expire_time, pickle.dumps(data, pickle.HIGHEST_PROTOCOL))
+                              for key, tmdbid, title, expire_time, data in items],
+                             many=True)
+
+    def delete(self, keys):
+        if not keys:
+            return True
+        return self.__excute("DELETE FROM TMDB_CACHE WHERE CACHE_KEY = ?", [(key,) for key in keys], many=True)
+
+    def delete_by_tmdbid(self, tmdbid):
+        return self.__excute("DELETE FROM TMDB_CACHE WHERE TMDBID = ?", (str(tmdbid),))
+
+    def empty(self):
+        return self.__excute("DELETE FROM TMDB_CACHE")
+
+    def get_expired_keys(self, timestamp, limit=500):
+        """
+        按过期时间索引查询已过期的缓存，每次只取一批以便增量清理
+        """
+        return [item[0] for item in self.__select("SELECT CACHE_KEY FROM TMDB_CACHE "
+                                                  "WHERE EXPIRE_TIME < ? "
+                                                  "ORDER BY EXPIRE_TIME LIMIT ?", (timestamp, limit))]
+
+    def search(self, title, offset, limit):
+        """
+        按标题前缀分页检索缓存，前缀匹配可以使用标题索引
+        :return: 总数, [(key, data)]
+        """
+        if title:
+            condition = "WHERE TMDBID != '0' AND TITLE LIKE ? ESCAPE '\\'"
+            params = ("%s%%" % re.sub(r"([\\%_])", r"\\\1", title),)
+        else:
+            condition = "WHERE TMDBID != '0'"
+            params = ()
+        count = self.__select("SELECT COUNT(1) FROM TMDB_CACHE %s" % condition, params)
+        rows = self.__select("SELECT CACHE_KEY, DATA FROM TMDB_CACHE %s "
+                             "ORDER BY TITLE COLLATE NOCASE LIMIT ? OFFSET ?" % condition, params + (limit, offset))
+        ret = []
+        for key, data in rows:
+            try:
+                ret.append((key, pickle.loads(data)))
+            except Exception as e:
+                print(str(e))
+        return count[0][0] if count else 0, ret
@@ -3,7 +3,7 @@ from threading import Lock
 from time import sleep
 
 import log
-from app.helper import SqlHelper
+from app.helper import SqlHelper, TorrentHelper
 from app.media import MetaInfo, Media
 from config import Config, PT_TAG, RMT_MEDIAEXT
 from app.message import Message
@@ -107,6 +107,7 @@ class Downloader:
         :param download_limit: 下载限速 Kb/s
         :param ratio_limit: 分享率限制
         :param seeding_time_limit: 做种时间限制 分钟
+        :return: 下载器返回结果（qbittorrent能计算出InfoHash时返回种子Hash），错误信息
         """
         if not self.client:
             return None, "下载器初始化失败"
@@ -156,7 +157,7 @@ class Downloader:
                     if not url:
                         return None, "%s 转换磁力链失败" % url
             # 下载种子文件
-            content, retmsg = Torrent.get_torrent_content(url=url, cookie=cookie, ua=ua)
+            content, retmsg = TorrentHelper().get_torrent_content(url=url, cookie=cookie, ua=ua)
             if not content:
                 return None, retmsg
         else:
@@ -211,6 +212,9 @@ class Downloader:
                                               download_dir=download_dir,
                                               category=category)
             if ret:
+                # qbittorrent添加接口不返回任务信息，在本地计算出种子Hash返回
+                if self._client_type == DownloaderType.QB:
+                    ret = Torrent.get_infohash(content) or ret
                 # 登记下载历史
                 SqlHelper.insert_download_history(media_info)
                 return ret, ""
@@ -510,22 +514,24 @@ class Downloader:
                             if self._client_type == DownloaderType.TR:
                                 if ret:
                                     torrent_id = ret.id
+                            elif isinstance(ret, str):
+                                # 已在本地计算出种子Hash，无需等待查询
+                                torrent_id = ret
                             else:
                                 # QB添加下载后需要时间，重试5次每次等待5秒
                                 for i in range(1, 6):
                                     sleep(5)
                                     torrent_id = self.client.get_last_add_torrentid_by_tag(torrent_tag,
                                                                                            status=["paused"])
-                                    if torrent_id is None:
-                                        continue
-                                    else:
-                                        self.client.remove_torrents_tag(torrent_id, torrent_tag)
+                                    if torrent_id is not None:
                                         break
                             if not torrent_id:
                                 log.error("【Downloader】获取下载器添加的任务信息出错：%s，Tag=%s" % (item.org_string, torrent_tag))
                                 continue
                             # 设置任务只下载想要的文件
                             selected_episodes = self.set_files_status(torrent_id, need_episodes)
+                            if self._client_type == DownloaderType.QB:
+                                self.client.remove_torrents_tag(torrent_id, torrent_tag)
                             if not selected_episodes:
                                 log.info("【Downloader】种子 %s 没有需要的集，删除下载任务..." % item.org_string)
                                 self.delete_torrents(ids=torrent_id)
@@ -722,7 +728,13 @@ class Downloader:
                 self.client.set_files(file_info=files_info)
         elif self._client_type == DownloaderType.QB:
             file_ids = []
-            torrent_files = self.client.get_files(tid)
+            # 刚添加的种子需要很短的时间才会在qbittorrent中生效
+            torrent_files = None
+            for i in range(0, 10):
+                torrent_files = self.client.get_files(tid)
+                if torrent_files:
+                    break
+                sleep(0.5)
             if not torrent_files:
                 return []
             for torrent_file in torrent_files:
@@ -826,24 +838,17 @@ class Downloader:
         cookie, ua = self.sites.get_site_cookie_ua(url)
         if not cookie:
             return []
-        # 保存种子文件
-        file_path = Torrent.save_torrent_file(url=url,
-                                              cookie=cookie,
-                                              ua=ua,
-                                              path=os.path.join(Config().get_config_path(), "temp"))
-        if not file_path:
-            log.error("【Downloader】下载种子文件失败：%s" % url)
-            return []
-        # 解析种子文件
-        files = Torrent.get_torrent_files(path=file_path)
-        if not files:
-            log.error("【Downloader】解析种子文件失败：%s" % file_path)
+        # 获取种子文件清单
+        torrent_info = TorrentHelper().get_torrent_info(url=url, cookie=cookie, ua=ua)
+        if not torrent_info:
+            log.error("【Downloader】下载或解析种子文件失败：%s" % url)
             return []
         episodes = []
-        for file in files:
-            if os.path.splitext(file)[-1] not in RMT_MEDIAEXT:
+        for file in torrent_info.get("files"):
+            file_name = os.path.basename(file.get("path"))
+            if os.path.splitext(file_name)[-1] not in RMT_MEDIAEXT:
                 continue
-            meta = MetaInfo(file)
+            meta = MetaInfo(file_name)
             if not meta.begin_episode:
                 continue
             episodes = list(set(episodes).union(set(meta.get_episode_list())))
@@ -1,4 +1,5 @@
 import argparse
+import errno
 import os
 import platform
 import random
@@ -6,6 +7,8 @@ import re
 import shutil
 import subprocess
 import traceback
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from enum import Enum
 from subprocess import call
 from threading import Lock
@@ -14,7 +17,7 @@ from time import sleep
 import log
 from app.helper import SqlHelper
 from config import RMT_SUBEXT, RMT_MEDIAEXT, RMT_FAVTYPE, Config, RMT_MIN_FILESIZE, DEFAULT_MOVIE_FORMAT, \
-    DEFAULT_TV_FORMAT
+    DEFAULT_TV_FORMAT, FILE_TRANSFER_THREADS
 from app.message import Message
 from app.mediaserver import MediaServer
 from app.subtitle import Subtitle
@@ -24,6 +27,11 @@ from app.helper import ThreadHelper
 from app.utils.types import MediaType, SyncType, RmtMode, OsType, RMT_MODES
 
 lock = Lock()
+# 按路径加锁：创建目的目录时锁目录，转移文件时锁目的文件，同一目录下的不同文件可以并发转移
+# {路径: [锁, 引用数]}，引用数归零时移除
+PATH_LOCKS = {}
+# 文件转移线程池
+TRANSFER_EXECUTOR = ThreadPoolExecutor(max_workers=FILE_TRANSFER_THREADS, thread_name_prefix="transfer")
 
 
 class FileTransfer:
@@ -155,8 +163,12 @@ class FileTransfer:
         :param target_file: 目标文件路径
         :param rmt_mode: RmtMode转移方式
         """
-        try:
-            lock.acquire()
+        if rmt_mode not in [RmtMode.MINIO, RmtMode.MINIOCOPY, RmtMode.RCLONE, RmtMode.RCLONECOPY]:
+            target_dir = os.path.dirname(target_file)
+            if target_dir and not os.path.exists(target_dir):
+                with self.__path_lock(target_dir):
+                    os.makedirs(target_dir, exist_ok=True)
+        with self.__path_lock(target_file):
             if self.__system == OsType.WINDOWS:
                 if rmt_mode == RmtMode.LINK:
                     retcode = subprocess.run(['mklink', '/H', target_file, file_item], shell=True).returncode
@@ -184,21 +196,8 @@ class FileTransfer:
                 else:
                     retcode = subprocess.run(['copy', '/Y', file_item, target_file], shell=True).returncode
             else:
-                if rmt_mode == RmtMode.LINK:
-                    if platform.release().find("-z4-") >= 0:
-                        tmp = "%s/%s" % (PathUtils.get_parent_paths(target_file, 2), os.path.basename(target_file))
-                        retcode = call(["ln", file_item, tmp])
-                        if retcode == 0:
-                            retcode = call(["mv", tmp, target_file])
-                    else:
-                        retcode = call(["ln", file_item, target_file])
-                elif rmt_mode == RmtMode.SOFTLINK:
-                    retcode = call(["ln", "-s", file_item, target_file])
-                elif rmt_mode == RmtMode.MOVE:
-                    tmp_file = os.path.join(os.path.dirname(file_item), os.path.basename(target_file))
-                    retcode = call(["mv", file_item, tmp_file])
-                    if retcode == 0:
-                        retcode = call(["mv", tmp_file, target_file])
+                if rmt_mode in [RmtMode.LINK, RmtMode.SOFTLINK, RmtMode.MOVE, RmtMode.COPY]:
+                    retcode = self.__native_transfer(file_item, target_file, rmt_mode)
                 elif rmt_mode == RmtMode.MINIO or rmt_mode == RmtMode.MINIOCOPY:
                     if target_file.startswith("/") or target_file.startswith("\\"):
                         target_file = target_file[1:]
@@ -214,11 +213,82 @@ class FileTransfer:
                     else:
                         retcode = call(["rclone", "copyto", file_item, "NASTOOL:" + target_file])
                 else:
-                    retcode = call(["cp", file_item, target_file])
-        finally:
-            lock.release()
+                    retcode = self.__native_transfer(file_item, target_file, RmtMode.COPY)
         return retcode
 
+    @staticmethod
+    @contextmanager
+    def __path_lock(path):
+        """
+        对目的路径加锁，没有线程使用时释放该路径的锁
+        """
+        with lock:
+            path_lock = PATH_LOCKS.get(path)
+            if not path_lock:
+                path_lock = PATH_LOCKS[path] = [Lock(), 0]
+            path_lock[1] += 1
+        try:
+            with path_lock[0]:
+                yield
+        finally:
+            with lock:
+                path_lock[1] -= 1
+                if path_lock[1] <= 0:
+                    PATH_LOCKS.pop(path, None)
+
+    def __native_transfer(self, file_item, target_file, rmt_mode):
+        """
+        使用系统调用处理单个文件，不再为每个文件启动ln/mv/cp子进程
+        :return: 0表示成功，否则为错误码
+        """
+        try:
+            if rmt_mode == RmtMode.LINK:
+                if platform.release().find("-z4-") >= 0:
+                    tmp = "%s/%s" % (PathUtils.get_parent_paths(target_file, 2), os.path.basename(target_file))
+                    os.link(file_item, tmp)
+                    os.replace(tmp, target_file)
+                else:
+                    os.link(file_item, target_file)
+            elif rmt_mode == RmtMode.SOFTLINK:
+                os.symlink(file_item, target_file)
+            elif rmt_mode == RmtMode.MOVE:
+                try:
+                    os.replace(file_item, target_file)
+                except OSError as err:
+                    # 跨文件系统时复制后删除
+                    if err.errno != errno.EXDEV:
+                        raise
+                    shutil.move(file_item, target_file)
+            else:
+                self.__copy_file(file_item, target_file)
+        except OSError as err:
+            log.error("【RMT】%s %s 到 %s 失败：%s" % (rmt_mode.value, file_item, target_file, str(err)))
+            return err.errno or -1
+        return 0
+
+    @staticmethod
+    def __copy_file(src, dst):
+        """
+        复制文件，优先使用copy_file_range在内核中复制（同一文件系统上可能直接共享数据块），
+        不支持时使用shutil.copyfile（Linux下使用sendfile）
+        """
+        if hasattr(os, "copy_file_range"):
+            with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+                remaining = os.fstat(fsrc.fileno()).st_size
+                try:
+                    while remaining > 0:
+                        copied = os.copy_file_range(fsrc.fileno(), fdst.fileno(), min(remaining, 1024 ** 3))
+                        if copied == 0:
+                            break
+                        remaining -= copied
+                except OSError as err:
+                    if err.errno not in [errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP]:
+                        raise
+                if remaining == 0:
+                    return
+        shutil.copyfile(src, dst)
+
+
     def __transfer_subtitles(self, org_name, new_name, rmt_mode):
         """
         根据文件名转移对应字幕文件
@@ -308,6 +378,13 @@ class FileTransfer:
                 return True
         return False
 
+    def get_target_dirs(self):
+        """
+        返回所有媒体库目录及未识别目录
+        """
+        return [path for paths in [self.__tv_path, self.__movie_path, self.__anime_path, self.__unknown_path]
+                for path in paths or [] if path]
+
     def __transfer_dir_files(self, src_dir, target_dir, rmt_mode, bludir=False):
         """
         按目录结构转移所有文件
@@ -400,7 +477,6 @@ class FileTransfer:
                                           rmt_mode=rmt_mode)
         if retcode == 0:
             log.info("【RMT】文件 %s %s完成" % (file_name, rmt_mode.value))
-            SqlHelper.insert_transfer_blacklist(file_item)
         else:
             log.error("【RMT】文件 %s %s失败，错误码 %s" % (file_name, rmt_mode.value, str(retcode)))
             return retcode
@@ -409,6 +485,37 @@ class FileTransfer:
                                          new_name=new_file,
                                          rmt_mode=rmt_mode)
 
+    def __run_transfer_job(self, job, rmt_mode):
+        """
+        执行一个转移任务，返回错误码
+        """
+        try:
+            if not job.get("new_file"):
+                ret = self.__transfer_bluray_dir(job.get("file_item"), job.get("ret_dir_path"), rmt_mode)
+            else:
+                ret = self.__transfer_file(file_item=job.get("file_item"),
+                                           new_file=job.get("new_file"),
+                                           rmt_mode=rmt_mode,
+                                           over_flag=job.get("over_flag"))
+        except Exception as err:
+            log.error("【RMT】文件转移时发生错误：%s - %s" % (str(err), traceback.format_exc()))
+            return -1
+        # 移动模式随机休眠（兼容一些网盘挂载目录）
+        if rmt_mode == RmtMode.MOVE:
+            sleep(round(random.uniform(0, 1), 1))
+        return ret
+
+    def __run_transfer_jobs(self, jobs, rmt_mode):
+        """
+        并发执行转移任务，返回与任务顺序一致的错误码清单，
+        rclone/minio等网络存储按顺序执行
+        """
+        if len(jobs) <= 1 \
+                or rmt_mode in [RmtMode.RCLONE, RmtMode.RCLONECOPY, RmtMode.MINIO, RmtMode.MINIOCOPY]:
+            return [self.__run_transfer_job(job, rmt_mode) for job in jobs]
+        futures = [TRANSFER_EXECUTOR.submit(self.__run_transfer_job, job, rmt_mode) for job in jobs]
+        return [future.result() for future in futures]
+
     def transfer_media(self,
                        in_from: Enum,
                        in_path,
@@ -548,7 +655,10 @@ class FileTransfer:
         refresh_library_items = []
         # 需要下载字段的清单
         download_subtitle_items = []
-        # 处理识别后的每一个文件或单个文件夹
+        # 处理识别后的每一个文件或单个文件夹，先逐个校验并规划目的路径，再并发转移，最后按原顺序登记及通知
+        transfer_jobs = []
+        # 已规划的目的文件：{目的文件: 源文件}，避免多个源文件转移到同一目的文件
+        planned_targets = {}
         for file_item, media in Medias.items():
             try:
                 if not udf_flag:
@@ -620,7 +730,7 @@ class FileTransfer:
                 file_ext = os.path.splitext(file_item)[-1]
                 # 已存在的文件数量
                 exist_filenum = 0
-                handler_flag = False
+                over_flag = False
                 # 路径存在
                 if dir_exist_flag:
                     # 蓝光原盘
@@ -636,23 +746,8 @@ class FileTransfer:
                         if rmt_mode != RmtMode.SOFTLINK:
                             if media.size > os.path.getsize(ret_file_path) and self.__filesize_cover or udf_flag:
                                 ret_file_path = os.path.splitext(ret_file_path)[0]
-                                new_file = "%s%s" % (ret_file_path, file_ext)
-                                log.info("【RMT】文件 %s 已存在，覆盖..." % new_file)
-                                ret = self.__transfer_file(file_item=file_item,
-                                                           new_file=new_file,
-                                                           rmt_mode=rmt_mode,
-                                                           over_flag=True)
-                                if ret != 0:
-                                    success_flag = False
-                                    error_message = "文件转移失败，错误码 %s" % ret
-                                    if udf_flag:
-                                        return success_flag, error_message
-                                    failed_count += 1
-                                    alert_count += 1
-                                    if error_message not in alert_messages:
-                                        alert_messages.append(error_message)
-                                    continue
-                                handler_flag = True
+                                log.info("【RMT】文件 %s%s 已存在，覆盖..." % (ret_file_path, file_ext))
+                                over_flag = True
                             else:
                                 log.warn("【RMT】文件 %s 已存在" % ret_file_path)
                                 failed_count += 1
@@ -679,54 +774,92 @@ class FileTransfer:
                     else:
                         # 创建电录
                         log.debug("【RMT】正在创建目录：%s" % ret_dir_path)
-                        os.makedirs(ret_dir_path)
-                # 转移蓝光原盘
+                        os.makedirs(ret_dir_path, exist_ok=True)
                 if bluray_disk_dir:
-                    ret = self.__transfer_bluray_dir(file_item, ret_dir_path, rmt_mode)
-                    if ret != 0:
+                    new_file = None
+                else:
+                    if not ret_file_path:
+                        log.error("【RMT】拼装文件路径错误，无法从文件名中识别出集数：%s" % file_item)
                         success_flag = False
-                        error_message = "蓝光目录转移失败，错误码：%s" % ret
+                        error_message = "识别失败，无法从文件名中识别出集数"
                         if udf_flag:
                             return success_flag, error_message
+                        # 记录未识别
+                        SqlHelper.insert_transfer_unknown(reg_path, target_dir)
                         failed_count += 1
                         alert_count += 1
                         if error_message not in alert_messages:
                             alert_messages.append(error_message)
                         continue
-                else:
-                    # 开始转移文件
-                    if not handler_flag:
-                        if not ret_file_path:
-                            log.error("【RMT】拼装文件路径错误，无法从文件名中识别出集数：%s" % file_item)
-                            success_flag = False
-                            error_message = "识别失败，无法从文件名中识别出集数"
-                            if udf_flag:
-                                return success_flag, error_message
-                            # 记录未识别
-                            SqlHelper.insert_transfer_unknown(reg_path, target_dir)
-                            failed_count += 1
-                            alert_count += 1
-                            if error_message not in alert_messages:
-                                alert_messages.append(error_message)
-                            continue
-                        new_file = "%s%s" % (ret_file_path, file_ext)
-                        ret = self.__transfer_file(file_item=file_item,
-                                                   new_file=new_file,
-                                                   rmt_mode=rmt_mode,
-                                                   over_flag=False)
-                        if ret != 0:
-                            success_flag = False
-                            error_message = "文件转移失败，错误码 %s" % ret
-                            if udf_flag:
-                                return success_flag, error_message
-                            failed_count += 1
-                            alert_count += 1
-                            if error_message not in alert_messages:
-                                alert_messages.append(error_message)
-                            continue
+                    new_file = "%s%s" % (ret_file_path, file_ext)
+                    if new_file in planned_targets:
+                        log.warn("【RMT】%s 与 %s 的目的文件相同：%s，已跳过" % (
+                            file_item, planned_targets.get(new_file), new_file))
+                        error_message = "目的文件重复：%s" % os.path.basename(new_file)
+                        failed_count += 1
+                        alert_count += 1
+                        if error_message not in alert_messages:
+                            alert_messages.append(error_message)
+                        continue
+                    planned_targets[new_file] = file_item
+                transfer_jobs.append({
+                    "file_item": file_item,
+                    "media": media,
+                    "reg_path": reg_path,
+                    "dist_path": dist_path,
+                    "ret_dir_path": ret_dir_path,
+                    "ret_file_path": ret_file_path,
+                    "new_file": new_file,
+                    "over_flag": over_flag,
+                    "exist_filenum": exist_filenum
+                })
+            except Exception as err:
+                log.error("【RMT】文件转移时发生错误：%s - %s" % (str(err), traceback.format_exc()))
+
+        # 并发转移文件
+        transfer_rets = self.__run_transfer_jobs(transfer_jobs, rmt_mode)
+
+        # 转移成功的文件，统一在一个事务中登记转移记录
+        finished_jobs = []
+        for job, ret in zip(transfer_jobs, transfer_rets):
+            if ret == 0:
+                finished_jobs.append(job)
+                continue
+            success_flag = False
+            if bluray_disk_dir:
+                error_message = "蓝光目录转移失败，错误码：%s" % ret
+            else:
+                error_message = "文件转移失败，错误码 %s" % ret
+            if udf_flag:
+                return success_flag, error_message
+            failed_count += 1
+            alert_count += 1
+            if error_message not in alert_messages:
+                alert_messages.append(error_message)
+        if finished_jobs:
+            try:
+                with SqlHelper.transaction():
+                    for job in finished_jobs:
+                        if not bluray_disk_dir:
+                            SqlHelper.insert_transfer_blacklist(job.get("file_item"))
+                        # 转移历史记录
+                        SqlHelper.insert_transfer_history(in_from, rmt_mode, job.get("reg_path"),
+                                                          job.get("dist_path"), job.get("media"))
+                        # 未识别手动识别或历史记录重新识别的批处理模式
+                        if isinstance(episode[1], bool) and episode[1]:
+                            # 未识别手动识别，更改未识别记录为已处理
+                            SqlHelper.update_transfer_unknown_state(job.get("file_item"))
+            except Exception as err:
+                log.error("【RMT】登记转移记录时发生错误：%s - %s" % (str(err), traceback.format_exc()))
+
+        for job in finished_jobs:
+            try:
+                file_item = job.get("file_item")
+                media = job.get("media")
+                ret_file_path = job.get("ret_file_path")
                 # 媒体库刷新条目：类型-类别-标题-年份
                 refresh_item = {"type": media.type, "category": media.category, "title": media.title,
-                                "year": media.year, "target_path": dist_path}
+                                "year": media.year, "target_path": job.get("dist_path")}
                 # 登记媒体库刷新
                 if refresh_item not in refresh_library_items:
                     refresh_library_items.append(refresh_item)
@@ -746,17 +879,11 @@ class FileTransfer:
                 # 登记字幕下载
                 if subtitle_item not in download_subtitle_items:
                     download_subtitle_items.append(subtitle_item)
-                # 转移历史记录
-                SqlHelper.insert_transfer_history(in_from, rmt_mode, reg_path, dist_path, media)
-                # 未识别手动识别或历史记录重新识别的批处理模式
-                if isinstance(episode[1], bool) and episode[1]:
-                    # 未识别手动识别，更改未识别记录为已处理
-                    SqlHelper.update_transfer_unknown_state(file_item)
                 # 电影立即发送消息
                 if media.type == MediaType.MOVIE:
                     self.message.send_transfer_movie_message(in_from,
                                                              media,
-                                                             exist_filenum,
+                                                             job.get("exist_filenum"),
                                                              self.__movie_category_flag)
                 # 否则登记汇总发消息
                 else:
@@ -774,18 +901,30 @@ class FileTransfer:
                     self.scraper.gen_scraper_files(media=media,
                                                    scraper_nfo=self.__scraper_nfo,
                                                    scraper_pic=self.__scraper_pic,
-                                                   dir_path=ret_dir_path,
+                                                   dir_path=job.get("ret_dir_path"),
                                                    file_name=os.path.basename(ret_file_path))
-                # 移动模式随机休眠（兼容一些网盘挂载目录）
-                if rmt_mode == RmtMode.MOVE:
-                    sleep(round(random.uniform(0, 1), 1))
-
             except Exception as err:
                 log.error("【RMT】文件转移时发生错误：%s - %s" % (str(err), traceback.format_exc()))
         # 循环结束
         # 统计完成情况，发送通知
         if message_medias:
             self.message.send_transfer_tv_message(message_medias, in_from)
+        # 登记剧集索引，媒体服务器扫描入库前查询是否存在也能命中，只登记转移到媒体库目录的剧集
+        transfer_episodes = []
+        library_paths = (self.__tv_path or []) + (self.__anime_path or [])
+        for job in finished_jobs:
+            media = job.get("media")
+            if media.type == MediaType.MOVIE or not media.tmdb_id or len(media.get_season_list()) != 1:
+                continue
+            if not any(PathUtils.is_path_in_path(library_path, job.get("dist_path"))
+                       for library_path in library_paths):
+                continue
+            for episode_num in media.get_episode_list():
+                transfer_episodes.append({"tmdbid": media.tmdb_id,
+                                          "season": media.get_season_list()[0],
+                                          "episode": episode_num})
+        if transfer_episodes:
+            self.mediaserver.update_episodes(transfer_episodes)
         # 刷新媒体库
         if refresh_library_items and self.__refresh_mediaserver:
             self.mediaserver.refresh_library_by_items(refresh_library_items)
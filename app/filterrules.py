@@ -1,5 +1,6 @@
 import re
 
+import log
 from app.helper import SqlHelper
 from app.utils.commons import singleton
 from app.utils.types import MediaType
@@ -9,6 +10,8 @@ from app.utils.types import MediaType
 class FilterRule:
     _groups = []
     _rules = []
+    _compiled_groups = {}
+    _default_groupid = None
 
     def __init__(self):
         self.init_config()
@@ -16,6 +19,7 @@ class FilterRule:
     def init_config(self):
         self._groups = SqlHelper.get_config_filter_group()
         self._rules = SqlHelper.get_config_filter_rule()
+        self.__compile_groups()
 
     def get_rule_groups(self, groupid=None, default=False):
         """
@@ -85,94 +89,174 @@ class FilterRule:
         """
         if not meta_info:
             return False, 0, ""
+        group = self.__get_compiled_group(rolegroup)
+        if not group:
+            return True, 0, "未配置过滤规则"
+        return self.__match_group(meta_info, group)
+
+    def check_rules_batch(self, meta_infos, rolegroup=None):
+        """
+        批量检查种子是否匹配过滤规则，规则组只查找一次，规则使用加载配置时预编译的结果
+        :param meta_infos: 识别的信息列表
+        :param rolegroup: 规则组ID
+        :return: 与meta_infos顺序对应的(是否匹配，匹配的优先值，规则名称)列表
+        """
+        if not meta_infos:
+            return []
+        group = self.__get_compiled_group(rolegroup)
+        results = []
+        for meta_info in meta_infos:
+            if not meta_info:
+                results.append((False, 0, ""))
+            elif not group:
+                results.append((True, 0, "未配置过滤规则"))
+            else:
+                results.append(self.__match_group(meta_info, group))
+        return results
+
+    def __get_compiled_group(self, rolegroup=None):
+        """
+        查询预编译的规则组，未指定规则组时使用默认规则组
+        """
+        compiled_groups = self._compiled_groups
+        if not rolegroup:
+            return compiled_groups.get(self._default_groupid)
+        return compiled_groups.get(str(rolegroup)) or {"name": None, "rules": []}
+
+    def __match_group(self, meta_info, group):
+        """
+        使用预编译的规则组匹配种子
+        """
         if meta_info.subtitle:
             title = "%s %s" % (meta_info.org_string, meta_info.subtitle)
         else:
             title = meta_info.org_string
-        if not rolegroup:
-            rolegroup = self.get_rule_groups(default=True)
-            if not rolegroup:
-                return True, 0, "未配置过滤规则"
-        else:
-            rolegroup = self.get_rule_groups(groupid=rolegroup)
-        filters = self.get_rules(groupid=rolegroup.get("id"))
         # 命中优先级
         order_seq = 0
         # 当前规则组是否命中
         group_match = True
-        for filter_info in filters:
-            # 当前规则是否命中
-            rule_match = True
+        for rule in group.get("rules"):
             # 命中规则的序号
-            order_seq = 100 - int(filter_info.get('pri'))
-            # 必须包括的项
-            includes = filter_info.get('include')
-            if includes and rule_match:
-                include_flag = True
-                for include in includes:
-                    if not include:
-                        continue
-                    if not re.search(r'%s' % include.strip(), title, re.IGNORECASE):
-                        include_flag = False
-                        break
-                if not include_flag:
-                    rule_match = False
-
-            # 不能包含的项
-            excludes = filter_info.get('exclude')
-            if excludes and rule_match:
-                exclude_flag = False
-                exclude_count = 0
-                for exclude in excludes:
-                    if not exclude:
-                        continue
-                    exclude_count += 1
-                    if not re.search(r'%s' % exclude.strip(), title, re.IGNORECASE):
-                        exclude_flag = True
-                if exclude_count > 0 and not exclude_flag:
-                    rule_match = False
-            # 大小
-            sizes = filter_info.get('size')
-            if sizes and rule_match and meta_info.size:
-                if sizes.find(',') != -1:
-                    sizes = sizes.split(',')
-                    if sizes[0].isdigit():
-                        begin_size = int(sizes[0].strip())
-                    else:
-                        begin_size = 0
-                    if sizes[1].isdigit():
-                        end_size = int(sizes[1].strip())
-                    else:
-                        end_size = 0
-                else:
-                    begin_size = 0
-                    if sizes.isdigit():
-                        end_size = int(sizes.strip())
-                    else:
-                        end_size = 0
-                if meta_info.type == MediaType.MOVIE:
-                    if not begin_size * 1024 ** 3 <= int(meta_info.size) <= end_size * 1024 ** 3:
-                        rule_match = False
-                else:
-                    if meta_info.total_episodes \
-                            and not begin_size * 1024 ** 3 <= int(meta_info.size)/int(meta_info.total_episodes) <= end_size * 1024 ** 3:
-                        rule_match = False
-
-            # 促销
-            free = filter_info.get("free")
-            if free and meta_info.upload_volume_factor is not None and meta_info.download_volume_factor is not None:
-                ul_factor, dl_factor = free.split()
-                if float(ul_factor) > meta_info.upload_volume_factor \
-                        or float(dl_factor) < meta_info.download_volume_factor:
-                    rule_match = False
-
-            if rule_match:
-                return True, order_seq, rolegroup.get("name")
-            else:
-                group_match = False
+            order_seq = rule.get("order_seq")
+            if self.__match_rule(meta_info, title, rule):
+                return True, order_seq, group.get("name")
+            group_match = False
         if not group_match:
-            return False, 0, rolegroup.get("name")
-        return True, order_seq, rolegroup.get("name")
+            return False, 0, group.get("name")
+        return True, order_seq, group.get("name")
+
+    @staticmethod
+    def __match_rule(meta_info, title, rule):
+        """
+        判断种子是否命中单条预编译规则
+        """
+        # 必须包括的项，全部匹配才命中
+        for include in rule.get("includes"):
+            if not include.search(title):
+                return False
+        # 不能包含的项，全部匹配时不命中
+        excludes = rule.get("excludes")
+        if excludes and all(exclude.search(title) for exclude in excludes):
+            return False
+        # 大小
+        size_range = rule.get("size")
+        if size_range and meta_info.size:
+            begin_size, end_size = size_range
+            if meta_info.type == MediaType.MOVIE:
+                if not begin_size <= int(meta_info.size) <= end_size:
+                    return False
+            else:
+                if meta_info.total_episodes \
+                        and not begin_size <= int(meta_info.size) / int(meta_info.total_episodes) <= end_size:
+                    return False
+        # 促销
+        free = rule.get("free")
+        if free and meta_info.upload_volume_factor is not None and meta_info.download_volume_factor is not None:
+            ul_factor, dl_factor = free
+            if ul_factor > meta_info.upload_volume_factor \
+                    or dl_factor < meta_info.download_volume_factor:
+                return False
+        return True
+
+    def __compile_groups(self):
+        """
+        预编译所有规则组：正则、大小范围及促销系数只在加载配置时解析一次
+        """
+        compiled_groups = {}
+        default_groupid = None
+        for group in self._groups:
+            groupid = str(group[0])
+            if group[2] == "Y" and default_groupid is None:
+                default_groupid = groupid
+            compiled_groups[groupid] = {
+                "name": group[1],
+                "rules": [self.__compile_rule(rule) for rule in self.get_rules(groupid=groupid)]
+            }
+        self._compiled_groups = compiled_groups
+        self._default_groupid = default_groupid
+
+    def __compile_rule(self, filter_info):
+        """
+        预编译单条规则
+        """
+        return {
+            "order_seq": 100 - int(filter_info.get('pri')),
+            "includes": self.__compile_terms(filter_info.get('include')),
+            "excludes": self.__compile_terms(filter_info.get('exclude')),
+            "size": self.__parse_size(filter_info.get('size')),
+            "free": self.__parse_free(filter_info.get('free'))
+        }
+
+    @staticmethod
+    def __compile_terms(terms):
+        """
+        编译包含/排除项的正则，非法的正则按普通文本匹配
+        """
+        patterns = []
+        for term in terms or []:
+            if not term:
+                continue
+            try:
+                patterns.append(re.compile(r'%s' % term.strip(), re.IGNORECASE))
+            except re.error as err:
+                log.warn(f"【Rules】过滤规则 {term} 不是合法的正则表达式，将按文本匹配：{err}")
+                patterns.append(re.compile(re.escape(term.strip()), re.IGNORECASE))
+        return patterns
+
+    @staticmethod
+    def __parse_size(sizes):
+        """
+        解析大小范围，单位GB，返回字节数
+        """
+        if not sizes:
+            return None
+        if sizes.find(',') != -1:
+            sizes = sizes.split(',')
+            if sizes[0].isdigit():
+                begin_size = int(sizes[0].strip())
+            else:
+                begin_size = 0
+            if sizes[1].isdigit():
+                end_size = int(sizes[1].strip())
+            else:
+                end_size = 0
+        else:
+            begin_size = 0
+            if sizes.isdigit():
+                end_size = int(sizes.strip())
+            else:
+                end_size = 0
+        return begin_size * 1024 ** 3, end_size * 1024 ** 3
+
+    @staticmethod
+    def __parse_free(free):
+        """
+        解析促销系数：上传系数 下载系数
+        """
+        if not free:
+            return None
+        ul_factor, dl_factor = free.split()
+        return float(ul_factor), float(dl_factor)
 
     def is_rule_free(self, rolegroup=None):
         """
@@ -4,7 +4,9 @@ from .chrome_helper import CHROME_LOCK
 from .indexer_helper import IndexerHelper, IndexerConf
 from .meta_helper import MetaHelper
 from .progress_helper import ProgressHelper
+from .rss_helper import RssHelper
 from .security import Security
 from .thread_helper import ThreadHelper
+from .torrent_helper import TorrentHelper
 from .sql_helper import SqlHelper
 from .dict_helper import DictHelper
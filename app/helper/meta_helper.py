@@ -1,8 +1,8 @@
 import os
 import pickle
-import random
 import time
 from threading import RLock
+from app.db import MetaDb
 from app.utils import JsonUtils
 from config import Config
 from app.utils.commons import singleton
@@ -16,9 +16,13 @@ EXPIRE_TIMESTAMP = 7 * 24 * 3600
 
 @singleton
 class MetaHelper(object):
+    # 已加载到内存中的缓存，按需从数据库中加载
     __meta_data = {}
+    # 待写入数据库的缓存key
+    __dirty_keys = set()
     __meta_path = None
     __tmdb_cache_expire = False
+    __metadb = None
 
     def __init__(self):
         self.init_config()
@@ -28,8 +32,12 @@ class MetaHelper(object):
         laboratory = config.get_config('laboratory')
         if laboratory:
             self.__tmdb_cache_expire = laboratory.get("tmdb_cache_expire")
-        self.__meta_path = os.path.join(config.get_config_path(), 'meta.dat')
-        self.__meta_data = self.__load_meta_data(self.__meta_path)
+        self.__metadb = MetaDb()
+        self.__meta_path = self.__metadb.get_db_path()
+        with lock:
+            self.__meta_data = {}
+            self.__dirty_keys = set()
+        self.__import_meta_file(os.path.join(config.get_config_path(), 'meta.dat'))
 
     def clear_meta_data(self):
         """
@@ -37,6 +45,8 @@ class MetaHelper(object):
         """
         with lock:
             self.__meta_data = {}
+            self.__dirty_keys = set()
+            self.__metadb.empty()
 
     def get_meta_data_path(self):
         """
@@ -49,12 +59,12 @@ class MetaHelper(object):
         根据KEY值获取缓存值
         """
         with lock:
-            info: dict = self.__meta_data.get(key)
+            info: dict = self.__get_meta_data(key)
             if info:
                 expire = info.get(CACHE_EXPIRE_TIMESTAMP_STR)
                 if not expire or int(time.time()) < expire:
                     info[CACHE_EXPIRE_TIMESTAMP_STR] = int(time.time()) + EXPIRE_TIMESTAMP
-                    self.update_meta_data({key: info})
+                    self.__dirty_keys.add(key)
                 elif expire and self.__tmdb_cache_expire:
                     self.delete_meta_data(key)
             return info
@@ -62,7 +72,7 @@ class MetaHelper(object):
     def dump_meta_data(self, search, page, num):
         """
         分页获取当前缓存列表
-        @param search: 检索的缓存key
+        @param search: 检索的标题前缀
         @param page: 页码
         @param num: 单页大小
         @return: 总数, 缓存列表
@@ -71,13 +81,10 @@ class MetaHelper(object):
             begin_pos = 0
         else:
             begin_pos = (page - 1) * num
-
-        with lock:
-            search_metas = [(k, JsonUtils.json_serializable(v),
-                             str(k).replace("[电影]", "").replace("[电视剧]", "").replace("[未知]", "").replace("-None", ""))
-                            for k, v in
-                            self.__meta_data.items() if search.lower() in k.lower() and v.get("id") != 0]
-            return len(search_metas), search_metas[begin_pos: begin_pos + num]
+        # 先将内存中的变更写入数据库，再从数据库中检索
+        self.save_meta_data()
+        total, metas = self.__metadb.search(title=search, offset=begin_pos, limit=num)
+        return total, [(k, JsonUtils.json_serializable(v), self.__get_key_title(k)) for k, v in metas]
 
     def delete_meta_data(self, key):
         """
@@ -86,25 +93,33 @@ class MetaHelper(object):
         @return: 被删除的缓存内容
         """
         with lock:
-            return self.__meta_data.pop(key, None)
+            info = self.__get_meta_data(key)
+            self.__meta_data.pop(key, None)
+            self.__dirty_keys.discard(key)
+            self.__metadb.delete([key])
+            return info
 
     def delete_meta_data_by_tmdbid(self, tmdbid):
         """
         清空对应TMDBID的所有缓存记录，以强制更新TMDB中最新的数据
         """
-        for key in list(self.__meta_data):
-            if str(self.__meta_data.get(key, {}).get("id")) == str(tmdbid):
-                with lock:
+        with lock:
+            for key in list(self.__meta_data):
+                if str(self.__meta_data.get(key, {}).get("id")) == str(tmdbid):
                     self.__meta_data.pop(key)
+                    self.__dirty_keys.discard(key)
+            self.__metadb.delete_by_tmdbid(tmdbid)
 
     def delete_unknown_meta(self):
         """
         清除未识别的缓存记录，以便重新检索TMDB
         """
-        for key in list(self.__meta_data):
-            if str(self.__meta_data.get(key, {}).get("id")) == '0':
-                with lock:
+        with lock:
+            for key in list(self.__meta_data):
+                if str(self.__meta_data.get(key, {}).get("id")) == '0':
                     self.__meta_data.pop(key)
+                    self.__dirty_keys.discard(key)
+            self.__metadb.delete_by_tmdbid(0)
 
     def modify_meta_data(self, key, title):
         """
@@ -114,28 +129,61 @@ class MetaHelper(object):
         @return: 被修改后缓存内容
         """
         with lock:
-            if self.__meta_data.get(key):
-                if self.__meta_data[key]['media_type'] == MediaType.MOVIE:
-                    self.__meta_data[key]['title'] = title
+            info = self.__get_meta_data(key)
+            if info:
+                if info['media_type'] == MediaType.MOVIE:
+                    info['title'] = title
                 else:
-                    self.__meta_data[key]['name'] = title
-                self.__meta_data[key][CACHE_EXPIRE_TIMESTAMP_STR] = int(time.time()) + EXPIRE_TIMESTAMP
-            return self.__meta_data.get(key)
+                    info['name'] = title
+                info[CACHE_EXPIRE_TIMESTAMP_STR] = int(time.time()) + EXPIRE_TIMESTAMP
+                self.__dirty_keys.add(key)
+            return info
 
-    @staticmethod
-    def __load_meta_data(path):
+    def __get_meta_data(self, key):
         """
-        从文件中加载缓存
+        从内存中获取缓存，不存在时从数据库中加载
         """
+        if not key:
+            return None
+        info = self.__meta_data.get(key)
+        if info is None:
+            info = self.__metadb.get(key)
+            if info is not None:
+                self.__meta_data[key] = info
+        return info
+
+    def __import_meta_file(self, path):
+        """
+        将旧版本的meta.dat缓存文件一次性导入数据库
+        """
+        if not os.path.exists(path):
+            return
         try:
-            if os.path.exists(path):
+            if self.__metadb.is_empty():
                 with open(path, 'rb') as f:
                     data = pickle.load(f)
-                return data
-            return {}
+                if isinstance(data, dict):
+                    self.__metadb.upsert([self.__make_row(k, v) for k, v in data.items()
+                                          if str(v.get("id")) != '0'])
+            os.replace(path, "%s.bak" % path)
         except Exception as e:
             print(str(e))
-            return {}
+
+    @staticmethod
+    def __get_key_title(key):
+        """
+        从缓存key中提取标题
+        """
+        return str(key).replace("[电影]", "").replace("[电视剧]", "").replace("[未知]", "").replace("-None", "")
+
+    def __make_row(self, key, info):
+        """
+        生成数据库记录
+        """
+        expire = info.get(CACHE_EXPIRE_TIMESTAMP_STR)
+        if not expire:
+            expire = info[CACHE_EXPIRE_TIMESTAMP_STR] = int(time.time()) + EXPIRE_TIMESTAMP
+        return key, str(info.get("id")), self.__get_key_title(key), expire, info
 
     def update_meta_data(self, meta_data):
         """
@@ -145,63 +193,35 @@ class MetaHelper(object):
             return
         with lock:
             for key, item in meta_data.items():
-                if not self.__meta_data.get(key):
+                if not self.__get_meta_data(key):
                     item[CACHE_EXPIRE_TIMESTAMP_STR] = int(time.time()) + EXPIRE_TIMESTAMP
                     self.__meta_data[key] = item
+                    self.__dirty_keys.add(key)
 
     def save_meta_data(self, force=False):
         """
-        保存缓存数据到文件
-        """
-        meta_data = self.__load_meta_data(self.__meta_path)
-        new_meta_data = {k: v for k, v in self.__meta_data.items() if str(v.get("id")) != '0'}
-
-        if not force and not self._random_sample(new_meta_data) and meta_data.keys() == new_meta_data.keys():
-            return
-
-        with open(self.__meta_path, 'wb') as f:
-            pickle.dump(new_meta_data, f, pickle.HIGHEST_PROTOCOL)
-
-    def _random_sample(self, new_meta_data):
-        """
-        采样分析是否需要保存
+        保存变更的缓存条目到数据库，并增量清理已过期的缓存
         """
-        ret = False
-        if len(new_meta_data) < 25:
-            keys = list(new_meta_data.keys())
-            for k in keys:
-                info = new_meta_data.get(k)
-                expire = info.get(CACHE_EXPIRE_TIMESTAMP_STR)
-                if not expire:
-                    ret = True
-                    info[CACHE_EXPIRE_TIMESTAMP_STR] = int(time.time()) + EXPIRE_TIMESTAMP
-                elif int(time.time()) >= expire:
-                    ret = True
-                    if self.__tmdb_cache_expire:
-                        new_meta_data.pop(k)
-        else:
-            count = 0
-            keys = random.sample(new_meta_data.keys(), 25)
-            for k in keys:
-                info = new_meta_data.get(k)
-                expire = info.get(CACHE_EXPIRE_TIMESTAMP_STR)
-                if not expire:
-                    ret = True
-                    info[CACHE_EXPIRE_TIMESTAMP_STR] = int(time.time()) + EXPIRE_TIMESTAMP
-                elif int(time.time()) >= expire:
-                    ret = True
-                    if self.__tmdb_cache_expire:
-                        new_meta_data.pop(k)
-                        count += 1
-            if count >= 5:
-                ret |= self._random_sample(new_meta_data)
-        return ret
+        with lock:
+            if force:
+                self.__dirty_keys.update(self.__meta_data.keys())
+            # 未识别的记录不持久化
+            rows = [self.__make_row(key, self.__meta_data.get(key)) for key in self.__dirty_keys
+                    if self.__meta_data.get(key) and str(self.__meta_data.get(key).get("id")) != '0']
+            if self.__metadb.upsert(rows):
+                self.__dirty_keys = set()
+            if self.__tmdb_cache_expire:
+                expired_keys = self.__metadb.get_expired_keys(int(time.time()))
+                for key in expired_keys:
+                    self.__meta_data.pop(key, None)
+                self.__metadb.delete(expired_keys)
 
     def get_cache_title(self, key):
         """
         获取缓存的标题
         """
-        cache_media_info = self.__meta_data.get(key)
+        with lock:
+            cache_media_info = self.__get_meta_data(key)
         if not cache_media_info or not cache_media_info.get("id"):
             return None
         return cache_media_info.get("title") if cache_media_info.get(
@@ -211,10 +231,12 @@ class MetaHelper(object):
         """
         重新设置缓存标题
         """
-        cache_media_info = self.__meta_data.get(key)
-        if not cache_media_info:
-            return
-        if cache_media_info.get("media_type") == MediaType.MOVIE:
-            self.__meta_data[key]['title'] = cn_title
-        else:
-            self.__meta_data[key]['name'] = cn_title
+        with lock:
+            cache_media_info = self.__get_meta_data(key)
+            if not cache_media_info:
+                return
+            if cache_media_info.get("media_type") == MediaType.MOVIE:
+                cache_media_info['title'] = cn_title
+            else:
+                cache_media_info['name'] = cn_title
+            self.__dirty_keys.add(key)
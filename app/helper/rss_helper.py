@@ -0,0 +1,143 @@
+import datetime
+import threading
+
+import log
+from app.utils import RequestUtils
+from app.utils.commons import singleton
+from config import Config
+
+lock = threading.Lock()
+
+
+@singleton
+class RssHelper:
+    """
+    记录每个RSS地址的ETag/Last-Modified及已处理到的位置，用于条件请求和只处理新增条目，
+    不同的调用方（如订阅、刷流任务）使用不同的key，互不影响
+    """
+    _feeds = {}
+    _versions = {}
+
+    def __init__(self):
+        self._feeds = {}
+        self._versions = {}
+
+    def get_res(self, url, key=None, timeout=None):
+        """
+        条件请求RSS地址
+        :param url: RSS地址
+        :param key: 调用方标识
+        :param timeout: 请求超时时间（秒）
+        :return: 请求结果，内容未变化（304）或请求失败时返回None
+        """
+        with lock:
+            feed = self._feeds.get((key, url)) or {}
+        headers = {"Content-Type": "application/x-www-form-urlencoded; charset=UTF-8",
+                   "User-Agent": Config().get_ua()}
+        if feed.get("etag"):
+            headers["If-None-Match"] = feed.get("etag")
+        if feed.get("last_modified"):
+            headers["If-Modified-Since"] = feed.get("last_modified")
+        res = RequestUtils(headers=headers, timeout=timeout).get_res(url)
+        if res is None:
+            return None
+        if res.status_code == 304:
+            log.debug("【Rss】%s 内容未变化" % url)
+            return None
+        if not res.ok:
+            return None
+        with lock:
+            feed = self._feeds.setdefault((key, url), {})
+            feed["etag"] = res.headers.get("ETag")
+            feed["last_modified"] = res.headers.get("Last-Modified")
+        return res
+
+    def filter_new_items(self, url, items, key=None):
+        """
+        过滤出未处理的条目：发布时间早于处理位置的，以及已处理过的种子链接不再返回，
+        处理位置不在这里更新，调用方处理完成后调用update_processed登记
+        :param url: RSS地址
+        :param items: 解析后的条目，需包含enclosure和pubdate
+        :param key: 调用方标识
+        """
+        with lock:
+            feed = self._feeds.setdefault((key, url), {})
+            watermark = feed.get("pubdate")
+            seen_enclosures = feed.get("enclosures") or set()
+            new_items = []
+            for item in items:
+                if self.__get_item_id(item) in seen_enclosures:
+                    continue
+                pubdate = item.get("pubdate")
+                if watermark and isinstance(pubdate, datetime.datetime) and pubdate < watermark:
+                    continue
+                new_items.append(item)
+            feed["items"] = set(self.__get_item_id(item) for item in items)
+            feed["pending"] = new_items
+        return new_items
+
+    def update_processed(self, url, items, key=None):
+        """
+        登记已处理成功（已接受或确定不需要）的条目并推进处理位置，
+        未处理成功的条目下次继续返回：处理位置不超过其中最早的发布时间，且不再使用条件请求
+        :param url: RSS地址
+        :param items: 处理成功的条目
+        :param key: 调用方标识
+        """
+        with lock:
+            feed = self._feeds.get((key, url))
+            if feed is None:
+                return
+            processed = set(self.__get_item_id(item) for item in items or [])
+            pending = feed.pop("pending", None) or []
+            failed = [item for item in pending if self.__get_item_id(item) not in processed]
+            # 已处理的最新发布时间
+            latest = feed.get("latest")
+            pubdates = [item.get("pubdate") for item in items or []
+                        if isinstance(item.get("pubdate"), datetime.datetime)]
+            if pubdates:
+                latest = feed["latest"] = max(pubdates + ([latest] if latest else []))
+            failed_pubdates = [item.get("pubdate") for item in failed
+                               if isinstance(item.get("pubdate"), datetime.datetime)]
+            if failed_pubdates:
+                feed["pubdate"] = min(failed_pubdates + ([latest] if latest else []))
+            else:
+                feed["pubdate"] = latest
+            # 只保留仍在RSS中的已处理链接
+            feed["enclosures"] = ((feed.get("enclosures") or set()) & (feed.get("items") or set())) | processed
+            if failed:
+                feed.pop("etag", None)
+                feed.pop("last_modified", None)
+
+    @staticmethod
+    def __get_item_id(item):
+        """
+        条目标识，没有种子链接时使用页面链接
+        """
+        return item.get("enclosure") or item.get("link")
+
+    def reset(self, key=None):
+        """
+        清除调用方记录的全部RSS状态，下次重新请求及处理全部条目
+        """
+        with lock:
+            self.__reset_feeds(key)
+
+    def reset_on_change(self, key, version):
+        """
+        调用方的处理条件（如订阅清单）变化时清除其RSS状态，使已有条目按新条件重新处理
+        """
+        version = str(version)
+        with lock:
+            if self._versions.get(key) == version:
+                return
+            self._versions[key] = version
+            self.__reset_feeds(key)
+
+    def __reset_feeds(self, key):
+        """
+        清除调用方记录的全部RSS状态，调用方需持有锁
+        """
+        for feed_key in list(self._feeds):
+            if feed_key[0] == key:
+                self._feeds.pop(feed_key)
@@ -10,6 +10,13 @@ from app.utils.types import MediaType, RmtMode
 
 class SqlHelper:
 
+    @staticmethod
+    def transaction():
+        """
+        开启事务，with块内的多条写入语句一次性提交，退出后通过返回结果的success判断是否已提交
+        """
+        return MainDb().transaction()
+
     @staticmethod
     def insert_search_results(media_items: list):
         """
@@ -100,9 +107,18 @@ class SqlHelper:
         """
         sql = "SELECT ID,TITLE||' ('||YEAR||') '||ES_STRING,RES_TYPE,SIZE,SEEDERS," \
               "ENCLOSURE,SITE,YEAR,ES_STRING,IMAGE,TYPE,VOTE*1,TORRENT_NAME,DESCRIPTION,TMDBID,POSTER,OVERVIEW,PAGEURL,OTHERINFO,UPLOAD_VOLUME_FACTOR,DOWNLOAD_VOLUME_FACTOR,TITLE" \
-              " FROM SEARCH_RESULT_INFO"
+              " FROM SEARCH_RESULT_INFO" \
+              " ORDER BY CAST(RES_ORDER AS INTEGER) DESC, CAST(SITE_ORDER AS INTEGER) DESC, SEEDERS DESC, ID"
         return MainDb().select_by_sql(sql)
 
+    @staticmethod
+    def get_search_result_count():
+        """
+        查询检索结果的记录数
+        """
+        ret = MainDb().select_by_sql("SELECT COUNT(1) FROM SEARCH_RESULT_INFO")
+        return ret[0][0] if ret else 0
+
     @staticmethod
     def is_torrent_rssd(enclosure):
         """
@@ -135,6 +151,61 @@ class SqlHelper:
         else:
             return False
 
+    @staticmethod
+    def get_rssd_enclosures(enclosures):
+        """
+        批量查询RSS是否处理过，根据种子链接
+        :param enclosures: 种子链接列表
+        :return: 已处理过的种子链接集合
+        """
+        return SqlHelper.__select_rssd_values("ENCLOSURE", enclosures)
+
+    @staticmethod
+    def get_rssd_torrent_names(torrent_names):
+        """
+        批量查询RSS是否处理过，根据名称
+        :param torrent_names: 种子名称列表
+        :return: 已处理过的种子名称集合
+        """
+        return SqlHelper.__select_rssd_values("TORRENT_NAME", torrent_names)
+
+    @staticmethod
+    def get_userrss_finished(torrents):
+        """
+        批量查询RSS是否处理过，有种子链接的根据链接，否则根据名称
+        :param torrents: (种子名称, 种子链接)列表
+        :return: 已处理过的(种子名称, 种子链接)集合
+        """
+        if not torrents:
+            return set()
+        enclosures = SqlHelper.get_rssd_enclosures([enclosure for _, enclosure in torrents if enclosure])
+        torrent_names = SqlHelper.get_rssd_torrent_names([name for name, enclosure in torrents if not enclosure])
+        finished = set()
+        for torrent_name, enclosure in torrents:
+            if not torrent_name and not enclosure:
+                finished.add((torrent_name, enclosure))
+            elif enclosure:
+                if enclosure in enclosures:
+                    finished.add((torrent_name, enclosure))
+            elif torrent_name in torrent_names:
+                finished.add((torrent_name, enclosure))
+        return finished
+
+    @staticmethod
+    def __select_rssd_values(field, values):
+        """
+        分批使用IN查询RSS_TORRENTS中已存在的值，每批不超过SQLite的参数个数限制
+        """
+        values = list({value for value in values or [] if value})
+        if not values:
+            return set()
+        rssd_values = set()
+        for i in range(0, len(values), 500):
+            chunk = values[i:i + 500]
+            sql = "SELECT DISTINCT %s FROM RSS_TORRENTS WHERE %s IN (%s)" % (field, field, ",".join("?" * len(chunk)))
+            rssd_values.update(ret[0] for ret in MainDb().select_by_sql(sql, tuple(chunk)))
+        return rssd_values
+
     @staticmethod
     def delete_all_search_torrents():
         """
@@ -157,6 +228,23 @@ class SqlHelper:
                                             media_info.get_season_string(),
                                             media_info.get_episode_string()))
 
+    @staticmethod
+    def insert_rss_torrents_batch(media_infos):
+        """
+        将一批RSS的记录在一个事务中插入数据库
+        """
+        if not media_infos:
+            return False
+        sql = "INSERT INTO RSS_TORRENTS(TORRENT_NAME, ENCLOSURE, TYPE, TITLE, YEAR, SEASON, EPISODE) " \
+              "VALUES (?, ?, ?, ?, ?, ?, ?)"
+        return MainDb().update_by_sql_batch(sql, [(StringUtils.str_sql(media_info.org_string),
+                                                   media_info.enclosure,
+                                                   media_info.type.value,
+                                                   StringUtils.str_sql(media_info.title),
+                                                   StringUtils.str_sql(media_info.year),
+                                                   media_info.get_season_string(),
+                                                   media_info.get_episode_string()) for media_info in media_infos])
+
     @staticmethod
     def simple_insert_rss_torrents(title, enclosure):
         """
@@ -179,21 +267,23 @@ class SqlHelper:
         """
         将豆瓣的数据插入数据库
         """
-        if not media.year:
-            sql = "DELETE FROM DOUBAN_MEDIAS WHERE NAME = ?"
-            MainDb().update_by_sql(sql, (StringUtils.str_sql(media.get_name()),))
-        else:
-            sql = "DELETE FROM DOUBAN_MEDIAS WHERE NAME = ? AND YEAR = ?"
-            MainDb().update_by_sql(sql, (StringUtils.str_sql(media.get_name()), StringUtils.str_sql(media.year)))
-
-        sql = "INSERT INTO DOUBAN_MEDIAS(NAME, YEAR, TYPE, RATING, IMAGE, STATE) VALUES (?, ?, ?, ?, ?, ?)"
-        # 再插入
-        return MainDb().update_by_sql(sql, (StringUtils.str_sql(media.get_name()),
-                                            StringUtils.str_sql(media.year),
-                                            media.type.value,
-                                            media.vote_average,
-                                            media.get_poster_image(),
-                                            state))
+        with MainDb().transaction() as trans:
+            if not media.year:
+                sql = "DELETE FROM DOUBAN_MEDIAS WHERE NAME = ?"
+                MainDb().update_by_sql(sql, (StringUtils.str_sql(media.get_name()),))
+            else:
+                sql = "DELETE FROM DOUBAN_MEDIAS WHERE NAME = ? AND YEAR = ?"
+                MainDb().update_by_sql(sql, (StringUtils.str_sql(media.get_name()), StringUtils.str_sql(media.year)))
+
+            sql = "INSERT INTO DOUBAN_MEDIAS(NAME, YEAR, TYPE, RATING, IMAGE, STATE) VALUES (?, ?, ?, ?, ?, ?)"
+            # 再插入
+            MainDb().update_by_sql(sql, (StringUtils.str_sql(media.get_name()),
+                                         StringUtils.str_sql(media.year),
+                                         media.type.value,
+                                         media.vote_average,
+                                         media.get_poster_image(),
+                                         state))
+        return trans.success
 
     @staticmethod
     def update_douban_media_state(media, state):
@@ -414,8 +504,9 @@ class SqlHelper:
         """
         清空黑名单记录
         """
-        MainDb().update_by_sql("DELETE FROM TRANSFER_BLACKLIST")
-        MainDb().update_by_sql("DELETE FROM SYNC_HISTORY")
+        with MainDb().transaction():
+            MainDb().update_by_sql("DELETE FROM TRANSFER_BLACKLIST")
+            MainDb().update_by_sql("DELETE FROM SYNC_HISTORY")
 
     @staticmethod
     def truncate_rss_history():
@@ -646,10 +737,12 @@ class SqlHelper:
         if rssid:
             return MainDb().update_by_sql("DELETE FROM RSS_MOVIES WHERE ID = ?", (rssid,))
         else:
-            if tmdbid:
-                MainDb().update_by_sql("DELETE FROM RSS_MOVIES WHERE TMDBID = ?", (tmdbid,))
-            return MainDb().update_by_sql("DELETE FROM RSS_MOVIES WHERE NAME = ? AND YEAR = ?",
-                                          (StringUtils.str_sql(title), StringUtils.str_sql(year)))
+            with MainDb().transaction() as trans:
+                if tmdbid:
+                    MainDb().update_by_sql("DELETE FROM RSS_MOVIES WHERE TMDBID = ?", (tmdbid,))
+                MainDb().update_by_sql("DELETE FROM RSS_MOVIES WHERE NAME = ? AND YEAR = ?",
+                                       (StringUtils.str_sql(title), StringUtils.str_sql(year)))
+            return trans.success
 
     @staticmethod
     def update_rss_movie_state(title=None, year=None, rssid=None, state='R'):
@@ -836,8 +929,10 @@ class SqlHelper:
         if not title and not rssid:
             return False
         if rssid:
-            SqlHelper.delete_rss_tv_episodes(rssid)
-            return MainDb().update_by_sql("DELETE FROM RSS_TVS WHERE ID = ?", (rssid,))
+            with MainDb().transaction() as trans:
+                SqlHelper.delete_rss_tv_episodes(rssid)
+                MainDb().update_by_sql("DELETE FROM RSS_TVS WHERE ID = ?", (rssid,))
+            return trans.success
         else:
             rssid = SqlHelper.get_rss_tv_id(title=title, tmdbid=tmdbid, season=season)
             if rssid:
@@ -1373,6 +1468,12 @@ class SqlHelper:
                                                 item.get('state'),
                                                 time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(time.time()))))
         else:
+            # 选种规则变化时清除已处理的RSS种子记录，使RSS中已有的种子按新规则重新处理
+            old_tasks = SqlHelper.get_brushtasks(brush_id)
+            if old_tasks and (str(old_tasks[0][8] or '') != str(item.get('free') or '')
+                              or old_tasks[0][9] != str(item.get('rss_rule'))):
+                sql = "DELETE FROM SITE_BRUSH_RSS_SEEN WHERE TASK_ID = ?"
+                MainDb().update_by_sql(sql, (str(brush_id),))
             sql = '''
                 UPDATE SITE_BRUSH_TASK SET
                     NAME = ?,
@@ -1406,10 +1507,54 @@ class SqlHelper:
         """
         删除刷流任务
         """
-        sql = "DELETE FROM SITE_BRUSH_TASK WHERE ID = ?"
-        MainDb().update_by_sql(sql, (brush_id,))
-        sql = "DELETE FROM SITE_BRUSH_TORRENTS WHERE TASK_ID = ?"
-        MainDb().update_by_sql(sql, (brush_id,))
+        with MainDb().transaction():
+            sql = "DELETE FROM SITE_BRUSH_TASK WHERE ID = ?"
+            MainDb().update_by_sql(sql, (brush_id,))
+            sql = "DELETE FROM SITE_BRUSH_TORRENTS WHERE TASK_ID = ?"
+            MainDb().update_by_sql(sql, (brush_id,))
+            sql = "DELETE FROM SITE_BRUSH_RSS_SEEN WHERE TASK_ID = ?"
+            MainDb().update_by_sql(sql, (str(brush_id),))
+
+    @staticmethod
+    def get_brushtask_rss_seen(brush_id, enclosures):
+        """
+        分批查询刷流任务已处理过的RSS种子链接
+        """
+        enclosures = list({enclosure for enclosure in enclosures or [] if enclosure})
+        if not brush_id or not enclosures:
+            return set()
+        seen_enclosures = set()
+        for i in range(0, len(enclosures), 500):
+            chunk = enclosures[i:i + 500]
+            sql = "SELECT ENCLOSURE FROM SITE_BRUSH_RSS_SEEN WHERE TASK_ID = ? AND ENCLOSURE IN (%s)" \
+                  % ",".join("?" * len(chunk))
+            seen_enclosures.update(ret[0] for ret in MainDb().select_by_sql(sql, (str(brush_id),) + tuple(chunk)))
+        return seen_enclosures
+
+    @staticmethod
+    def insert_brushtask_rss_seen(brush_id, enclosures):
+        """
+        批量登记刷流任务已处理过的RSS种子链接
+        """
+        if not brush_id or not enclosures:
+            return False
+        seen_time = int(time.time())
+        sql = "INSERT OR REPLACE INTO SITE_BRUSH_RSS_SEEN(TASK_ID, ENCLOSURE, SEEN_TIME) VALUES (?, ?, ?)"
+        return MainDb().update_by_sql_batch(sql, [(str(brush_id), enclosure, seen_time)
+                                                  for enclosure in set(enclosures) if enclosure])
+
+    @staticmethod
+    def truncate_brushtask_rss_seen(brush_id, expire_time, max_count):
+        """
+        清理刷流任务已处理的RSS种子记录，删除过期的，且只保留最近的max_count条
+        """
+        with MainDb().transaction():
+            sql = "DELETE FROM SITE_BRUSH_RSS_SEEN WHERE TASK_ID = ? AND SEEN_TIME < ?"
+            MainDb().update_by_sql(sql, (str(brush_id), int(expire_time)))
+            sql = "DELETE FROM SITE_BRUSH_RSS_SEEN WHERE TASK_ID = ? AND SEEN_TIME < (" \
+                  "SELECT SEEN_TIME FROM SITE_BRUSH_RSS_SEEN WHERE TASK_ID = ? " \
+                  "ORDER BY SEEN_TIME DESC LIMIT 1 OFFSET ?)"
+            MainDb().update_by_sql(sql, (str(brush_id), str(brush_id), int(max_count)))
 
     @staticmethod
     def get_brushtasks(brush_id=None):
@@ -1624,20 +1769,21 @@ class SqlHelper:
         """
         新增规则组
         """
-        if default == 'Y':
-            SqlHelper.set_default_filtergroup(0)
-        group_id = SqlHelper.get_filter_groupid_by_name(name)
-        if group_id:
-            MainDb().update_by_sql("UPDATE CONFIG_FILTER_GROUP "
-                                   "SET IS_DEFAULT = ? "
-                                   "WHERE ID = ?",
-                                   (default, group_id))
-        else:
-            MainDb().update_by_sql("INSERT INTO CONFIG_FILTER_GROUP "
-                                   "(GROUP_NAME, IS_DEFAULT) "
-                                   "VALUES (?, ?)",
-                                   (StringUtils.str_sql(name), default))
-        return True
+        with MainDb().transaction() as trans:
+            if default == 'Y':
+                SqlHelper.set_default_filtergroup(0)
+            group_id = SqlHelper.get_filter_groupid_by_name(name)
+            if group_id:
+                MainDb().update_by_sql("UPDATE CONFIG_FILTER_GROUP "
+                                       "SET IS_DEFAULT = ? "
+                                       "WHERE ID = ?",
+                                       (default, group_id))
+            else:
+                MainDb().update_by_sql("INSERT INTO CONFIG_FILTER_GROUP "
+                                       "(GROUP_NAME, IS_DEFAULT) "
+                                       "VALUES (?, ?)",
+                                       (StringUtils.str_sql(name), default))
+        return trans.success
 
     @staticmethod
     def get_filter_groupid_by_name(name):
@@ -1652,20 +1798,24 @@ class SqlHelper:
         """
         设置默认的规则组
         """
-        sql = "UPDATE CONFIG_FILTER_GROUP SET IS_DEFAULT = 'Y' WHERE ID = ?"
-        MainDb().update_by_sql(sql, (groupid,))
-        sql = "UPDATE CONFIG_FILTER_GROUP SET IS_DEFAULT = 'N' WHERE ID <> ?"
-        return MainDb().update_by_sql(sql, (groupid,))
+        with MainDb().transaction() as trans:
+            sql = "UPDATE CONFIG_FILTER_GROUP SET IS_DEFAULT = 'Y' WHERE ID = ?"
+            MainDb().update_by_sql(sql, (groupid,))
+            sql = "UPDATE CONFIG_FILTER_GROUP SET IS_DEFAULT = 'N' WHERE ID <> ?"
+            MainDb().update_by_sql(sql, (groupid,))
+        return trans.success
 
     @staticmethod
     def delete_filtergroup(groupid):
         """
         删除规则组
         """
-        sql = "DELETE FROM CONFIG_FILTER_RULES WHERE GROUP_ID = ?"
-        MainDb().update_by_sql(sql, (groupid,))
-        sql = "DELETE FROM CONFIG_FILTER_GROUP WHERE ID = ?"
-        return MainDb().update_by_sql(sql, (groupid,))
+        with MainDb().transaction() as trans:
+            sql = "DELETE FROM CONFIG_FILTER_RULES WHERE GROUP_ID = ?"
+            MainDb().update_by_sql(sql, (groupid,))
+            sql = "DELETE FROM CONFIG_FILTER_GROUP WHERE ID = ?"
+            MainDb().update_by_sql(sql, (groupid,))
+        return trans.success
 
     @staticmethod
     def delete_filterrule(ruleid):
@@ -1993,8 +2143,10 @@ class SqlHelper:
         """
         if not wid:
             return
-        MainDb().update_by_sql("DELETE FROM CUSTOM_WORDS WHERE GROUP_ID = ?", (int(wid),))
-        return MainDb().update_by_sql("DELETE FROM CUSTOM_WORD_GROUPS WHERE ID = ?", (int(wid),))
+        with MainDb().transaction() as trans:
+            MainDb().update_by_sql("DELETE FROM CUSTOM_WORDS WHERE GROUP_ID = ?", (int(wid),))
+            MainDb().update_by_sql("DELETE FROM CUSTOM_WORD_GROUPS WHERE ID = ?", (int(wid),))
+        return trans.success
     
     @staticmethod
     def get_custom_word_groups(gid=None, tmdbid=None, wtype=None):
@@ -0,0 +1,221 @@
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import log
+from app.utils import Torrent
+from app.utils.commons import singleton
+from config import Config, TORRENT_CACHE_SIZE
+
+lock = threading.RLock()
+
+
+@singleton
+class TorrentHelper:
+    """
+    种子文件缓存，按InfoHash保存种子文件及解析出的文件清单，并记录下载链接与InfoHash的对应关系，
+    同一个种子在添加下载、解析集数等环节只需下载和解析一次，超过容量时淘汰最久未使用的种子
+    """
+    _cache_path = None
+    # {InfoHash: 种子文件大小}，按最近使用的先后排序
+    _torrents = OrderedDict()
+    # {下载链接: InfoHash}
+    _urls = {}
+    _total_size = 0
+
+    def __init__(self):
+        self.init_config()
+
+    def init_config(self):
+        self._cache_path = os.path.join(Config().get_config_path(), "torrents")
+        with lock:
+            self._torrents = OrderedDict()
+            self._urls = {}
+            self._total_size = 0
+            if not os.path.exists(self._cache_path):
+                os.makedirs(self._cache_path)
+            # 按修改时间恢复使用顺序
+            torrents = []
+            for file in os.listdir(self._cache_path):
+                infohash, ext = os.path.splitext(file)
+                if ext != ".torrent":
+                    continue
+                info = self.__read_info(infohash)
+                if not info:
+                    self.__remove_files(infohash)
+                    continue
+                file_stat = os.stat(os.path.join(self._cache_path, file))
+                torrents.append((file_stat.st_mtime, infohash, file_stat.st_size, info.get("urls") or []))
+            for _, infohash, size, urls in sorted(torrents):
+                self._torrents[infohash] = size
+                self._total_size += size
+                for url in urls:
+                    self._urls[url] = infohash
+            self.__evict()
+        self.__clean_temp_torrents()
+
+    def get_torrent_content(self, url, cookie=None, ua=None):
+        """
+        获取种子文件内容，已缓存的直接返回，否则下载后缓存
+        :param url: 种子链接
+        :param cookie: 站点Cookie
+        :param ua: 站点UserAgent
+        :return: 种子内容，错误信息
+        """
+        if not url or url.startswith("magnet:"):
+            return Torrent.get_torrent_content(url=url, cookie=cookie, ua=ua)
+        content = self.__get_content(self._urls.get(url))
+        if content:
+            return content, ""
+        content, retmsg = Torrent.get_torrent_content(url=url, cookie=cookie, ua=ua)
+        if content:
+            self.__save(url, content)
+        return content, retmsg
+
+    def get_torrent_info(self, url, cookie=None, ua=None):
+        """
+        获取种子的InfoHash、名称及文件清单，未缓存的先下载种子
+        :param url: 种子链接
+        :param cookie: 站点Cookie
+        :param ua: 站点UserAgent
+        :return: {infohash, name, size, files: [{path, size}]}，失败时返回None
+        """
+        infohash = self._urls.get(url)
+        if infohash:
+            info = self.__read_info(infohash)
+            if info:
+                self.__touch(infohash)
+                return info
+        content, retmsg = self.get_torrent_content(url=url, cookie=cookie, ua=ua)
+        if not content or isinstance(content, str):
+            if retmsg:
+                log.warn("【Torrent】%s 获取种子失败：%s" % (url, retmsg))
+            return None
+        infohash = self._urls.get(url)
+        return self.__read_info(infohash) if infohash else Torrent.get_torrent_info(content)
+
+    def get_torrent_info_by_hash(self, infohash):
+        """
+        按InfoHash查询已缓存的种子信息
+        """
+        if not infohash:
+            return None
+        infohash = infohash.lower()
+        if infohash not in self._torrents:
+            return None
+        self.__touch(infohash)
+        return self.__read_info(infohash)
+
+    def clear(self):
+        """
+        清空种子缓存
+        """
+        with lock:
+            for infohash in list(self._torrents):
+                self.__remove_files(infohash)
+            self._torrents = OrderedDict()
+            self._urls = {}
+            self._total_size = 0
+
+    def __get_content(self, infohash):
+        if not infohash or infohash not in self._torrents:
+            return None
+        try:
+            with open(os.path.join(self._cache_path, "%s.torrent" % infohash), "rb") as f:
+                content = f.read()
+        except Exception as err:
+            print(str(err))
+            self.__remove(infohash)
+            return None
+        self.__touch(infohash)
+        return content
+
+    def __save(self, url, content):
+        """
+        保存种子文件及解析结果，同一种子不同链接共用一份缓存
+        """
+        info = Torrent.get_torrent_info(content)
+        if not info:
+            return
+        infohash = info.get("infohash")
+        with lock:
+            old_info = self.__read_info(infohash) if infohash in self._torrents else None
+            info["urls"] = list(set((old_info.get("urls") if old_info else []) + [url]))
+            try:
+                if not old_info:
+                    with open(os.path.join(self._cache_path, "%s.torrent" % infohash), "wb") as f:
+                        f.write(content)
+                with open(os.path.join(self._cache_path, "%s.json" % infohash), "w", encoding="utf-8") as f:
+                    json.dump(info, f, ensure_ascii=False)
+            except Exception as err:
+                log.warn("【Torrent】保存种子缓存失败：%s" % str(err))
+                return
+            if not old_info:
+                self._torrents[infohash] = len(content)
+                self._total_size += len(content)
+            self._torrents.move_to_end(infohash)
+            self._urls[url] = infohash
+            self.__evict()
+
+    def __read_info(self, infohash):
+        try:
+            with open(os.path.join(self._cache_path, "%s.json" % infohash), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception as err:
+            print(str(err))
+            return None
+
+    def __touch(self, infohash):
+        """
+        更新使用时间，修改时间同时落盘，重启后保持淘汰顺序
+        """
+        with lock:
+            if infohash not in self._torrents:
+                return
+            self._torrents.move_to_end(infohash)
+        try:
+            os.utime(os.path.join(self._cache_path, "%s.torrent" % infohash))
+        except Exception as err:
+            print(str(err))
+
+    def __evict(self):
+        """
+        超过容量时淘汰最久未使用的种子
+        """
+        with lock:
+            while self._total_size > TORRENT_CACHE_SIZE and len(self._torrents) > 1:
+                infohash = next(iter(self._torrents))
+                self.__remove(infohash)
+
+    def __remove(self, infohash):
+        with lock:
+            self._total_size -= self._torrents.pop(infohash, 0)
+            for url in [url for url, value in self._urls.items() if value == infohash]:
+                self._urls.pop(url)
+            self.__remove_files(infohash)
+
+    def __remove_files(self, infohash):
+        for ext in [".torrent", ".json"]:
+            file_path = os.path.join(self._cache_path, "%s%s" % (infohash, ext))
+            try:
+                if os.path.exists(file_path):
+                    os.remove(file_path)
+            except Exception as err:
+                print(str(err))
+
+    @staticmethod
+    def __clean_temp_torrents():
+        """
+        清理早期版本解析集数时保存在临时目录中的种子文件
+        """
+        temp_path = os.path.join(Config().get_config_path(), "temp")
+        if not os.path.exists(temp_path):
+            return
+        for file in os.listdir(temp_path):
+            if os.path.splitext(file)[-1].lower() != ".torrent":
+                continue
+            try:
+                os.remove(os.path.join(temp_path, file))
+            except Exception as err:
+                print(str(err))
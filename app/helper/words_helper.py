@@ -12,17 +12,92 @@ class WordsHelper:
     replaced_words_noregex_info = []
     replaced_offset_words_info = []
     offset_words_info = []
+    # 自定义识别词版本，每次重新加载时变化，用于识别结果缓存失效
+    version = 0
+    # 预编译的识别词，识别词变化重新加载时生成
+    _ignored_words = None
+    _replaced_words = []
+    _replaced_offset_words = []
+    _offset_words = []
 
     def __init__(self):
         self.init_config()
 
     def init_config(self):
+        self.version += 1
         self.ignored_words_info = SqlHelper.get_custom_words(enabled=1, wtype=1, regex=1)
         self.ignored_words_noregex_info = SqlHelper.get_custom_words(enabled=1, wtype=1, regex=0)
         self.replaced_words_info = SqlHelper.get_custom_words(enabled=1, wtype=2, regex=1)
         self.replaced_words_noregex_info = SqlHelper.get_custom_words(enabled=1, wtype=2, regex=0)
         self.replaced_offset_words_info = SqlHelper.get_custom_words(enabled=1, wtype=3, regex=1)
         self.offset_words_info = SqlHelper.get_custom_words(enabled=1, wtype=4, regex=1)
+        self.__compile_words()
+
+    def __compile_words(self):
+        """
+        预编译全部识别词，编译出错的识别词在识别时返回错误信息
+        """
+        # 屏蔽词合并为一个正则
+        ignored_words = None
+        if self.ignored_words_info:
+            try:
+                ignored_words = re.compile(r'%s' % "|".join([info[1] for info in self.ignored_words_info]))
+            except Exception as err:
+                ignored_words = "【Meta】自定义屏蔽词设置有误：%s" % str(err)
+        # 替换词
+        replaced_words = []
+        for info in self.replaced_words_info:
+            replaced_words.append(self.__compile_replaced_word(info, "【Meta】自定义替换词 %s 格式有误：%s"))
+        # 替换+集偏移
+        replaced_offset_words = []
+        for info in self.replaced_offset_words_info:
+            word = self.__compile_replaced_word(info, "【Meta】自定义替换+集偏移词 %s 格式有误：%s")
+            word["offset"] = self.__compile_offset_word(front=info[3], back=info[4], offset=info[5])
+            replaced_offset_words.append(word)
+        # 集偏移
+        offset_words = []
+        for info in self.offset_words_info:
+            offset_words.append(self.__compile_offset_word(front=info[3], back=info[4], offset=info[5]))
+        self._ignored_words = ignored_words
+        self._replaced_words = replaced_words
+        self._replaced_offset_words = replaced_offset_words
+        self._offset_words = offset_words
+
+    def __compile_replaced_word(self, info, err_format):
+        """
+        编译替换词，并提取必须出现的字面量用于预先过滤
+        """
+        replaced = info[1]
+        replace = info[2]
+        word = {"replace": r'%s' % replace,
+                "word": "%s@%s" % (replaced, replace),
+                "literal": self.__get_literal(replaced),
+                "info": info,
+                "err_format": err_format}
+        try:
+            word["re"] = re.compile(r'%s' % replaced)
+        except Exception as err:
+            word["err"] = err_format % (info, str(err))
+        return word
+
+    def __compile_offset_word(self, front, back, offset):
+        """
+        编译集偏移词
+        """
+        offset_word = "%s@%s@%s" % (front, back, offset)
+        word = {"front": front,
+                "back": back,
+                "word": offset_word,
+                "front_literal": self.__get_literal(front),
+                "back_literal": self.__get_literal(back)}
+        try:
+            word["offset"] = int(offset)
+            word["front_re"] = re.compile(r'%s' % front) if front else None
+            word["back_re"] = re.compile(r'%s' % back) if back else None
+            word["episode_re"] = re.compile(r'(?<=%s[\W\w]*)[0-9]+(?=[\W\w]*%s)' % (front, back))
+        except Exception as err:
+            word["err"] = "自定义集数偏移 %s 格式有误：%s" % (offset_word, str(err))
+        return word
 
     def process(self, title):
         # 错误信息
@@ -34,96 +109,94 @@ class WordsHelper:
         # 应用集偏移
         used_offset_words = []
         # 屏蔽
-        if self.ignored_words_info:
-            try:
-                ignored_words = []
-                for ignored_word_info in self.ignored_words_info:
-                    ignored_words.append(ignored_word_info[1])
-                ignored_words = "|".join(ignored_words)
-                ignored_words = re.compile(r'%s' % ignored_words)
+        if self._ignored_words:
+            if isinstance(self._ignored_words, str):
+                msg = self._ignored_words
+            else:
                 # 去重
-                used_ignored_words = list(set(re.findall(ignored_words, title)))
+                used_ignored_words = list(set(self._ignored_words.findall(title)))
                 if used_ignored_words:
-                    title = re.sub(ignored_words, '', title)
-            except Exception as err:
-                msg = "【Meta】自定义屏蔽词设置有误：%s" % str(err)
-        if self.ignored_words_noregex_info:
+                    title = self._ignored_words.sub('', title)
+        for ignored_word_noregex_info in self.ignored_words_noregex_info:
+            ignored_word = ignored_word_noregex_info[1]
+            if ignored_word and ignored_word in title:
+                title = title.replace(ignored_word, '')
+                used_ignored_words.append(ignored_word)
+        # 替换
+        for replaced_word in self._replaced_words:
+            if replaced_word.get("err"):
+                msg = replaced_word.get("err")
+                continue
             try:
-                for ignored_word_noregex_info in self.ignored_words_noregex_info:
-                    ignored_word = ignored_word_noregex_info[1]
-                    if title.find(ignored_word) != -1:
-                        title = title.replace(ignored_word, '')
-                        used_ignored_words.append(ignored_word)
+                title = self.__replace(replaced_word, used_replaced_words, title)
             except Exception as err:
-                msg = "【Meta】自定义屏蔽词设置有误：%s" % str(err)
-        # 替换
-        if self.replaced_words_info:
-            for replaced_word_info in self.replaced_words_info:
-                try:
-                    replaced = replaced_word_info[1]
-                    replace = replaced_word_info[2]
-                    replaced_word = "%s@%s" % (replaced, replace)
-                    if re.findall(r'%s' % replaced, title):
-                        used_replaced_words.append(replaced_word)
-                        title = re.sub(r'%s' % replaced, r'%s' % replace, title)
-                except Exception as err:
-                    msg = "【Meta】自定义替换词 %s 格式有误：%s" % (replaced_word_info, str(err))
-        if self.replaced_words_noregex_info:
-            for replaced_word_noregex_info in self.replaced_words_noregex_info:
-                try:
-                    replaced = replaced_word_noregex_info[1]
-                    replace = replaced_word_noregex_info[2]
-                    replaced_word = "%s@%s" % (replaced, replace)
-                    if title.find(replaced) != -1:
-                        used_replaced_words.append(replaced_word)
-                        title = title.replace(replaced, replace)
-                except Exception as err:
-                    msg = "【Meta】自定义替换词 %s 格式有误：%s" % (replaced_word_noregex_info, str(err))
+                msg = replaced_word.get("err_format") % (replaced_word.get("info"), str(err))
+        for replaced_word_noregex_info in self.replaced_words_noregex_info:
+            replaced = replaced_word_noregex_info[1]
+            replace = replaced_word_noregex_info[2]
+            if replaced and replaced in title:
+                used_replaced_words.append("%s@%s" % (replaced, replace))
+                title = title.replace(replaced, replace or "")
         # 替换+集偏移
-        if self.replaced_offset_words_info:
-            for replaced_offset_word_info in self.replaced_offset_words_info:
-                try:
-                    replaced = replaced_offset_word_info[1]
-                    replace = replaced_offset_word_info[2]
-                    front = replaced_offset_word_info[3]
-                    back = replaced_offset_word_info[4]
-                    offset = replaced_offset_word_info[5]
-                    replaced_word = "%s@%s" % (replaced, replace)
-                    if re.findall(r'%s' % replaced, title):
-                        used_replaced_words.append(replaced_word)
-                        title = re.sub(r'%s' % replaced, r'%s' % replace, title)
-                        title, msg = self.episode_offset(front, back, offset, used_offset_words, title)
-                except Exception as err:
-                    msg = "【Meta】自定义替换+集偏移词 %s 格式有误：%s" % (replaced_offset_word_info, str(err))
+        for replaced_word in self._replaced_offset_words:
+            if replaced_word.get("err"):
+                msg = replaced_word.get("err")
+                continue
+            try:
+                replaced_count = len(used_replaced_words)
+                title = self.__replace(replaced_word, used_replaced_words, title)
+                if len(used_replaced_words) > replaced_count:
+                    title, msg = self.__episode_offset(replaced_word.get("offset"), used_offset_words, title)
+            except Exception as err:
+                msg = replaced_word.get("err_format") % (replaced_word.get("info"), str(err))
         # 集数偏移
-        if self.offset_words_info:
-            for offset_word_info in self.offset_words_info:
-                front = offset_word_info[3]
-                back = offset_word_info[4]
-                offset = offset_word_info[5]
-                title, msg = self.episode_offset(front, back, offset, used_offset_words, title)
+        for offset_word in self._offset_words:
+            title, msg = self.__episode_offset(offset_word, used_offset_words, title)
 
         return title, msg, {"ignored": used_ignored_words,
                             "replaced": used_replaced_words,
                             "offset": used_offset_words}
 
     @staticmethod
-    def episode_offset(front, back, offset, used_offset_words, title):
+    def __replace(replaced_word, used_replaced_words, title):
+        """
+        应用一个替换词，必须出现的字面量不在标题中时不再执行正则
+        """
+        if replaced_word.get("literal") and replaced_word.get("literal") not in title:
+            return title
+        if not replaced_word.get("re").search(title):
+            return title
+        used_replaced_words.append(replaced_word.get("word"))
+        return replaced_word.get("re").sub(replaced_word.get("replace"), title)
+
+    @staticmethod
+    def __episode_offset(offset_word, used_offset_words, title):
+        """
+        应用一个集偏移词
+        """
         msg = ""
-        offset_num = int(offset)
-        offset_word = "%s@%s@%s" % (front, back, offset)
+        if offset_word.get("err"):
+            return title, offset_word.get("err")
+        front = offset_word.get("front")
+        back = offset_word.get("back")
+        offset_num = offset_word.get("offset")
         try:
-            if back and not re.findall(r'%s' % back, title):
-                return title, msg
-            if front and not re.findall(r'%s' % front, title):
-                return title, msg
-            offset_word_info_re = re.compile(r'(?<=%s[\W\w]*)[0-9]+(?=[\W\w]*%s)' % (front, back))
-            episode_nums_str = re.findall(offset_word_info_re, title)
+            if back:
+                if offset_word.get("back_literal") and offset_word.get("back_literal") not in title:
+                    return title, msg
+                if not offset_word.get("back_re").search(title):
+                    return title, msg
+            if front:
+                if offset_word.get("front_literal") and offset_word.get("front_literal") not in title:
+                    return title, msg
+                if not offset_word.get("front_re").search(title):
+                    return title, msg
+            episode_nums_str = offset_word.get("episode_re").findall(title)
             if not episode_nums_str:
                 return title, msg
             episode_nums_int = [int(x) for x in episode_nums_str]
             episode_nums_dict = dict(zip(episode_nums_str, episode_nums_int))
-            used_offset_words.append(offset_word)
+            used_offset_words.append(offset_word.get("word"))
             # 集数向前偏移，集数按升序处理
             if offset_num < 0:
                 episode_nums_list = sorted(episode_nums_dict.items(), key=lambda x: x[1])
@@ -136,5 +209,74 @@ class WordsHelper:
                 title = re.sub(episode_offset_re, r'%s' % str(episode_num[1] + offset_num).zfill(2), title)
             return title, msg
         except Exception as err:
-            msg = "自定义集数偏移 %s 格式有误：%s" % (offset_word, str(err))
+            msg = "自定义集数偏移 %s 格式有误：%s" % (offset_word.get("word"), str(err))
             return title, msg
+
+    @staticmethod
+    def __get_literal(pattern):
+        """
+        提取正则中必定出现的最长字面量，用于匹配前快速过滤，无法确定时返回空
+        """
+        if not pattern:
+            return ""
+        # 含分支、内联标记、字符编码转义或嵌套字符集的不做提取
+        if "|" in pattern \
+                or "(?" in pattern \
+                or "[[" in pattern \
+                or re.search(r'\\[0-9gxuUNpP]', pattern):
+            return ""
+        literals = []
+        current = []
+        depth = 0
+        i = 0
+        length = len(pattern)
+        while i < length:
+            c = pattern[i]
+            char = None
+            if c == "\\":
+                escaped = pattern[i + 1] if i + 1 < length else ""
+                i += 2
+                if escaped and not escaped.isalnum():
+                    char = escaped
+            elif c == "[":
+                # 跳过字符集
+                i += 1
+                if i < length and pattern[i] == "^":
+                    i += 1
+                if i < length and pattern[i] == "]":
+                    i += 1
+                while i < length and pattern[i] != "]":
+                    i += 2 if pattern[i] == "\\" else 1
+                i += 1
+            elif c == "(":
+                depth += 1
+                i += 1
+            elif c == ")":
+                depth -= 1
+                i += 1
+            elif c == "{":
+                # 跳过数量限定
+                end = pattern.find("}", i)
+                i = end + 1 if end != -1 else i + 1
+            elif c in ".^$?*+":
+                i += 1
+            else:
+                char = c
+                i += 1
+            if char is None or depth > 0:
+                literals.append("".join(current))
+                current = []
+                continue
+            quantifier = pattern[i] if i < length else ""
+            if quantifier in ("?", "*", "{"):
+                # 可不出现的字符
+                literals.append("".join(current))
+                current = []
+            elif quantifier == "+":
+                current.append(char)
+                literals.append("".join(current))
+                current = []
+            else:
+                current.append(char)
+        literals.append("".join(current))
+        return max(literals, key=len)
@@ -126,7 +126,9 @@ class BuiltinIndexer(IIndexer):
             imdb_id = match_media.imdb_id if match_media else None
             result_array = Rarbg(cookies=indexer.cookie).search(keyword=search_word, indexer=indexer, imdb_id=imdb_id)
         else:
-            result_array = self.__spider_search(keyword=search_word, indexer=indexer)
+            result_array = self.__spider_search(keyword=search_word,
+                                                indexer=indexer,
+                                                timeout=self.get_search_timeout(20))
         if len(result_array) == 0:
             log.warn(f"【{self.index_type}】{indexer.name} 未检索到数据")
             self.progress.update(ptype='search', text=f"{indexer.name} 未检索到数据")
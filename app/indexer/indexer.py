@@ -1,15 +1,26 @@
 import datetime
-import xml.dom.minidom
+import threading
+import time
 from abc import ABCMeta, abstractmethod
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
 import log
+from config import SEARCH_INDEXER_THREADS, SEARCH_INDEXER_TIMEOUT, SEARCH_INDEXER_SLOW_SECONDS
 from app.filterrules import FilterRule
-from app.utils import Torrent, DomUtils, RequestUtils, StringUtils
+from app.utils import Torrent, RequestUtils, StringUtils, RssUtils
 from app.helper import ProgressHelper
 from app.media import MetaInfo, Media
 from app.utils.types import MediaType, SearchType
 
+# 所有索引器共用的检索线程池
+SEARCH_EXECUTOR = ThreadPoolExecutor(max_workers=SEARCH_INDEXER_THREADS, thread_name_prefix="indexer")
+# 各索引器最近的检索耗时
+INDEXER_LATENCY = {}
+INDEXER_LATENCY_LOCK = threading.Lock()
+# 检索线程当前任务的截止时间
+SEARCH_DEADLINE = threading.local()
+
 
 class IIndexer(metaclass=ABCMeta):
     media = None
@@ -65,13 +76,36 @@ class IIndexer(metaclass=ABCMeta):
         :param in_from: 搜索渠道
         :return: 命中的资源媒体信息列表
         """
+        ret_array = []
+        for result in self.search_by_keyword_iter(key_word=key_word,
+                                                  filter_args=filter_args,
+                                                  match_type=match_type,
+                                                  match_media=match_media,
+                                                  in_from=in_from):
+            ret_array.extend(result)
+        return ret_array
+
+    def search_by_keyword_iter(self,
+                               key_word,
+                               filter_args: dict,
+                               match_type=0,
+                               match_media=None,
+                               in_from: SearchType = None,
+                               timeout=SEARCH_INDEXER_TIMEOUT):
+        """
+        根据关键字调用 Index API 检索，每个索引器检索完成后立即返回其结果
+        关闭生成器时取消尚未开始的检索，提交后超过timeout秒（含排队时间）仍未返回的索引器不再等待，
+        排队超时的检索不再执行，执行中的检索请求超时时间也不超过截止时间
+        :param timeout: 单个索引器的检索超时时间（秒）
+        :return: 生成器，每次返回一个索引器命中的资源媒体信息列表
+        """
         if not key_word:
-            return []
+            return
 
         indexers = self.get_indexers()
         if not indexers:
             log.error(f"【{self.index_type}】没有有效的索引器配置！")
-            return []
+            return
         # 计算耗时
         start_time = datetime.datetime.now()
         if filter_args and filter_args.get("site"):
@@ -80,36 +114,115 @@ class IIndexer(metaclass=ABCMeta):
         else:
             log.info(f"【{self.index_type}】开始并行检索 %s，线程数：%s ..." % (key_word, len(indexers)))
             self.progress.update(ptype='search', text="开始并行检索 %s，线程数：%s ..." % (key_word, len(indexers)))
-        # 多线程
-        executor = ThreadPoolExecutor(max_workers=len(indexers))
-        all_task = []
+        # 检索任务的截止时间，从提交时开始计算
+        deadline = time.time() + timeout
+        all_task = {}
         for index in indexers:
             order_seq = 100 - int(index.pri)
-            task = executor.submit(self.search,
-                                   order_seq,
-                                   index,
-                                   key_word,
-                                   filter_args,
-                                   match_type,
-                                   match_media,
-                                   in_from)
-            all_task.append(task)
-        ret_array = []
+            task = SEARCH_EXECUTOR.submit(self.__timed_search,
+                                          deadline,
+                                          order_seq,
+                                          index,
+                                          key_word,
+                                          dict(filter_args or {}),
+                                          match_type,
+                                          match_media,
+                                          in_from)
+            all_task[task] = index
+        pending = set(all_task)
+        result_count = 0
         finish_count = 0
-        for future in as_completed(all_task):
-            result = future.result()
-            finish_count += 1
-            self.progress.update(ptype='search', value=round(100 * (finish_count / len(all_task))))
-            if result:
-                ret_array = ret_array + result
+        try:
+            while pending:
+                done, pending = wait(pending, timeout=1, return_when=FIRST_COMPLETED)
+                for future in done:
+                    finish_count += 1
+                    self.progress.update(ptype='search', value=round(100 * (finish_count / len(all_task))))
+                    try:
+                        result = future.result()
+                    except Exception as err:
+                        log.error(f"【{self.index_type}】{all_task[future].name} 检索出错：{err}")
+                        continue
+                    if result:
+                        result_count += len(result)
+                        yield result
+                # 超时的索引器不再等待，排队中的取消执行
+                if pending and time.time() > deadline:
+                    for future in pending:
+                        indexer = all_task[future]
+                        log.warn(f"【{self.index_type}】{indexer.name} 检索超时（{timeout}秒），已放弃等待")
+                        self.progress.update(ptype='search', text=f"{indexer.name} 检索超时")
+                        future.cancel()
+                        finish_count += 1
+                    pending = set()
+        finally:
+            # 生成器被提前关闭时，取消还未开始的检索
+            for future in pending:
+                future.cancel()
         # 计算耗时
         end_time = datetime.datetime.now()
         log.info(f"【{self.index_type}】所有站点检索完成，有效资源数：%s，总耗时 %s 秒"
-                 % (len(ret_array), (end_time - start_time).seconds))
+                 % (result_count, (end_time - start_time).seconds))
         self.progress.update(ptype='search', text="所有站点检索完成，有效资源数：%s，总耗时 %s 秒"
-                                                  % (len(ret_array), (end_time - start_time).seconds),
+                                                  % (result_count, (end_time - start_time).seconds),
                              value=100)
-        return ret_array
+
+    def __timed_search(self, deadline, order_seq, indexer, *args):
+        """
+        检索单个索引器并记录耗时，排队已超过截止时间的不再检索
+        """
+        start_time = time.time()
+        if start_time >= deadline:
+            log.warn(f"【{self.index_type}】{indexer.name} 排队超时，跳过检索")
+            return []
+        SEARCH_DEADLINE.value = deadline
+        try:
+            return self.search(order_seq, indexer, *args)
+        finally:
+            SEARCH_DEADLINE.value = None
+            self.__record_latency(indexer.name, time.time() - start_time)
+
+    @staticmethod
+    def get_search_timeout(timeout):
+        """
+        当前检索任务的请求超时时间，不超过任务的截止时间
+        :param timeout: 默认超时时间（秒）
+        """
+        deadline = getattr(SEARCH_DEADLINE, "value", None)
+        if not deadline:
+            return timeout
+        return max(1, min(timeout, int(deadline - time.time())))
+
+    @staticmethod
+    def __record_latency(indexer_name, seconds):
+        """
+        记录索引器检索耗时，最近10次平均耗时过长时提示
+        """
+        with INDEXER_LATENCY_LOCK:
+            latencies = INDEXER_LATENCY.setdefault(indexer_name, deque(maxlen=10))
+            latencies.append(seconds)
+            avg_seconds = sum(latencies) / len(latencies)
+        if len(latencies) >= 3 and avg_seconds > SEARCH_INDEXER_SLOW_SECONDS:
+            log.warn(f"【Indexer】{indexer_name} 最近{len(latencies)}次检索平均耗时 {round(avg_seconds, 1)} 秒，响应较慢")
+
+    @staticmethod
+    def get_indexer_latency():
+        """
+        获取各索引器最近的平均检索耗时及是否慢速
+        :return: {索引器名称: {"avg": 平均耗时, "count": 次数, "slow": 是否慢速}}
+        """
+        with INDEXER_LATENCY_LOCK:
+            ret = {}
+            for name, latencies in INDEXER_LATENCY.items():
+                if not latencies:
+                    continue
+                avg_seconds = sum(latencies) / len(latencies)
+                ret[name] = {
+                    "avg": round(avg_seconds, 1),
+                    "count": len(latencies),
+                    "slow": len(latencies) >= 3 and avg_seconds > SEARCH_INDEXER_SLOW_SECONDS
+                }
+            return ret
 
     @abstractmethod
     def search(self, order_seq,
@@ -160,96 +273,19 @@ class IIndexer(metaclass=ABCMeta):
         if not url:
             return []
         try:
-            ret = RequestUtils(timeout=10).get_res(url)
+            ret = RequestUtils(timeout=IIndexer.get_search_timeout(10)).get_res(url)
         except Exception as e2:
             log.console(str(e2))
             return []
         if not ret:
             return []
-        xmls = ret.text
-        if not xmls:
-            return []
-
         torrents = []
         try:
             # 解析XML
-            dom_tree = xml.dom.minidom.parseString(xmls)
-            root_node = dom_tree.documentElement
-            items = root_node.getElementsByTagName("item")
-            for item in items:
-                try:
-                    # indexer id
-                    indexer_id = DomUtils.tag_value(item, "jackettindexer", "id",
-                                                    default=DomUtils.tag_value(item, "prowlarrindexer", "id", ""))
-                    # indexer
-                    indexer = DomUtils.tag_value(item, "jackettindexer",
-                                                 default=DomUtils.tag_value(item, "prowlarrindexer", default=""))
-
-                    # 标题
-                    title = DomUtils.tag_value(item, "title", default="")
-                    if not title:
-                        continue
-                    # 种子链接
-                    enclosure = DomUtils.tag_value(item, "enclosure", "url", default="")
-                    if not enclosure:
-                        continue
-                    # 描述
-                    description = DomUtils.tag_value(item, "description", default="")
-                    # 种子大小
-                    size = DomUtils.tag_value(item, "size", default=0)
-                    # 种子页面
-                    page_url = DomUtils.tag_value(item, "comments", default="")
-
-                    # 做种数
-                    seeders = 0
-                    # 下载数
-                    peers = 0
-                    # 是否免费
-                    freeleech = False
-                    # 下载因子
-                    downloadvolumefactor = 1.0
-                    # 上传因子
-                    uploadvolumefactor = 1.0
-                    # imdbid
-                    imdbid = ""
-
-                    torznab_attrs = item.getElementsByTagName("torznab:attr")
-                    for torznab_attr in torznab_attrs:
-                        name = torznab_attr.getAttribute('name')
-                        value = torznab_attr.getAttribute('value')
-                        if name == "seeders":
-                            seeders = value
-                        if name == "peers":
-                            peers = value
-                        if name == "downloadvolumefactor":
-                            downloadvolumefactor = value
-                            if float(downloadvolumefactor) == 0:
-                                freeleech = True
-                        if name == "uploadvolumefactor":
-                            uploadvolumefactor = value
-                        if name == "imdbid":
-                            imdbid = value
-
-                    tmp_dict = {'indexer_id': indexer_id,
-                                'indexer': indexer,
-                                'title': title,
-                                'enclosure': enclosure,
-                                'description': description,
-                                'size': size,
-                                'seeders': seeders,
-                                'peers': peers,
-                                'freeleech': freeleech,
-                                'downloadvolumefactor': downloadvolumefactor,
-                                'uploadvolumefactor': uploadvolumefactor,
-                                'page_url': page_url,
-                                'imdbid': imdbid}
-                    torrents.append(tmp_dict)
-                except Exception as e:
-                    print(f"{e}")
-                    continue
+            for item in RssUtils.parse_torznab_items(RssUtils.get_xml_content(ret)):
+                torrents.append(item)
         except Exception as e2:
             print(f"{e2}")
-            pass
 
         return torrents
 
@@ -3,6 +3,7 @@ import os
 import random
 import re
 import traceback
+from concurrent.futures import ThreadPoolExecutor
 from functools import lru_cache
 
 import zhconv
@@ -13,7 +14,7 @@ from app.media import MetaInfo
 from app.utils import PathUtils, EpisodeFormat, RequestUtils, NumberUtils, StringUtils
 from config import Config, KEYWORD_BLACKLIST, KEYWORD_SEARCH_WEIGHT_3, KEYWORD_SEARCH_WEIGHT_2, KEYWORD_SEARCH_WEIGHT_1, \
     KEYWORD_STR_SIMILARITY_THRESHOLD, KEYWORD_DIFF_SCORE_THRESHOLD, TMDB_IMAGE_ORIGINAL_URL, RMT_MEDIAEXT, \
-    DEFAULT_TMDB_PROXY
+    DEFAULT_TMDB_PROXY, MEDIA_SEARCH_THREADS
 from app.helper import MetaHelper
 from app.media.tmdbv3api import TMDb, Search, Movie, TV, Person, Find
 from app.media.tmdbv3api.exceptions import TMDbException
@@ -21,6 +22,9 @@ from app.media.doubanv2api import DoubanApi
 from app.utils.cache_manager import cacheman
 from app.utils.types import MediaType, MatchMode
 
+# 文件识别时并发查询TMDB的线程池
+MEDIA_SEARCH_EXECUTOR = ThreadPoolExecutor(max_workers=MEDIA_SEARCH_THREADS, thread_name_prefix="media_search")
+
 
 class Media:
     # TheMovieDB
@@ -215,7 +219,7 @@ class Media:
         except Exception as e:
             log.error(f"【Meta】连接TMDB出错：{str(e)}")
             return None
-        log.debug(f"【Meta】API返回：{str(self.search.total_results)}")
+        log.debug(f"【Meta】API返回：{str(movies.total_results)}")
         if len(movies) == 0:
             log.debug(f"【Meta】{file_media_name} 未找到相关电影信息!")
             return None
@@ -274,7 +278,7 @@ class Media:
         except Exception as e:
             log.error(f"【Meta】连接TMDB出错：{str(e)}")
             return None
-        log.debug(f"【Meta】API返回：{str(self.search.total_results)}")
+        log.debug(f"【Meta】API返回：{str(tvs.total_results)}")
         if len(tvs) == 0:
             log.debug(f"【Meta】{file_media_name} 未找到相关剧集信息!")
             return None
@@ -373,14 +377,14 @@ class Media:
         :return: 匹配的媒体信息
         """
         try:
-            multis = self.search.multi({"query": file_media_name}) or []
+            multis = self.search.multi({"query": file_media_name})
         except TMDbException as err:
             log.error(f"【Meta】连接TMDB出错：{str(err)}")
             return None
         except Exception as e:
             log.error(f"【Meta】连接TMDB出错：{str(e)}")
             return None
-        log.debug(f"【Meta】API返回：{str(self.search.total_results)}")
+        log.debug(f"【Meta】API返回：{str(multis.total_results)}")
         if len(multis) == 0:
             log.debug(f"【Meta】{file_media_name} 未找到相关媒体息!")
             return None
@@ -704,6 +708,12 @@ class Media:
         # 不是list的转为list
         if not isinstance(file_list, list):
             file_list = [file_list]
+        # 同一目录下的文件共用上级目录的识别结果
+        parent_infos = {}
+        # 需要识别的文件：[(文件路径, MetaInfo, media_key)]
+        file_metas = []
+        # 缓存中没有的media_key，每个只查询一次
+        search_metas = {}
         # 遍历每个文件，看得出来的名称是不是不一样，不一样的先搜索媒体信息
         for file_path in file_list:
             try:
@@ -713,25 +723,13 @@ class Media:
                 # 解析媒体名称
                 # 先用自己的名称
                 file_name = os.path.basename(file_path)
-                parent_name = os.path.basename(os.path.dirname(file_path))
-                parent_parent_name = os.path.basename(PathUtils.get_parent_paths(file_path, 2))
                 # 没有自带TMDB信息
                 if not tmdb_info:
                     # 识别
                     meta_info = MetaInfo(title=file_name)
                     # 识别不到则使用上级的名称
                     if not meta_info.get_name() or not meta_info.year:
-                        parent_info = MetaInfo(parent_name)
-                        if not parent_info.get_name() or not parent_info.year:
-                            parent_parent_info = MetaInfo(parent_parent_name)
-                            parent_info.type = parent_parent_info.type if parent_parent_info.type and parent_info.type != MediaType.TV else parent_info.type
-                            parent_info.cn_name = parent_parent_info.cn_name if parent_parent_info.cn_name else parent_info.cn_name
-                            parent_info.en_name = parent_parent_info.en_name if parent_parent_info.en_name else parent_info.en_name
-                            parent_info.year = parent_parent_info.year if parent_parent_info.year else parent_info.year
-                            parent_info.begin_season = NumberUtils.max_ele(parent_info.begin_season,
-                                                                           parent_parent_info.begin_season)
-                            parent_info.end_season = NumberUtils.max_ele(parent_info.end_season,
-                                                                         parent_parent_info.end_season)
+                        parent_info = self.__get_parent_meta_info(file_path, parent_infos)
                         if not meta_info.get_name():
                             meta_info.cn_name = parent_info.cn_name
                             meta_info.en_name = parent_info.en_name
@@ -749,52 +747,9 @@ class Media:
                         continue
                     media_key = "[%s]%s-%s-%s" % (
                         meta_info.type.value, meta_info.get_name(), meta_info.year, meta_info.begin_season)
-                    if not self.meta.get_meta_data_by_key(media_key):
-                        # 调用TMDB API
-                        file_media_info = self.__search_tmdb(file_media_name=meta_info.get_name(),
-                                                             first_media_year=meta_info.year,
-                                                             search_type=meta_info.type,
-                                                             media_year=meta_info.year,
-                                                             season_number=meta_info.begin_season)
-                        if not file_media_info:
-                            if self.__rmt_match_mode == MatchMode.NORMAL:
-                                # 去掉年份再查一次，有可能是年份错误
-                                file_media_info = self.__search_tmdb(file_media_name=meta_info.get_name(),
-                                                                     search_type=meta_info.type)
-                        if not file_media_info:
-                            # 从网站查询
-                            file_media_info = self.__search_tmdb_web(file_media_name=meta_info.get_name(),
-                                                                     mtype=meta_info.type)
-                        if not file_media_info and self.__search_keyword:
-                            cache_name = cacheman["tmdb_supply"].get(meta_info.get_name())
-                            is_movie = False
-                            if not cache_name:
-                                cache_name, is_movie = self.__search_engine(meta_info.get_name())
-                                cacheman["tmdb_supply"].set(meta_info.get_name(), cache_name)
-                            if cache_name:
-                                log.info("【Meta】开始辅助查询：%s ..." % cache_name)
-                                if is_movie:
-                                    file_media_info = self.__search_tmdb(file_media_name=cache_name,
-                                                                         search_type=MediaType.MOVIE)
-                                else:
-                                    file_media_info = self.__search_multi_tmdb(file_media_name=cache_name)
-                        if file_media_info:
-                            # 加入缓存
-                            self.meta.update_meta_data({media_key: file_media_info})
-                        else:
-                            # 标记为未找到避免再次查询
-                            self.meta.update_meta_data({media_key: {'id': 0}})
-                    # 查找中文名
-                    cache_title = self.meta.get_cache_title(key=media_key)
-                    if cache_title and chinese and not StringUtils.is_chinese(
-                            cache_title) and self.tmdb.language == 'zh-CN':
-                        cache_media_info = self.meta.get_meta_data_by_key(media_key)
-                        cn_title = self.__get_tmdb_chinese_title(mtype=cache_media_info.get("media_type"),
-                                                                 tmdbid=cache_media_info.get("id"))
-                        if cn_title and cn_title != cache_title:
-                            self.meta.set_cache_title(key=media_key, cn_title=cn_title)
-                    # 存入结果清单返回
-                    meta_info.set_tmdb_info(self.meta.get_meta_data_by_key(media_key))
+                    if media_key not in search_metas and not self.meta.get_meta_data_by_key(media_key):
+                        search_metas[media_key] = meta_info
+                    file_metas.append((file_path, meta_info, media_key))
                 # 自带TMDB信息
                 else:
                     meta_info = MetaInfo(title=file_name, mtype=media_type)
@@ -807,12 +762,119 @@ class Media:
                             meta_info.begin_episode = begin_ep
                         if end_ep is not None:
                             meta_info.end_episode = end_ep
-                return_media_infos[file_path] = meta_info
+                    return_media_infos[file_path] = meta_info
             except Exception as err:
                 log.error("【RMT】发生错误：%s - %s" % (str(err), traceback.format_exc()))
         # 循环结束
+        if not file_metas:
+            return return_media_infos
+        # 并发查询缓存中没有的媒体信息
+        self.__search_tmdb_on_keys(search_metas)
+        # 查找中文名，每个media_key只查一次
+        media_infos = {}
+        for media_key in set(item[2] for item in file_metas):
+            try:
+                cache_title = self.meta.get_cache_title(key=media_key)
+                if cache_title and chinese and not StringUtils.is_chinese(
+                        cache_title) and self.tmdb.language == 'zh-CN':
+                    cache_media_info = self.meta.get_meta_data_by_key(media_key)
+                    cn_title = self.__get_tmdb_chinese_title(mtype=cache_media_info.get("media_type"),
+                                                             tmdbid=cache_media_info.get("id"))
+                    if cn_title and cn_title != cache_title:
+                        self.meta.set_cache_title(key=media_key, cn_title=cn_title)
+            except Exception as err:
+                log.error("【RMT】发生错误：%s - %s" % (str(err), traceback.format_exc()))
+            media_infos[media_key] = self.meta.get_meta_data_by_key(media_key)
+        # 存入结果清单返回，保持文件清单的顺序
+        for file_path, meta_info, media_key in file_metas:
+            try:
+                meta_info.set_tmdb_info(media_infos.get(media_key))
+                return_media_infos[file_path] = meta_info
+            except Exception as err:
+                log.error("【RMT】发生错误：%s - %s" % (str(err), traceback.format_exc()))
         return return_media_infos
 
+    @staticmethod
+    def __get_parent_meta_info(file_path, parent_infos):
+        """
+        识别文件上级及上上级目录名称，同一目录只识别一次
+        :param file_path: 文件路径
+        :param parent_infos: 已识别的目录缓存
+        """
+        parent_path = os.path.dirname(file_path)
+        if parent_path in parent_infos:
+            return parent_infos[parent_path]
+        parent_info = MetaInfo(os.path.basename(parent_path))
+        if not parent_info.get_name() or not parent_info.year:
+            parent_parent_info = MetaInfo(os.path.basename(PathUtils.get_parent_paths(file_path, 2)))
+            parent_info.type = parent_parent_info.type if parent_parent_info.type and parent_info.type != MediaType.TV else parent_info.type
+            parent_info.cn_name = parent_parent_info.cn_name if parent_parent_info.cn_name else parent_info.cn_name
+            parent_info.en_name = parent_parent_info.en_name if parent_parent_info.en_name else parent_info.en_name
+            parent_info.year = parent_parent_info.year if parent_parent_info.year else parent_info.year
+            parent_info.begin_season = NumberUtils.max_ele(parent_info.begin_season,
+                                                           parent_parent_info.begin_season)
+            parent_info.end_season = NumberUtils.max_ele(parent_info.end_season,
+                                                         parent_parent_info.end_season)
+        parent_infos[parent_path] = parent_info
+        return parent_info
+
+    def __search_tmdb_on_keys(self, search_metas):
+        """
+        按media_key并发查询TMDB，结果写入缓存，TMDB客户端不支持多线程时逐个查询
+        :param search_metas: {media_key: MetaInfo}
+        """
+        if not search_metas:
+            return
+        if len(search_metas) == 1 or not getattr(self.tmdb, "THREAD_SAFE", False):
+            results = [self.__search_tmdb_on_meta(meta_info) for meta_info in search_metas.values()]
+        else:
+            results = list(MEDIA_SEARCH_EXECUTOR.map(self.__search_tmdb_on_meta, search_metas.values()))
+        for media_key, file_media_info in zip(search_metas.keys(), results):
+            if file_media_info:
+                # 加入缓存
+                self.meta.update_meta_data({media_key: file_media_info})
+            else:
+                # 标记为未找到避免再次查询
+                self.meta.update_meta_data({media_key: {'id': 0}})
+
+    def __search_tmdb_on_meta(self, meta_info):
+        """
+        按识别出的名称、年份、季查询TMDB，依次尝试去掉年份、网站查询及辅助查询
+        """
+        try:
+            # 调用TMDB API
+            file_media_info = self.__search_tmdb(file_media_name=meta_info.get_name(),
+                                                 first_media_year=meta_info.year,
+                                                 search_type=meta_info.type,
+                                                 media_year=meta_info.year,
+                                                 season_number=meta_info.begin_season)
+            if not file_media_info:
+                if self.__rmt_match_mode == MatchMode.NORMAL:
+                    # 去掉年份再查一次，有可能是年份错误
+                    file_media_info = self.__search_tmdb(file_media_name=meta_info.get_name(),
+                                                         search_type=meta_info.type)
+            if not file_media_info:
+                # 从网站查询
+                file_media_info = self.__search_tmdb_web(file_media_name=meta_info.get_name(),
+                                                         mtype=meta_info.type)
+            if not file_media_info and self.__search_keyword:
+                cache_name = cacheman["tmdb_supply"].get(meta_info.get_name())
+                is_movie = False
+                if not cache_name:
+                    cache_name, is_movie = self.__search_engine(meta_info.get_name())
+                    cacheman["tmdb_supply"].set(meta_info.get_name(), cache_name)
+                if cache_name:
+                    log.info("【Meta】开始辅助查询：%s ..." % cache_name)
+                    if is_movie:
+                        file_media_info = self.__search_tmdb(file_media_name=cache_name,
+                                                             search_type=MediaType.MOVIE)
+                    else:
+                        file_media_info = self.__search_multi_tmdb(file_media_name=cache_name)
+            return file_media_info
+        except Exception as err:
+            log.error("【RMT】发生错误：%s - %s" % (str(err), traceback.format_exc()))
+            return None
+
     def get_tmdb_hot_movies(self, page):
         """
         获取热门电影
@@ -1,23 +1,82 @@
+import copy
 import os.path
+import threading
+from collections import OrderedDict
+
 import regex as re
 
 import log
 from app.helper.words_helper import WordsHelper
+from app.media.meta import release_groups
 from app.media.meta.metaanime import MetaAnime
 from app.media.meta.metavideo import MetaVideo
 from app.utils.types import MediaType
-from config import RMT_MEDIAEXT
+from config import RMT_MEDIAEXT, META_PARSE_CACHE_SIZE
+
+# 名称识别结果缓存：{(标题, 副标题, 类型, 自定义识别词版本, 制作组版本): MetaAnime/MetaVideo}
+META_PARSE_CACHE = OrderedDict()
+META_PARSE_CACHE_STATS = {"hits": 0, "misses": 0}
+lock = threading.Lock()
 
 
 def MetaInfo(title, subtitle=None, mtype=None):
     """
-    媒体整理入口，根据名称和副标题，判断是哪种类型的识别，返回对应对象
+    媒体整理入口，根据名称和副标题，判断是哪种类型的识别，返回对应对象，
+    同样的名称只识别一次，之后返回缓存结果的副本，自定义识别词或制作组变化后缓存失效
     :param title: 标题、种子名、文件名
     :param subtitle: 副标题、描述
     :param mtype: 指定识别类型，为空则自动识别类型
     :return: MetaAnime、MetaVideo
     """
+    cache_key = (title, subtitle, mtype, WordsHelper().version, release_groups.version)
+    with lock:
+        meta_info = META_PARSE_CACHE.get(cache_key)
+        if meta_info:
+            META_PARSE_CACHE.move_to_end(cache_key)
+            META_PARSE_CACHE_STATS["hits"] += 1
+        else:
+            META_PARSE_CACHE_STATS["misses"] += 1
+    if meta_info:
+        return __copy_meta_info(meta_info)
+
+    meta_info = __parse_meta_info(title, subtitle, mtype)
+
+    with lock:
+        META_PARSE_CACHE[cache_key] = meta_info
+        while len(META_PARSE_CACHE) > META_PARSE_CACHE_SIZE:
+            META_PARSE_CACHE.popitem(last=False)
+    return __copy_meta_info(meta_info)
+
+
+def get_meta_cache_info():
+    """
+    返回名称识别缓存的命中情况
+    """
+    with lock:
+        hits = META_PARSE_CACHE_STATS.get("hits")
+        misses = META_PARSE_CACHE_STATS.get("misses")
+        return {"hits": hits,
+                "misses": misses,
+                "hit_rate": round(hits / (hits + misses), 4) if hits + misses else 0,
+                "size": len(META_PARSE_CACHE),
+                "maxsize": META_PARSE_CACHE_SIZE}
 
+
+def __copy_meta_info(meta_info):
+    """
+    复制识别结果，列表及字典属性单独复制，避免调用方修改影响缓存
+    """
+    new_meta_info = copy.copy(meta_info)
+    for key, value in vars(meta_info).items():
+        if isinstance(value, (list, dict, set)):
+            setattr(new_meta_info, key, copy.copy(value))
+    return new_meta_info
+
+
+def __parse_meta_info(title, subtitle=None, mtype=None):
+    """
+    识别名称，返回MetaAnime或MetaVideo对象
+    """
     # 应用自定义识别词
     title, msg, used_info = WordsHelper().process(title)
     if msg:
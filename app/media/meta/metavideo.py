@@ -6,7 +6,7 @@ from app.media.meta.metabase import MetaBase
 from app.utils import StringUtils
 from app.utils.tokens import Tokens
 from app.utils.types import MediaType
-from app.media.meta.release_groups import release_groups, rg_match
+from app.media.meta.release_groups import rg_match
 
 
 class MetaVideo(MetaBase):
@@ -113,7 +113,7 @@ class MetaVideo(MetaBase):
         if self.part and self.part.upper() == "PART":
             self.part = None
         # 制作组/字幕组
-        self.resource_team = rg_match(title + " ", release_groups)
+        self.resource_team = rg_match(title + " ")
 
     def __fix_name(self, name):
         if not name:
@@ -1,4 +1,19 @@
 import re
+import threading
+
+import log
+
+from config import Config
+
+#  按首字符分组需要解析正则，不可用时所有制作组放入每个分组，匹配结果不变
+try:
+    from re import _constants as sre_constants, _parser as sre_parse
+except ImportError:
+    try:
+        import sre_constants
+        import sre_parse
+    except ImportError:
+        sre_constants = sre_parse = None
 
 #  官组
 rg_0ff = ['FF(?:(?:A|WE)B|CD|E(?:DU|B)|TV)']
@@ -122,13 +137,171 @@ sites = [rg_0ff,
          rg_anime]
 
 #  正则 '[-@[]制作组名'，一般制作组前面会有'-'或者'@'或者'['
-release_groups = []
-for site in sites:
-    for release_group in site:
-        release_groups.append(release_group)
-release_groups = '|'.join(release_groups)
-release_groups = re.compile(r"(?<=[-@\[￡])(?:%s)(?=[@.\s\]\[])" % release_groups, re.I)
-
-#  忽略大小写
-def rg_match(name, groups):
-    return '@'.join(re.findall(groups, name))
+RG_PREFIX = r"[-@\[￡]"
+RG_SUFFIX = r"(?=[@.\s\]\[])"
+#  运行时登记的自定义制作组及配置文件中的自定义制作组
+custom_groups = []
+config_groups = []
+#  制作组版本号，制作组变化时加1，用于识别结果缓存失效
+version = 0
+lock = threading.Lock()
+ASCII_CHARS = [chr(i) for i in range(128)]
+
+
+def _first_chars(items):
+    """
+    计算正则可能的首字符集合（小写），无法确定时返回None
+    :return: 首字符集合，是否可以为空
+    """
+    chars = set()
+    for op, av in items:
+        if op == sre_constants.LITERAL:
+            return chars | {chr(av).lower()}, False
+        elif op == sre_constants.IN:
+            for in_op, in_av in av:
+                if in_op == sre_constants.LITERAL:
+                    chars.add(chr(in_av).lower())
+                elif in_op == sre_constants.RANGE and in_av[1] - in_av[0] < 128:
+                    chars |= {chr(c).lower() for c in range(in_av[0], in_av[1] + 1)}
+                else:
+                    return None, False
+            return chars, False
+        elif op == sre_constants.SUBPATTERN:
+            sub_chars, nullable = _first_chars(av[-1])
+        elif op == sre_constants.BRANCH:
+            sub_chars, nullable = set(), False
+            for branch in av[1]:
+                branch_chars, branch_nullable = _first_chars(branch)
+                if branch_chars is None:
+                    return None, False
+                sub_chars |= branch_chars
+                nullable = nullable or branch_nullable
+        elif op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT):
+            sub_chars, nullable = _first_chars(av[2])
+            nullable = nullable or av[0] == 0
+        else:
+            return None, False
+        if sub_chars is None:
+            return None, False
+        chars |= sub_chars
+        if not nullable:
+            return chars, False
+    return chars, True
+
+
+def _compile_groups():
+    groups = []
+    for site in sites + [custom_groups, config_groups]:
+        for release_group in site:
+            groups.append(release_group)
+    #  按首字符分组，只用可能以该字符开头的制作组匹配，保持原有先后顺序
+    buckets = {}
+    for group in groups:
+        try:
+            chars, nullable = _first_chars(sre_parse.parse(group, re.I))
+        except Exception:
+            chars, nullable = None, False
+        if chars is None or nullable:
+            ascii_chars = ASCII_CHARS
+        else:
+            #  忽略大小写时部分非ASCII字符也能匹配ASCII字符
+            ascii_chars = set()
+            for char in chars:
+                if char.isascii():
+                    ascii_chars.add(char)
+                else:
+                    ascii_chars |= {c for c in ASCII_CHARS if re.fullmatch(re.escape(char), c, re.I)}
+        for char in ascii_chars:
+            buckets.setdefault(char.lower(), []).append(group)
+    groups = '|'.join(groups)
+    #  忽略大小写
+    return (re.compile(r"(?<=%s)(?:%s)%s" % (RG_PREFIX, groups, RG_SUFFIX), re.I),
+            re.compile(r"(?:%s)%s" % (groups, RG_SUFFIX), re.I),
+            {char: re.compile(r"(?:%s)%s" % ('|'.join(items), RG_SUFFIX), re.I) for char, items in buckets.items()})
+
+
+#  完整正则，只在分隔符之后尝试匹配的锚定正则，及按首字符分组的锚定正则
+release_groups, release_groups_anchored, release_groups_buckets = _compile_groups()
+rg_prefix_re = re.compile(RG_PREFIX)
+
+
+def __recompile():
+    """
+    重新编译匹配正则并更新版本号，调用方需持有锁
+    """
+    global release_groups, release_groups_anchored, release_groups_buckets, version
+    release_groups, release_groups_anchored, release_groups_buckets = _compile_groups()
+    version += 1
+
+
+def register_release_groups(groups):
+    """
+    登记自定义制作组/字幕组，重新编译匹配正则
+    :param groups: 制作组正则列表
+    """
+    if not groups:
+        return
+    if not isinstance(groups, list):
+        groups = [groups]
+    with lock:
+        for group in groups:
+            if group and group not in custom_groups:
+                re.compile(group)
+                custom_groups.append(group)
+        __recompile()
+
+
+def init_release_groups():
+    """
+    加载配置文件中的自定义制作组/字幕组，替换之前从配置文件加载的制作组
+    """
+    groups = []
+    for group in str(Config().get_config('media').get('release_groups') or '').split(';'):
+        group = group.strip()
+        if not group or group in groups:
+            continue
+        try:
+            re.compile(group)
+        except re.error as err:
+            log.error("【Meta】自定义制作组 %s 正则格式错误：%s" % (group, str(err)))
+            continue
+        groups.append(group)
+    with lock:
+        if groups == config_groups:
+            return
+        config_groups[:] = groups
+        __recompile()
+
+
+init_release_groups()
+
+
+def rg_match(name, groups=None):
+    """
+    匹配制作组/字幕组，多个时用@连接
+    制作组一定紧跟在分隔符之后，只在分隔符位置按下一个字符选出可能的制作组尝试一次锚定匹配，不再逐字符扫描整个名称
+    :param name: 名称
+    :param groups: 自定义匹配正则，为空时使用内置及已登记的制作组
+    """
+    if groups is not None and groups is not release_groups:
+        return '@'.join(re.findall(groups, name))
+    anchored = release_groups_anchored
+    buckets = release_groups_buckets
+    matches = []
+    end = 0
+    for prefix in rg_prefix_re.finditer(name):
+        pos = prefix.end()
+        if pos < end or pos >= len(name):
+            continue
+        char = name[pos]
+        if char.isascii():
+            pattern = buckets.get(char.lower())
+            if not pattern:
+                continue
+        else:
+            pattern = anchored
+        match = pattern.match(name, pos)
+        if match:
+            matches.append(match.group())
+            end = match.end()
+    return '@'.join(matches)
@@ -82,3 +82,15 @@ class AsObj:
 
     def values(self):
         return self.__dict__.values()
+
+
+class AsObjList(list):
+    """
+    List of results from a paged call, with the pagination of that call.
+    """
+
+    def __init__(self, items=None, page=None, total_pages=None, total_results=None):
+        super().__init__(items or [])
+        self.page = page
+        self.total_pages = total_pages
+        self.total_results = total_results
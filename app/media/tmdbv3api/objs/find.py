@@ -8,6 +8,6 @@ class Find(TMDb):
     }
 
     def find_by_imdbid(self, imdbid):
-        return self._call(
+        return AsObj(**self._call(
                 self._urls["find"] % imdbid,
-                "external_source=imdb_id")
+                "external_source=imdb_id"))
@@ -1,58 +1,202 @@
 # -*- coding: utf-8 -*-
 
 import logging
-import os
+import threading
 import time
-from functools import lru_cache
+from collections import OrderedDict
 
 import requests
 import requests.exceptions
+from requests.adapters import HTTPAdapter
 
-from .as_obj import AsObj
+from .as_obj import AsObj, AsObjList
 from .exceptions import TMDbException
 
 logger = logging.getLogger(__name__)
 
 
+class _JsonCache(object):
+    """
+    Thread-safe LRU cache of decoded JSON responses, bounded by total response bytes and expired by TTL.
+    Cached values are shared between callers and must not be modified.
+    """
+
+    def __init__(self, max_bytes, ttl):
+        self._lock = threading.Lock()
+        self._items = OrderedDict()
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                self._misses += 1
+                return None
+            expire, size, value = item
+            if expire < time.time():
+                self._bytes -= size
+                self._items.pop(key)
+                self._misses += 1
+                return None
+            self._items.move_to_end(key)
+            self._hits += 1
+            return value
+
+    def set(self, key, value, size):
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old:
+                self._bytes -= old[1]
+            self._items[key] = (time.time() + self.ttl, size, value)
+            self._bytes += size
+            while self._bytes > self.max_bytes and self._items:
+                _, (_, old_size, _) = self._items.popitem(last=False)
+                self._bytes -= old_size
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._bytes = 0
+            self._hits = 0
+            self._misses = 0
+
+    def info(self):
+        with self._lock:
+            return {"hits": self._hits, "misses": self._misses, "items": len(self._items), "bytes": self._bytes}
+
+
+class _TokenBucket(object):
+    """
+    Client side rate limiter, the bucket size and remaining tokens follow the X-RateLimit-* headers when present.
+    """
+
+    def __init__(self, capacity, period):
+        self._lock = threading.Lock()
+        self._capacity = capacity
+        self._period = period
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._blocked_until = 0
+
+    def acquire(self, wait=True):
+        """
+        Take one token, sleeping until one is available, or raise TMDbException when wait is False.
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self._capacity,
+                                   self._tokens + (now - self._updated) * self._capacity / self._period)
+                self._updated = now
+                sleep_time = self._blocked_until - time.time()
+                if sleep_time <= 0:
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return
+                    sleep_time = (1 - self._tokens) * self._period / self._capacity
+            if not wait:
+                raise TMDbException("Rate limit reached. Try again in %d seconds." % sleep_time)
+            logger.warning("Rate limit reached. Sleeping for: %.1f" % sleep_time)
+            time.sleep(sleep_time)
+
+    def update(self, headers):
+        with self._lock:
+            try:
+                if "X-RateLimit-Limit" in headers:
+                    self._capacity = max(1, int(headers["X-RateLimit-Limit"]))
+                if "X-RateLimit-Remaining" in headers:
+                    remaining = int(headers["X-RateLimit-Remaining"])
+                    self._tokens = min(self._tokens, remaining)
+                    if remaining < 1 and "X-RateLimit-Reset" in headers:
+                        self._blocked_until = int(headers["X-RateLimit-Reset"])
+            except ValueError:
+                pass
+
+    def block(self, seconds):
+        with self._lock:
+            self._tokens = 0
+            self._blocked_until = max(self._blocked_until, time.time() + seconds)
+
+
 class TMDb(object):
-    TMDB_API_KEY = "TMDB_API_KEY"
-    TMDB_LANGUAGE = "TMDB_LANGUAGE"
-    TMDB_WAIT_ON_RATE_LIMIT = "TMDB_WAIT_ON_RATE_LIMIT"
-    TMDB_DEBUG_ENABLED = "TMDB_DEBUG_ENABLED"
-    TMDB_CACHE_ENABLED = "TMDB_CACHE_ENABLED"
-    TMDB_PROXIES = "TMDB_PROXIES"
-    TMDB_DOMAIN = "TMDB_DOMAIN"
-    REQUEST_CACHE_MAXSIZE = 128
+    REQUEST_CACHE_MAXBYTES = 64 * 1024 * 1024
+    REQUEST_CACHE_TTL = 3600
+    REQUEST_POOL_SIZE = 20
+    REQUEST_TIMEOUT = 10
+    REQUEST_RETRIES = 3
+    RATE_LIMIT = 40
+    RATE_LIMIT_PERIOD = 1
+    # Language and paging state are kept per thread, so instances can be used from worker threads
+    THREAD_SAFE = True
+
+    # Settings are shared by all instances (Search, Movie, TV...), the language is also kept per thread
+    _settings = {
+        "api_key": None,
+        "language": "en-US",
+        "wait_on_rate_limit": True,
+        "debug": False,
+        "cache": True,
+        "proxies": None,
+        "domain": None,
+    }
+    _local = threading.local()
+    _session = None
+    _session_lock = threading.Lock()
+    _cache = _JsonCache(REQUEST_CACHE_MAXBYTES, REQUEST_CACHE_TTL)
+    _limiter = _TokenBucket(RATE_LIMIT, RATE_LIMIT_PERIOD)
 
     def __init__(self, obj_cached=True, session=None):
-        self._session = requests.Session() if session is None else session
-        self._remaining = 40
-        self._reset = None
+        self._own_session = session
         self.obj_cached = obj_cached
-        if os.environ.get(self.TMDB_LANGUAGE) is None:
-            os.environ[self.TMDB_LANGUAGE] = "en-US"
-        if not os.environ.get(self.TMDB_DOMAIN):
-            os.environ[self.TMDB_DOMAIN] = "https://api.themoviedb.org/3"
+
+    @property
+    def session(self):
+        """
+        Keep-alive session shared by all instances unless one was passed in.
+        """
+        if self._own_session is not None:
+            return self._own_session
+        with self._session_lock:
+            if TMDb._session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=self.REQUEST_POOL_SIZE, pool_maxsize=self.REQUEST_POOL_SIZE)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                TMDb._session = session
+            return TMDb._session
 
     @property
     def page(self):
-        return os.environ["page"]
+        """
+        Page of the last paged call made by the current thread.
+        """
+        return getattr(self._local, "page", None)
 
     @property
     def total_results(self):
-        return os.environ["total_results"]
+        return getattr(self._local, "total_results", None)
 
     @property
     def total_pages(self):
-        return os.environ["total_pages"]
+        return getattr(self._local, "total_pages", None)
 
     @property
     def api_key(self):
-        return os.environ.get(self.TMDB_API_KEY)
+        return self._settings.get("api_key")
+
+    @api_key.setter
+    def api_key(self, api_key):
+        self._settings["api_key"] = str(api_key)
 
     @property
     def domain(self):
-        return os.environ.get(self.TMDB_DOMAIN)
+        return self._settings.get("domain") or "https://api.themoviedb.org/3"
 
     @domain.setter
     def domain(self, domain):
@@ -61,71 +205,52 @@ class TMDb(object):
                 domain = "https://%s" % domain
             if not str(domain).endswith('/3'):
                 domain = "%s/3" % domain
-            os.environ[self.TMDB_DOMAIN] = str(domain)
+            self._settings["domain"] = str(domain)
         else:
-            os.environ[self.TMDB_DOMAIN] = ''
+            self._settings["domain"] = ''
 
     @property
     def proxies(self):
-        return os.environ.get(self.TMDB_PROXIES)
+        return self._settings.get("proxies")
 
     @proxies.setter
     def proxies(self, proxies):
         if proxies:
-            proxies_strs = []
-            for key, value in proxies.items():
-                if not value:
-                    continue
-                proxies_strs.append("'%s': '%s'" % (key, value))
-            if proxies_strs:
-                os.environ[self.TMDB_PROXIES] = "{%s}" % ",".join(proxies_strs)
-            else:
-                os.environ[self.TMDB_PROXIES] = 'None'
-
-    @api_key.setter
-    def api_key(self, api_key):
-        os.environ[self.TMDB_API_KEY] = str(api_key)
+            proxies = {key: value for key, value in proxies.items() if value}
+        self._settings["proxies"] = proxies or None
 
     @property
     def language(self):
-        return os.environ.get(self.TMDB_LANGUAGE)
+        return getattr(self._local, "language", None) or self._settings.get("language")
 
     @language.setter
     def language(self, language):
-        os.environ[self.TMDB_LANGUAGE] = language
+        self._local.language = language
+        self._settings["language"] = language
 
     @property
     def wait_on_rate_limit(self):
-        if os.environ.get(self.TMDB_WAIT_ON_RATE_LIMIT) == "False":
-            return False
-        else:
-            return True
+        return self._settings.get("wait_on_rate_limit")
 
     @wait_on_rate_limit.setter
     def wait_on_rate_limit(self, wait_on_rate_limit):
-        os.environ[self.TMDB_WAIT_ON_RATE_LIMIT] = str(wait_on_rate_limit)
+        self._settings["wait_on_rate_limit"] = bool(wait_on_rate_limit)
 
     @property
     def debug(self):
-        if os.environ.get(self.TMDB_DEBUG_ENABLED) == "True":
-            return True
-        else:
-            return False
+        return self._settings.get("debug")
 
     @debug.setter
     def debug(self, debug):
-        os.environ[self.TMDB_DEBUG_ENABLED] = str(debug)
+        self._settings["debug"] = bool(debug)
 
     @property
     def cache(self):
-        if os.environ.get(self.TMDB_CACHE_ENABLED) == "False":
-            return False
-        else:
-            return True
+        return self._settings.get("cache")
 
     @cache.setter
     def cache(self, cache):
-        os.environ[self.TMDB_CACHE_ENABLED] = str(cache)
+        self._settings["cache"] = bool(cache)
 
     @staticmethod
     def _get_obj(result, key="results", all_details=False):
@@ -134,15 +259,39 @@ class TMDb(object):
         if all_details is True or key is None:
             return AsObj(**result)
         else:
-            return [AsObj(**res) for res in result[key]]
+            return AsObjList([AsObj(**res) for res in result[key]],
+                             page=result.get("page"),
+                             total_pages=result.get("total_pages"),
+                             total_results=result.get("total_results"))
 
-    @staticmethod
-    @lru_cache(maxsize=REQUEST_CACHE_MAXSIZE)
-    def cached_request(method, url, data, proxies):
-        return requests.request(method, url, data=data, proxies=eval(proxies), verify=False, timeout=10)
+    def _set_page(self, json_data):
+        if "page" in json_data:
+            self._local.page = json_data["page"]
+            self._local.total_results = json_data.get("total_results")
+            self._local.total_pages = json_data.get("total_pages")
 
     def cache_clear(self):
-        return self.cached_request.cache_clear()
+        return self._cache.clear()
+
+    def _request(self, method, url, data):
+        """
+        Send the request through the pooled session, waiting for the rate limiter and retrying on HTTP 429.
+        """
+        for _ in range(self.REQUEST_RETRIES):
+            self._limiter.acquire(self.wait_on_rate_limit)
+            req = self.session.request(method, url, data=data, proxies=self.proxies,
+                                       timeout=self.REQUEST_TIMEOUT, verify=False)
+            self._limiter.update(req.headers)
+            if req.status_code != 429:
+                return req
+            try:
+                retry_after = int(req.headers.get("Retry-After") or self.RATE_LIMIT_PERIOD)
+            except ValueError:
+                retry_after = self.RATE_LIMIT_PERIOD
+            self._limiter.block(retry_after)
+            if not self.wait_on_rate_limit:
+                raise TMDbException("Rate limit reached. Try again in %d seconds." % retry_after)
+        raise TMDbException("Rate limit reached.")
 
     def _call(
             self, action, append_to_response, call_cached=True, method="GET", data=None
@@ -150,56 +299,36 @@ class TMDb(object):
         if self.api_key is None or self.api_key == "":
             raise TMDbException("No API key found.")
 
+        language = self.language
+        cache_key = (action, append_to_response, language)
+        use_cache = self.cache and self.obj_cached and call_cached and method != "POST"
+        if use_cache:
+            json_data = self._cache.get(cache_key)
+            if json_data is not None:
+                self._set_page(json_data)
+                return json_data
+
         url = "%s%s?api_key=%s&%s&language=%s" % (
             self.domain,
             action,
             self.api_key,
             append_to_response,
-            self.language,
+            language,
         )
 
-        if self.cache and self.obj_cached and call_cached and method != "POST":
-            req = self.cached_request(method, url, data, self.proxies)
-        else:
-            req = self._session.request(method, url, data=data, proxies=eval(self.proxies), timeout=10, verify=False)
-
-        headers = req.headers
-
-        if "X-RateLimit-Remaining" in headers:
-            self._remaining = int(headers["X-RateLimit-Remaining"])
-
-        if "X-RateLimit-Reset" in headers:
-            self._reset = int(headers["X-RateLimit-Reset"])
+        req = self._request(method, url, data)
+        json_data = req.json()
 
-        if self._remaining < 1:
-            current_time = int(time.time())
-            sleep_time = self._reset - current_time
-
-            if self.wait_on_rate_limit:
-                logger.warning("Rate limit reached. Sleeping for: %d" % sleep_time)
-                time.sleep(abs(sleep_time))
-                self._call(action, append_to_response, call_cached, method, data)
-            else:
-                raise TMDbException(
-                    "Rate limit reached. Try again in %d seconds." % sleep_time
-                )
-
-        json = req.json()
-
-        if "page" in json:
-            os.environ["page"] = str(json["page"])
-
-        if "total_results" in json:
-            os.environ["total_results"] = str(json["total_results"])
+        if self.debug:
+            logger.info(json_data)
+            logger.info(self._cache.info())
 
-        if "total_pages" in json:
-            os.environ["total_pages"] = str(json["total_pages"])
+        if "errors" in json_data:
+            raise TMDbException(json_data["errors"])
 
-        if self.debug:
-            logger.info(json)
-            logger.info(self.cached_request.cache_info())
+        self._set_page(json_data)
 
-        if "errors" in json:
-            raise TMDbException(json["errors"])
+        if use_cache and req.status_code == 200 and json_data.get("success") is not False:
+            self._cache.set(cache_key, json_data, len(req.content))
 
-        return json
+        return json_data
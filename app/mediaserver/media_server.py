@@ -1,10 +1,11 @@
 import threading
+import time
 
 import log
 from app.db import MediaDb
 from app.helper import ProgressHelper
 from app.utils.types import MediaServerType
-from config import Config
+from config import Config, MEDIASYNC_BATCH_SIZE, MEDIASYNC_DELTA_INTERVAL, MEDIASYNC_INDEX_GRACE
 from app.mediaserver import Emby, Jellyfin, Plex
 
 lock = threading.Lock()
@@ -109,10 +110,42 @@ class MediaServer:
         """
         if not self.server:
             return None
+        exists_episodes = self.__get_index_episodes(meta_info, season_number)
+        if exists_episodes is not None:
+            total_episodes = [episode for episode in range(1, episode_count + 1)]
+            return list(set(total_episodes).difference(set(exists_episodes)))
         return self.server.get_no_exists_episodes(meta_info,
                                                   season_number,
                                                   episode_count)
 
+    def __get_index_episodes(self, meta_info, season_number):
+        """
+        从本地剧集索引查询某季已有的集号，索引无法确定时返回None，由媒体服务器实时查询
+        """
+        if not meta_info.tmdb_id:
+            return None
+        server_type = self._server_type.value
+        # 未完成过全量同步时索引不完整；未开启定时同步或超过同步周期未同步时，
+        # 索引可能未包含媒体服务器上新增或删除的剧集
+        sync_time = self.mediadb.get_sync_time(server_type)
+        full_interval, delta_interval = self.get_sync_intervals()
+        sync_interval = delta_interval or full_interval
+        if not sync_time \
+                or not sync_interval \
+                or time.time() - sync_time > sync_interval * 3600 + MEDIASYNC_INDEX_GRACE:
+            return None
+        episodes = self.mediadb.get_episodes(server_type, meta_info.tmdb_id)
+        if episodes:
+            return episodes.get(season_number) or []
+        # 媒体库中没有该剧集
+        if not self.mediadb.exists(server_type=server_type,
+                                   title=meta_info.title,
+                                   year=meta_info.year,
+                                   tmdbid=meta_info.tmdb_id):
+            return []
+        # 剧集已同步但没有TMDBID等无法建立索引的情况
+        return None
+
     def get_movies(self, title, year=None):
         """
         根据标题和年份，检查电影是否在媒体服务器中存在，存在则返回列表
@@ -141,61 +174,241 @@ class MediaServer:
             return []
         return self.server.get_libraries()
 
-    def get_items(self, parent):
+    def get_items(self, parent, since=None):
         """
         获取媒体库中的所有媒体
         :param parent: 上一级的ID
+        :param since: 时间戳，不为空时只获取该时间之后新增或修改的媒体
         """
         if not self.server:
             return []
-        return self.server.get_items(parent)
+        return self.server.get_items(parent, since)
 
-    def sync_mediaserver(self):
+    def get_episodes(self, parent, since=None):
+        """
+        获取媒体库中的所有剧集的季集号
+        :param parent: 上一级的ID
+        :param since: 时间戳，不为空时只获取该时间之后新增或修改的剧集
+        """
+        if not self.server:
+            return []
+        return self.server.get_episodes(parent, since)
+
+    def get_sync_intervals(self):
+        """
+        获取媒体库定时同步的周期（小时）
+        :return: 全量同步周期，增量同步周期，未开启的为0
+        """
+        mediasync_interval = Config().get_config('media').get('mediasync_interval')
+        try:
+            mediasync_interval = round(float(mediasync_interval or 0))
+        except ValueError:
+            log.error("【MEDIASERVER】媒体库同步周期配置有误：%s" % mediasync_interval)
+            return 0, 0
+        # Emby、Jellyfin支持按修改时间获取，两次全量同步之间增量同步
+        if self._server_type in [MediaServerType.EMBY, MediaServerType.JELLYFIN] \
+                and mediasync_interval > MEDIASYNC_DELTA_INTERVAL:
+            return mediasync_interval, MEDIASYNC_DELTA_INTERVAL
+        return mediasync_interval, 0
+
+    def sync_mediaserver(self, delta=False):
         """
         同步媒体库所有数据到本地数据库
+        :param delta: 增量同步，只同步上次同步后新增或修改的媒体，已删除的媒体在下次全量同步时清理；
+                      未同步过或Plex时按全量同步
         """
         if not self.server:
             return
         with lock:
-            # 开始进度条
-            log.info("【MEDIASERVER】开始同步媒体库数据...")
-            self.progress.start("mediasync")
-            self.progress.update(ptype="mediasync", text="请稍候...")
-            # 汇总统计
-            medias_count = self.get_medias_count()
-            total_media_count = medias_count.get("MovieCount") + medias_count.get("SeriesCount")
-            total_count = 0
-            movie_count = 0
-            tv_count = 0
-            # 清空登记薄
-            self.mediadb.empty()
+            server_type = self._server_type.value
+            since = None
+            if delta and self._server_type != MediaServerType.PLEX:
+                since = self.mediadb.get_sync_time(server_type)
+            # 从开始获取的时间起算，同步过程中新增的媒体下次增量同步时获取
+            sync_time = time.time()
+            if since:
+                self.__sync_delta(server_type, since, sync_time)
+            else:
+                self.__sync_full(server_type, sync_time)
+
+    def __sync_full(self, server_type, sync_time):
+        """
+        全量同步：分批写入临时表，全部获取成功后一次性替换，同步过程中及失败时原数据不受影响
+        """
+        # 开始进度条
+        log.info("【MEDIASERVER】开始同步媒体库数据...")
+        self.progress.start("mediasync")
+        self.progress.update(ptype="mediasync", text="请稍候...")
+        # 汇总统计
+        medias_count = self.get_medias_count() or {}
+        total_media_count = (medias_count.get("MovieCount") or 0) + (medias_count.get("SeriesCount") or 0)
+        total_count = 0
+        movie_count = 0
+        tv_count = 0
+        # 剧集ID与TMDBID的对应关系，用于建立剧集索引
+        series = {}
+        try:
+            self.mediadb.begin_staging()
             for library in self.get_libraries():
                 # 获取媒体库所有项目
                 self.progress.update(ptype="mediasync",
                                      text="正在获取 %s 数据..." % (library.get("name")))
+                items = []
+                library_series = False
                 for item in self.get_items(library.get("id")):
                     if not item:
                         continue
-                    if self.mediadb.insert(self._server_type.value, item):
-                        total_count += 1
-                        if item.get("type") in ['Movie', 'movie']:
-                            movie_count += 1
-                        elif item.get("type") in ['Series', 'show']:
-                            tv_count += 1
-                        self.progress.update(ptype="mediasync",
-                                             text="正在同步 %s，已完成：%s / %s ..." % (library.get("name"), total_count, total_media_count),
-                                             value=round(100 * total_count/total_media_count, 1))
-            # 更新总体同步情况
-            self.mediadb.statistics(server_type=self._server_type.value,
-                                    total_count=total_count,
-                                    movie_count=movie_count,
-                                    tv_count=tv_count)
-            # 结束进度条
+                    items.append(item)
+                    if item.get("type") in ['Movie', 'movie']:
+                        movie_count += 1
+                    elif item.get("type") in ['Series', 'show']:
+                        tv_count += 1
+                        library_series = True
+                        if item.get("tmdbid"):
+                            series[item.get("id")] = item.get("tmdbid")
+                    if len(items) < MEDIASYNC_BATCH_SIZE:
+                        continue
+                    total_count += self.__insert_staging(server_type, items)
+                    items = []
+                    self.progress.update(ptype="mediasync",
+                                         text="正在同步 %s，已完成：%s / %s ..." % (library.get("name"), total_count, total_media_count),
+                                         value=round(100 * total_count / total_media_count, 1) if total_media_count else 0)
+                total_count += self.__insert_staging(server_type, items)
+                if not library_series:
+                    continue
+                # 获取媒体库所有剧集的季集
+                self.progress.update(ptype="mediasync",
+                                     text="正在获取 %s 剧集..." % (library.get("name")))
+                episodes = []
+                for episode in self.get_episodes(library.get("id")):
+                    episode["tmdbid"] = series.get(episode.get("series_id"))
+                    if not episode.get("tmdbid"):
+                        continue
+                    episodes.append(episode)
+                    if len(episodes) < MEDIASYNC_BATCH_SIZE:
+                        continue
+                    self.__insert_staging(server_type, episodes, episode=True)
+                    episodes = []
+                self.__insert_staging(server_type, episodes, episode=True)
+            if not self.mediadb.commit_staging():
+                raise Exception("替换媒体库数据失败")
+        except Exception as e:
+            self.mediadb.begin_staging()
             self.progress.update(ptype="mediasync",
                                  value=100,
-                                 text="媒体库数据同步完成，同步数量：%s" % total_count)
+                                 text="媒体库数据同步失败：%s" % str(e))
             self.progress.end("mediasync")
-            log.info("【MEDIASERVER】媒体库数据同步完成，同步数量：%s" % total_count)
+            log.error("【MEDIASERVER】媒体库数据同步失败，保留原有数据：%s" % str(e))
+            return
+        # 更新总体同步情况
+        self.mediadb.statistics(server_type=server_type,
+                                total_count=total_count,
+                                movie_count=movie_count,
+                                tv_count=tv_count,
+                                update_time=sync_time)
+        # 结束进度条
+        self.progress.update(ptype="mediasync",
+                             value=100,
+                             text="媒体库数据同步完成，同步数量：%s" % total_count)
+        self.progress.end("mediasync")
+        log.info("【MEDIASERVER】媒体库数据同步完成，同步数量：%s" % total_count)
+
+    def __insert_staging(self, server_type, items, episode=False):
+        """
+        批量写入临时表，写入失败时抛出异常中止同步
+        :param episode: 是否为剧集索引
+        """
+        if not items:
+            return 0
+        if episode:
+            ret = self.mediadb.insert_staging_episodes(server_type, items)
+        else:
+            ret = self.mediadb.insert_staging(server_type, items)
+        if not ret:
+            raise Exception("写入媒体库数据失败")
+        return len(items)
+
+    def __sync_delta(self, server_type, since, sync_time):
+        """
+        增量同步：只获取上次同步后新增或修改的媒体并更新
+        """
+        log.info("【MEDIASERVER】开始增量同步媒体库数据...")
+        items = []
+        episodes = []
+        try:
+            for library in self.get_libraries():
+                for item in self.get_items(library.get("id"), since=since):
+                    if item:
+                        items.append(item)
+                episodes += [episode for episode in self.get_episodes(library.get("id"), since=since) if episode]
+        except Exception as e:
+            log.error("【MEDIASERVER】媒体库数据增量同步失败：%s" % str(e))
+            return
+        if items and not self.mediadb.upsert(server_type, items):
+            log.error("【MEDIASERVER】媒体库数据增量同步失败：写入媒体库数据失败")
+            return
+        self.update_episodes(episodes)
+        total_count, movie_count, tv_count = self.mediadb.get_counts(server_type)
+        self.mediadb.statistics(server_type=server_type,
+                                total_count=total_count,
+                                movie_count=movie_count,
+                                tv_count=tv_count,
+                                update_time=sync_time)
+        log.info("【MEDIASERVER】媒体库数据增量同步完成，更新数量：%s" % len(items))
+
+    def update_episodes(self, episodes):
+        """
+        更新剧集索引，用于增量同步、文件转移完成及媒体服务器通知剧集入库
+        :param episodes: [{id, tmdbid或series_id, season, episode}]
+        """
+        if not episodes:
+            return
+        server_type = self._server_type.value
+        # 同一剧集只查询一次TMDBID
+        series = {}
+        items = []
+        for episode in episodes:
+            tmdbid = episode.get("tmdbid")
+            if not tmdbid:
+                series_id = episode.get("series_id")
+                if series_id not in series:
+                    series[series_id] = self.__get_series_tmdbid(series_id)
+                tmdbid = series.get(series_id)
+            if not tmdbid or episode.get("season") is None or episode.get("episode") is None:
+                continue
+            items.append({"id": episode.get("id"),
+                          "tmdbid": tmdbid,
+                          "season": episode.get("season"),
+                          "episode": episode.get("episode")})
+        if items:
+            self.mediadb.upsert_episodes(server_type, items)
+
+    def delete_item(self, item_id):
+        """
+        媒体服务器通知删除项目时同步删除，剧集删除整部剧的索引，单集删除该集的索引
+        """
+        if not item_id:
+            return
+        server_type = self._server_type.value
+        item = self.mediadb.get_item(server_type, item_id)
+        if item:
+            if item[0] in ['Series', 'show'] and item[1]:
+                self.mediadb.delete_episodes(server_type, tmdbid=item[1])
+            self.mediadb.delete(server_type, item_id)
+        self.mediadb.delete_episodes(server_type, itemid=item_id)
+
+    def __get_series_tmdbid(self, series_id):
+        """
+        查询剧集的TMDBID，未同步时从媒体服务器查询
+        """
+        if not series_id:
+            return None
+        item = self.mediadb.get_item(self._server_type.value, series_id)
+        if item and item[1]:
+            return item[1]
+        if self._server_type == MediaServerType.PLEX:
+            return None
+        return ((self.server.get_iteminfo(series_id) or {}).get("ProviderIds") or {}).get("Tmdb")
 
     def check_item_exists(self, title, year=None, tmdbid=None):
         """
@@ -203,6 +416,12 @@ class MediaServer:
         """
         return self.mediadb.exists(server_type=self._server_type.value, title=title, year=year, tmdbid=tmdbid)
 
+    def get_sync_time(self):
+        """
+        获取当前媒体服务器最近一次同步的时间，未同步过时返回None
+        """
+        return self.mediadb.get_sync_time(self._server_type.value)
+
     def get_mediasync_status(self):
         """
         获取当前媒体库同步状态
@@ -1,8 +1,10 @@
 import re
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 import log
 from app.utils.types import MediaServerType
-from config import Config
+from config import Config, MEDIASERVER_PAGE_SIZE, MEDIASERVER_PAGE_THREADS
 from app.mediaserver.server.server import IMediaServer
 from app.utils.commons import singleton
 from app.utils import RequestUtils, SystemUtils
@@ -363,37 +365,102 @@ class Jellyfin(IMediaServer):
             print(str(e))
             return {}
 
-    def get_items(self, parent):
+    def __get_items_page(self, parent, start_index, item_types, fields, filters=""):
+        """
+        获取一页媒体库下的项目（含子目录）
+        :param filters: 附加的查询条件
+        :return: 项目列表，项目总数
+        """
+        req_url = "%sUsers/%s/Items?parentId=%s&Recursive=true&IncludeItemTypes=%s&Fields=%s" \
+                  "&StartIndex=%s&Limit=%s%s&api_key=%s" % (self._host, self._user, parent, item_types, fields,
+                                                            start_index, MEDIASERVER_PAGE_SIZE, filters,
+                                                            self._apikey)
+        res = RequestUtils(timeout=60).get_res(req_url)
+        if not res or res.status_code != 200:
+            raise Exception("Users/Items 获取第 %s 条开始的数据失败" % start_index)
+        result = res.json()
+        return result.get("Items") or [], result.get("TotalRecordCount") or 0
+
+    def __get_items_paged(self, parent, item_types, fields, filters=""):
+        """
+        分页获取媒体库下的全部项目，第一页得到总数后其余页并发获取，按顺序返回
+        """
+        items, total_count = self.__get_items_page(parent, 0, item_types, fields, filters)
+        for item in items:
+            yield item
+        if total_count <= MEDIASERVER_PAGE_SIZE:
+            return
+        with ThreadPoolExecutor(max_workers=MEDIASERVER_PAGE_THREADS) as executor:
+            futures = [executor.submit(self.__get_items_page, parent, start_index, item_types, fields, filters)
+                       for start_index in range(MEDIASERVER_PAGE_SIZE, total_count, MEDIASERVER_PAGE_SIZE)]
+            for future in futures:
+                items, _ = future.result()
+                for item in items:
+                    yield item
+
+    def get_items(self, parent, since=None):
         """
-        获取媒体服务器所有媒体库列表
+        获取媒体库中的所有媒体，获取出错时抛出异常
+        :param parent: 上一级的ID
+        :param since: 时间戳，不为空时只获取该时间之后新增或修改的媒体
         """
         if not parent:
             yield {}
         if not self._host or not self._apikey:
             yield {}
-        req_url = "%sUsers/%s/Items?parentId=%s&api_key=%s" % (self._host, self._user, parent, self._apikey)
+        filters = ""
+        if since:
+            filters = "&minDateLastSaved=%s" % time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(since))
         try:
-            res = RequestUtils().get_res(req_url)
-            if res and res.status_code == 200:
-                results = res.json().get("Items") or []
-                for result in results:
-                    if not result:
-                        continue
-                    if result.get("Type") in ["Movie", "Series"]:
-                        item_info = self.get_iteminfo(result.get("Id"))
-                        yield {"id": result.get("Id"),
-                               "library": item_info.get("ParentId"),
-                               "type": item_info.get("Type"),
-                               "title": item_info.get("Name"),
-                               "originalTitle": item_info.get("OriginalTitle"),
-                               "year": item_info.get("ProductionYear"),
-                               "tmdbid": item_info.get("ProviderIds", {}).get("Tmdb"),
-                               "imdbid": item_info.get("ProviderIds", {}).get("Imdb"),
-                               "path": item_info.get("Path"),
-                               "json": str(item_info)}
-                    elif "Folder" in result.get("Type"):
-                        for item in self.get_items(result.get("Id")):
-                            yield item
+            for item_info in self.__get_items_paged(parent=parent,
+                                                    item_types="Movie,Series",
+                                                    fields="ProviderIds,Path,OriginalTitle,ProductionYear,ParentId",
+                                                    filters=filters):
+                if not item_info:
+                    continue
+                yield {"id": item_info.get("Id"),
+                       "library": item_info.get("ParentId") or parent,
+                       "type": item_info.get("Type"),
+                       "title": item_info.get("Name"),
+                       "originalTitle": item_info.get("OriginalTitle"),
+                       "year": item_info.get("ProductionYear"),
+                       "tmdbid": (item_info.get("ProviderIds") or {}).get("Tmdb"),
+                       "imdbid": (item_info.get("ProviderIds") or {}).get("Imdb"),
+                       "path": item_info.get("Path"),
+                       "json": str(item_info)}
         except Exception as e:
             log.error(f"【{self.server_type}】连接Users/Items出错：" + str(e))
+            raise e
         yield {}
+
+    def get_episodes(self, parent, since=None):
+        """
+        获取媒体库中的所有剧集的季集号，获取出错时抛出异常
+        :param parent: 上一级的ID
+        :param since: 时间戳，不为空时只获取该时间之后新增或修改的剧集
+        :return: {id, series_id, season, episode}，多集合一的文件每集返回一条
+        """
+        if not parent or not self._host or not self._apikey:
+            return
+        filters = "&IsMissing=false"
+        if since:
+            filters += "&minDateLastSaved=%s" % time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(since))
+        try:
+            for item_info in self.__get_items_paged(parent=parent,
+                                                    item_types="Episode",
+                                                    fields="ParentId",
+                                                    filters=filters):
+                if not item_info \
+                        or item_info.get("ParentIndexNumber") is None \
+                        or item_info.get("IndexNumber") is None:
+                    continue
+                begin_episode = int(item_info.get("IndexNumber"))
+                end_episode = int(item_info.get("IndexNumberEnd") or begin_episode)
+                for episode in range(begin_episode, max(begin_episode, end_episode) + 1):
+                    yield {"id": item_info.get("Id"),
+                           "series_id": item_info.get("SeriesId"),
+                           "season": int(item_info.get("ParentIndexNumber")),
+                           "episode": episode}
+        except Exception as e:
+            log.error(f"【{self.server_type}】连接Users/Items出错：" + str(e))
+            raise e
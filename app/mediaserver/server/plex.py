@@ -173,9 +173,9 @@ class Plex(IMediaServer):
             libraries.append({"id": library.key, "name": library.title})
         return libraries
 
-    def get_items(self, parent):
+    def get_items(self, parent, since=None):
         """
-        获取媒体服务器所有媒体库列表
+        获取媒体库中的所有媒体，Plex不支持按修改时间过滤，始终获取全部媒体
         """
         if not parent:
             yield {}
@@ -192,7 +192,42 @@ class Plex(IMediaServer):
                            "type": item.type,
                            "title": item.title,
                            "year": item.year,
+                           "tmdbid": self.__get_guid(item, "tmdb"),
+                           "imdbid": self.__get_guid(item, "imdb"),
                            "json": str(item.__dict__)}
         except Exception as err:
-            print(err)
+            log.error(f"【{self.server_type}】获取媒体库项目出错：" + str(err))
+            raise err
         yield {}
+
+    def get_episodes(self, parent, since=None):
+        """
+        获取媒体库中的所有剧集的季集号，Plex不支持按修改时间过滤，始终获取全部剧集
+        :return: {id, series_id, season, episode}
+        """
+        if not parent or not self._plex:
+            return
+        try:
+            section = self._plex.library.sectionByID(parent)
+            if not section or section.type != "show":
+                return
+            for episode in section.searchEpisodes():
+                if not episode or episode.parentIndex is None or episode.index is None:
+                    continue
+                yield {"id": episode.key,
+                       "series_id": episode.grandparentKey,
+                       "season": int(episode.parentIndex),
+                       "episode": int(episode.index)}
+        except Exception as err:
+            log.error(f"【{self.server_type}】获取媒体库剧集出错：" + str(err))
+            raise err
+
+    @staticmethod
+    def __get_guid(item, provider):
+        """
+        从Plex的Guid中获取TMDB、IMDB等外部ID
+        """
+        for guid in getattr(item, "guids", None) or []:
+            if guid.id and guid.id.startswith("%s://" % provider):
+                return guid.id[len(provider) + 3:]
+        return None
@@ -86,9 +86,20 @@ class IMediaServer(metaclass=ABCMeta):
         pass
 
     @abstractmethod
-    def get_items(self, parent):
+    def get_items(self, parent, since=None):
         """
         获取媒体库中的所有媒体
         :param parent: 上一级的ID
+        :param since: 时间戳，不为空时只获取该时间之后新增或修改的媒体
+        """
+        pass
+
+    @abstractmethod
+    def get_episodes(self, parent, since=None):
+        """
+        获取媒体库中的所有剧集的季集号
+        :param parent: 上一级的ID
+        :param since: 时间戳，不为空时只获取该时间之后新增或修改的剧集
+        :return: {id, series_id, season, episode}
         """
         pass
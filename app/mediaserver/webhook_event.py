@@ -26,6 +26,12 @@ class WebhookEvent:
                      'item_name': message.get('Metadata', {}).get('title'),
                      'user_name': message.get('Account', {}).get('title')
                      }
+        if message.get('Metadata', {}).get('type') == 'episode':
+            eventItem['item_type'] = "TV"
+            eventItem['series_id'] = message.get('Metadata', {}).get('grandparentKey')
+            eventItem['episode_id'] = message.get('Metadata', {}).get('key')
+            eventItem['season'] = message.get('Metadata', {}).get('parentIndex')
+            eventItem['episode'] = message.get('Metadata', {}).get('index')
         return eventItem
 
     @staticmethod
@@ -37,6 +43,14 @@ class WebhookEvent:
                      'item_name': message.get('Name'),
                      'user_name': message.get('NotificationUsername')
                      }
+        if message.get('ItemType') == 'Episode':
+            eventItem['item_type'] = "TV"
+            eventItem['series_id'] = message.get('SeriesId')
+            eventItem['episode_id'] = message.get('ItemId')
+            eventItem['season'] = message.get('SeasonNumber')
+            eventItem['episode'] = message.get('EpisodeNumber')
+        else:
+            eventItem['media_id'] = message.get('ItemId')
         return eventItem
 
     @staticmethod
@@ -52,6 +66,10 @@ class WebhookEvent:
                     message.get('Item', {}).get('SeriesName'), message.get('Item', {}).get('Name'))
                 eventItem['item_id'] = message.get('Item', {}).get('SeriesId')
                 eventItem['tmdb_id'] = message.get('Item', {}).get('ProviderIds', {}).get('Tmdb')
+                eventItem['series_id'] = message.get('Item', {}).get('SeriesId')
+                eventItem['episode_id'] = message.get('Item', {}).get('Id')
+                eventItem['season'] = message.get('Item', {}).get('ParentIndexNumber')
+                eventItem['episode'] = message.get('Item', {}).get('IndexNumber')
             else:
                 eventItem['item_type'] = "MOV"
                 eventItem['item_name'] = message.get('Item', {}).get('Name')
@@ -74,6 +92,8 @@ class WebhookEvent:
         event_info = self.__parse_plex_msg(message)
         if event_info.get("event") in ["media.play", "media.stop"]:
             self.send_webhook_message(event_info, 'plex')
+        elif event_info.get("event") == "library.new":
+            self.__update_episodes(event_info)
 
     def jellyfin_action(self, message):
         """
@@ -82,6 +102,10 @@ class WebhookEvent:
         event_info = self.__parse_jellyfin_msg(message)
         if event_info.get("event") in ["PlaybackStart", "PlaybackStop"]:
             self.send_webhook_message(event_info, 'jellyfin')
+        elif event_info.get("event") == "ItemAdded":
+            self.__update_episodes(event_info)
+        elif event_info.get("event") == "ItemDeleted":
+            self.mediaserver.delete_item(event_info.get("episode_id") or event_info.get("media_id"))
 
     def emby_action(self, message):
         """
@@ -98,6 +122,21 @@ class WebhookEvent:
                 if ret:
                     # 刷新媒体库
                     self.mediaserver.refresh_root_library()
+        elif event_info.get("event") == "library.new":
+            self.__update_episodes(event_info)
+        elif event_info.get("event") == "library.deleted":
+            self.mediaserver.delete_item(event_info.get("episode_id") or event_info.get("item_id"))
+
+    def __update_episodes(self, event_info):
+        """
+        媒体服务器通知新入库剧集时更新剧集索引
+        """
+        if event_info.get("item_type") != "TV":
+            return
+        self.mediaserver.update_episodes([{"id": event_info.get("episode_id"),
+                                           "series_id": event_info.get("series_id"),
+                                           "season": event_info.get("season"),
+                                           "episode": event_info.get("episode")}])
 
     def send_webhook_message(self, event_info, channel):
         """
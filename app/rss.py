@@ -1,22 +1,26 @@
 import re
 import traceback
-import xml.dom.minidom
+from concurrent.futures import ThreadPoolExecutor
 from threading import Lock
 
 import log
-from app.helper import SqlHelper
+from app.helper import SqlHelper, RssHelper
 from app.message import Message
 from app.downloader.downloader import Downloader
 from app.filterrules import FilterRule
 from app.searcher import Searcher
 from app.sites import Sites
-from app.utils import Torrent, DomUtils, RequestUtils, StringUtils
+from app.utils import Torrent, RequestUtils, StringUtils, RssUtils
 from app.helper import MetaHelper
 from app.media import MetaInfo, Media
+from app.mediaserver import MediaServer
 from app.utils.types import MediaType, SearchType
 from app.subscribe import Subscribe
+from config import RSS_SITE_THREADS, RSS_SITE_TIMEOUT
 
 lock = Lock()
+# RSS下载及识别线程池
+RSS_EXECUTOR = ThreadPoolExecutor(max_workers=RSS_SITE_THREADS, thread_name_prefix="rss")
 
 
 class Rss:
@@ -64,6 +68,13 @@ class Rss:
             # 没有订阅退出
             if not movie_keys and not tv_keys:
                 return
+            # 订阅清单、过滤规则、站点规则变化或媒体库同步后重新处理RSS中已有的种子
+            RssHelper().reset_on_change("rss", [movie_keys,
+                                                tv_keys,
+                                                self.filterrule.get_rule_infos(),
+                                                [(site.get("id"), site.get("rule"), site.get("parse"))
+                                                 for site in self.__sites],
+                                                MediaServer().get_sync_time()])
             # 获取有订阅的站点范围
             check_sites = []
             check_all = False
@@ -88,36 +99,22 @@ class Rss:
             # 代码站点配置优先级的序号
             rss_download_torrents = []
             rss_no_exists = {}
-            for site_info in self.__sites:
-                if not site_info:
-                    continue
-                # 站点名称
-                rss_job = site_info.get("name")
-                # 没有订阅的站点中的不检索
-                if check_sites and rss_job not in check_sites:
-                    continue
-                rssurl = site_info.get("rssurl")
-                if not rssurl:
-                    log_info("【Rss】%s 未配置rssurl，跳过..." % str(rss_job))
-                    continue
-                rss_cookie = site_info.get("cookie")
-                rss_ua = site_info.get("ua")
-                # 是否解析种子详情
-                site_parse = False if site_info.get("parse") == "N" else True
-                # 使用的规则
-                site_rule_group = site_info.get("rule")
-                # 开始下载RSS
+            # 并发下载所有站点的RSS并识别，再按站点优先级顺序逐个匹配订阅
+            for site_task in self.__get_sites_rss(check_sites):
+                rss_job = site_task.get("name")
+                rss_cookie = site_task.get("cookie")
+                rss_ua = site_task.get("ua")
+                site_parse = site_task.get("parse")
+                site_rule_group = site_task.get("rule")
+                order_seq = site_task.get("order_seq")
+                rss_result = site_task.get("rss_result")
+                rssd_enclosures = site_task.get("rssd_enclosures")
+                media_futures = site_task.get("media_futures")
                 log_info("【Rss】正在处理：%s" % rss_job)
-                if site_info.get("pri"):
-                    order_seq = 100 - int(site_info.get("pri"))
-                else:
-                    order_seq = 0
-                rss_result = self.parse_rssxml(rssurl)
-                if len(rss_result) == 0:
-                    log_warn("【Rss】%s 未下载到数据" % rss_job)
-                    continue
-                else:
-                    log_info("【Rss】%s 获取数据：%s" % (rss_job, len(rss_result)))
+                # 待插入数据库的记录
+                rssd_medias = []
+                # 处理出错的条目，下次继续处理
+                failed_ids = set()
                 # 处理RSS结果
                 res_num = 0
                 for res in rss_result:
@@ -140,11 +137,11 @@ class Rss:
                         log_info("【Rss】开始处理：%s" % torrent_name)
 
                         # 检查这个种子是不是下过了
-                        if SqlHelper.is_torrent_rssd(enclosure):
+                        if not enclosure or enclosure in rssd_enclosures:
                             log_info("【Rss】%s 已成功订阅过" % torrent_name)
                             continue
-                        # 识别种子名称，开始检索TMDB
-                        media_info = self.media.get_media_info(title=torrent_name, subtitle=description)
+                        # 识别种子名称的结果
+                        media_info = media_futures.get(enclosure).result()
                         if not media_info:
                             log_warn("【Rss】%s 识别媒体信息出错！" % torrent_name)
                             continue
@@ -243,15 +240,21 @@ class Rss:
                                                     upload_volume_factor=match_info.get("upload_volume_factor"),
                                                     rssid=match_rssid,
                                                     description=description)
-                        # 插入数据库
-                        SqlHelper.insert_rss_torrents(media_info)
+                        # 登记处理记录，本站点处理结束后批量插入数据库
+                        rssd_enclosures.add(enclosure)
+                        rssd_medias.append(media_info)
                         # 加入下载列表
                         if media_info not in rss_download_torrents:
                             rss_download_torrents.append(media_info)
                             res_num = res_num + 1
                     except Exception as e:
                         log_error("【Rss】处理RSS发生错误：%s - %s" % (str(e), traceback.format_exc()))
+                        failed_ids.add(id(res))
                         continue
+                SqlHelper.insert_rss_torrents_batch(rssd_medias)
+                RssHelper().update_processed(site_task.get("url"),
+                                             [res for res in rss_result if id(res) not in failed_ids],
+                                             key="rss")
                 log_info("【Rss】%s 处理结束，匹配到 %s 个有效资源" % (rss_job, res_num))
             log_info("【Rss】所有RSS处理结束，共 %s 个有效资源" % len(rss_download_torrents))
 
@@ -558,11 +561,77 @@ class Rss:
             media_info = Media().get_media_info(title="%s %s" % (name, year), mtype=mtype, strict=True, cache=cache)
         return media_info
 
+    def __get_sites_rss(self, check_sites):
+        """
+        并发下载各站点的RSS，并对未处理过的种子并发识别媒体信息
+        :param check_sites: 需要检索的站点，为空时检索全部站点
+        :return: 按站点优先级排列的站点任务，识别结果为以种子链接为键的Future
+        """
+        site_tasks = []
+        for site_info in self.__sites:
+            if not site_info:
+                continue
+            # 站点名称
+            rss_job = site_info.get("name")
+            # 没有订阅的站点中的不检索
+            if check_sites and rss_job not in check_sites:
+                continue
+            rssurl = site_info.get("rssurl")
+            if not rssurl:
+                log_info("【Rss】%s 未配置rssurl，跳过..." % str(rss_job))
+                continue
+            if site_info.get("pri"):
+                order_seq = 100 - int(site_info.get("pri"))
+            else:
+                order_seq = 0
+            site_tasks.append({
+                "name": rss_job,
+                "url": rssurl,
+                "cookie": site_info.get("cookie"),
+                "ua": site_info.get("ua"),
+                # 是否解析种子详情
+                "parse": False if site_info.get("parse") == "N" else True,
+                # 使用的规则
+                "rule": site_info.get("rule"),
+                "order_seq": order_seq,
+                "future": RSS_EXECUTOR.submit(self.parse_rssxml, rssurl, "rss", RSS_SITE_TIMEOUT)
+            })
+        # 下载RSS，各站点互不等待，每个站点受请求超时时间限制
+        for site_task in site_tasks:
+            rss_job = site_task.get("name")
+            try:
+                rss_result = site_task.pop("future").result()
+            except Exception as err:
+                log_error("【Rss】%s 下载RSS出错：%s" % (rss_job, str(err)))
+                rss_result = []
+            if not rss_result:
+                log_info("【Rss】%s 没有新数据" % rss_job)
+            else:
+                log_info("【Rss】%s 获取数据：%s" % (rss_job, len(rss_result)))
+            # 批量查询已处理过的种子
+            rssd_enclosures = SqlHelper.get_rssd_enclosures(
+                [res.get('enclosure') or res.get('link') for res in rss_result])
+            # 识别种子名称，开始检索TMDB
+            media_futures = {}
+            for res in rss_result:
+                enclosure = res.get('enclosure') or res.get('link')
+                if not enclosure or enclosure in rssd_enclosures or enclosure in media_futures:
+                    continue
+                media_futures[enclosure] = RSS_EXECUTOR.submit(self.media.get_media_info,
+                                                               title=res.get('title'),
+                                                               subtitle=res.get('description'))
+            site_task.update({"rss_result": rss_result,
+                              "rssd_enclosures": rssd_enclosures,
+                              "media_futures": media_futures})
+        return [site_task for site_task in site_tasks if site_task.get("rss_result")]
+
     @staticmethod
-    def parse_rssxml(url):
+    def parse_rssxml(url, key=None, timeout=None):
         """
         解析RSS订阅URL，获取RSS中的种子信息
         :param url: RSS地址
+        :param key: 调用方标识，有值时使用条件请求，且只返回该调用方未处理过的种子，处理后由调用方通过RssHelper().update_processed登记
+        :param timeout: 请求超时时间（秒）
         :return: 种子信息列表
         """
         # 开始处理
@@ -570,59 +639,23 @@ class Rss:
         if not url:
             return []
         try:
-            ret = RequestUtils().get_res(url)
+            if key:
+                ret = RssHelper().get_res(url, key=key, timeout=timeout)
+            else:
+                ret = RequestUtils(timeout=timeout).get_res(url)
             if not ret:
                 return []
-            ret.encoding = ret.apparent_encoding
         except Exception as e2:
             log.console(str(e2))
             return []
-        if ret:
-            ret_xml = ret.text
-            try:
-                # 解析XML
-                dom_tree = xml.dom.minidom.parseString(ret_xml)
-                rootNode = dom_tree.documentElement
-                items = rootNode.getElementsByTagName("item")
-                for item in items:
-                    try:
-                        # 标题
-                        title = DomUtils.tag_value(item, "title", default="")
-                        if not title:
-                            continue
-                        # 描述
-                        description = DomUtils.tag_value(item, "description", default="")
-                        # 种子页面
-                        link = DomUtils.tag_value(item, "link", default="")
-                        # 种子链接
-                        enclosure = DomUtils.tag_value(item, "enclosure", "url", default="")
-                        if not enclosure:
-                            continue
-                        # 大小
-                        size = DomUtils.tag_value(item, "enclosure", "length", default=0)
-                        if size and str(size).isdigit():
-                            size = int(size)
-                        else:
-                            size = 0
-                        # 发布日期
-                        pubdate = DomUtils.tag_value(item, "pubDate", default="")
-                        if pubdate:
-                            # 转换为时间
-                            pubdate = StringUtils.get_time_stamp(pubdate)
-                        # 返回对象
-                        tmp_dict = {'title': title,
-                                    'enclosure': enclosure,
-                                    'size': size,
-                                    'description': description,
-                                    'link': link,
-                                    'pubdate': pubdate}
-                        ret_array.append(tmp_dict)
-                    except Exception as e1:
-                        log.console(str(e1))
-                        continue
-            except Exception as e2:
-                log.console(str(e2))
-                return ret_array
+        try:
+            # 解析XML
+            for item in RssUtils.parse_rss_items(RssUtils.get_xml_content(ret)):
+                ret_array.append(item)
+        except Exception as e2:
+            log.console(str(e2))
+        if key:
+            return RssHelper().filter_new_items(url, ret_array, key=key)
         return ret_array
 
     @staticmethod
@@ -0,0 +1,199 @@
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import log
+from app.helper import SqlHelper
+from app.media import Media
+from app.media.doubanv2api import DoubanApi
+from app.utils.commons import singleton
+from app.utils.types import MediaType
+from config import TMDB_IMAGE_W500_URL, RSS_CALENDAR_THREADS, RSS_CALENDAR_CACHE_TTL, RSS_CALENDAR_FAIL_CACHE_TTL
+
+lock = threading.Lock()
+
+
+@singleton
+class RssCalendar:
+    """
+    订阅日历：汇总全部订阅电影的上映日期及订阅电视剧各集的播出日期，
+    每个订阅的日期按有效期缓存，由定时任务在后台刷新，日历页面一次请求即可获取全部事件
+    """
+    media = None
+    # {(类型, ID, 季): (过期时间, 事件列表, 错误信息)}
+    _events = {}
+
+    def __init__(self):
+        self.media = Media()
+        self._events = {}
+
+    def get_events(self, refresh=False):
+        """
+        获取全部订阅的日历事件，未缓存或已过期的订阅并发查询
+        :param refresh: 是否忽略缓存重新查询
+        """
+        items = self.__get_rss_items()
+        # 清理已取消订阅的缓存
+        with lock:
+            for key in set(self._events) - set(items):
+                self._events.pop(key)
+        with ThreadPoolExecutor(max_workers=RSS_CALENDAR_THREADS) as executor:
+            results = executor.map(lambda key, name: self.__get_cached_events(key, name, refresh=refresh)[0],
+                                   items.keys(), items.values())
+        events = []
+        for ret in results:
+            events += ret
+        return events
+
+    def refresh(self):
+        """
+        定时刷新全部订阅的日历事件
+        """
+        start_time = time.time()
+        events = self.get_events(refresh=True)
+        log.info("【RssCalendar】订阅日历刷新完成，共 %s 个事件，耗时 %.1f 秒" % (len(events), time.time() - start_time))
+
+    def get_movie_events(self, tid):
+        """
+        查询电影上映日期
+        :param tid: TMDBID，豆瓣ID以DB:开头
+        :return: 事件列表，错误信息
+        """
+        return self.__get_cached_events((MediaType.MOVIE, tid, None), None)
+
+    def get_tv_events(self, tid, season, name):
+        """
+        查询电视剧各集的播出日期
+        :param tid: TMDBID，豆瓣ID以DB:开头
+        :param season: 季号
+        :param name: 订阅名称
+        :return: 事件列表，错误信息
+        """
+        return self.__get_cached_events((MediaType.TV, tid, season), name)
+
+    @staticmethod
+    def __get_rss_items():
+        """
+        查询全部订阅
+        :return: {(类型, ID, 季): 订阅名称}
+        """
+        items = {}
+        for movie in SqlHelper.get_rss_movies():
+            if movie[2]:
+                items[(MediaType.MOVIE, movie[2], None)] = movie[0]
+        for tv in SqlHelper.get_rss_tvs():
+            if tv[2] and tv[3]:
+                items[(MediaType.TV, tv[3], int(str(tv[2]).replace("S", "")))] = tv[0]
+        return items
+
+    def __get_cached_events(self, key, name, refresh=False):
+        """
+        查询订阅的日历事件，查询结果在有效期内缓存，查询失败的结果缓存较短时间
+        """
+        if not refresh:
+            with lock:
+                cache = self._events.get(key)
+            if cache and cache[0] > time.time():
+                return cache[1], cache[2]
+        mtype, tid, season = key
+        try:
+            if mtype == MediaType.MOVIE:
+                events, retmsg = self.__movie_events(tid)
+            else:
+                events, retmsg = self.__tv_events(tid, season, name)
+        except Exception as err:
+            log.error("【RssCalendar】查询 %s 日历出错：%s" % (name or tid, str(err)))
+            events, retmsg = [], str(err)
+        ttl = RSS_CALENDAR_FAIL_CACHE_TTL if retmsg else RSS_CALENDAR_CACHE_TTL
+        with lock:
+            self._events[key] = (time.time() + ttl, events, retmsg)
+        return events, retmsg
+
+    def __movie_events(self, tid):
+        """
+        查询电影上映日期
+        """
+        if tid and tid.startswith("DB:"):
+            doubanid = tid.replace("DB:", "")
+            douban_info = DoubanApi().movie_detail(doubanid)
+            if not douban_info:
+                return [], "无法查询到豆瓣信息"
+            poster_path = douban_info.get("cover_url") or ""
+            title = douban_info.get("title")
+            rating = douban_info.get("rating", {}) or {}
+            vote_average = rating.get("value") or "无"
+            release_date = douban_info.get("pubdate")
+            if release_date:
+                release_date = re.sub(r"\(.*\)", "", douban_info.get("pubdate")[0])
+        else:
+            tmdb_info = self.media.get_tmdb_info(mtype=MediaType.MOVIE, tmdbid=tid)
+            if not tmdb_info:
+                return [], "无法查询到TMDB信息"
+            poster_path = TMDB_IMAGE_W500_URL % tmdb_info.get('poster_path') if tmdb_info.get(
+                'poster_path') else ""
+            title = tmdb_info.get('title')
+            vote_average = tmdb_info.get("vote_average")
+            release_date = tmdb_info.get('release_date')
+        if not release_date:
+            return [], "上映日期不正确"
+        return [{"type": "电影",
+                 "title": title,
+                 "start": release_date,
+                 "id": tid,
+                 "year": release_date[0:4] if release_date else "",
+                 "poster": poster_path,
+                 "vote_average": vote_average}], ""
+
+    def __tv_events(self, tid, season, name):
+        """
+        查询电视剧各集的播出日期
+        """
+        if tid and tid.startswith("DB:"):
+            doubanid = tid.replace("DB:", "")
+            douban_info = DoubanApi().tv_detail(doubanid)
+            if not douban_info:
+                return [], "无法查询到豆瓣信息"
+            poster_path = douban_info.get("cover_url") or ""
+            title = douban_info.get("title")
+            rating = douban_info.get("rating", {}) or {}
+            vote_average = rating.get("value") or "无"
+            release_date = douban_info.get("pubdate")
+            if release_date:
+                release_date = re.sub(r"\(.*\)", "", douban_info.get("pubdate")[0])
+            if not release_date:
+                return [], "上映日期不正确"
+            return [{"type": "电视剧",
+                     "title": title,
+                     "start": release_date,
+                     "id": tid,
+                     "year": release_date[0:4] if release_date else "",
+                     "poster": poster_path,
+                     "vote_average": vote_average}], ""
+        tmdb_info = self.media.get_tmdb_tv_season_detail(tmdbid=tid, season=season)
+        if not tmdb_info:
+            return [], "无法查询到TMDB信息"
+        air_date = tmdb_info.get("air_date")
+        if not tmdb_info.get("poster_path"):
+            tv_tmdb_info = self.media.get_tmdb_info(mtype=MediaType.TV, tmdbid=tid)
+            if tv_tmdb_info:
+                poster_path = TMDB_IMAGE_W500_URL % tv_tmdb_info.get("poster_path")
+            else:
+                poster_path = ""
+        else:
+            poster_path = TMDB_IMAGE_W500_URL % tmdb_info.get("poster_path")
+        year = air_date[0:4] if air_date else ""
+        episode_events = []
+        for episode in tmdb_info.get("episodes") or []:
+            episode_events.append({
+                "type": "剧集",
+                "title": "%s 第%s季第%s集" % (
+                    name, season, episode.get("episode_number")) if season != 1 else "%s 第%s集" % (
+                    name, episode.get("episode_number")),
+                "start": episode.get("air_date"),
+                "id": tid,
+                "year": year,
+                "poster": poster_path,
+                "vote_average": episode.get("vote_average") or "无"
+            })
+        return episode_events, ""
@@ -7,7 +7,7 @@ from apscheduler.schedulers.background import BackgroundScheduler
 from lxml import etree
 
 import log
-from app.helper import SqlHelper
+from app.helper import SqlHelper, RssHelper
 from app.filterrules import FilterRule
 from app.media import Media
 from app.message import Message
@@ -137,15 +137,28 @@ class RssChecker(object):
         taskinfo = self.get_rsstask_info(taskid)
         if not taskinfo:
             return
-        rss_result = self.__parse_userrss_result(taskinfo)
+        # 任务配置变化后重新处理RSS中已有的条目
+        RssHelper().reset_on_change("userrss_%s" % taskid,
+                                    [taskinfo.get(key) for key in ["address", "parser", "uses", "include",
+                                                                   "exclude", "filter", "note"]])
+        rss_url, rss_result = self.__parse_userrss_result(taskinfo, feed_key="userrss_%s" % taskid)
         if len(rss_result) == 0:
-            log_warn("【RSSCHECKER】%s 未下载到数据" % taskinfo.get("name"))
+            log_info("【RSSCHECKER】%s 没有新数据" % taskinfo.get("name"))
             return
         else:
             log_info("【RSSCHECKER】%s 获取数据：%s" % (taskinfo.get("name"), len(rss_result)))
+        # 批量查询已处理过的种子
+        finished_torrents = SqlHelper.get_userrss_finished(
+            [(self.__get_meta_name(res), res.get('enclosure')) for res in rss_result])
+        # 待插入数据库的记录
+        rssd_medias = []
         # 处理RSS结果
         res_num = 0
         no_exists = {}
+        # 处理出错的条目，下次继续处理
+        failed_ids = set()
+        # 下载类型任务每个下载对应的条目，下载失败时下次继续处理
+        download_items = []
         for res in rss_result:
             try:
                 # 种子名
@@ -160,10 +173,6 @@ class RssChecker(object):
                 description = res.get('description')
                 # 种子大小
                 size = res.get('size')
-                # 年份
-                year = res.get('year')
-                if year and len(year) > 4:
-                    year = year[:4]
                 # 类型
                 mediatype = res.get('type')
                 if mediatype:
@@ -172,8 +181,8 @@ class RssChecker(object):
                 log_info("【RSSCHECKER】开始处理：%s" % title)
 
                 # 检查是不是处理过
-                meta_name = "%s %s" % (title, year) if year else title
-                if SqlHelper.is_userrss_finished(meta_name, enclosure):
+                meta_name = self.__get_meta_name(res)
+                if (meta_name, enclosure) in finished_torrents:
                     log_info("【RSSCHECKER】%s 已处理过" % title)
                     continue
                 # 识别种子名称，开始检索TMDB
@@ -248,25 +257,32 @@ class RssChecker(object):
                     if media_info not in rss_download_torrents:
                         media_info.note = taskinfo.get("note")
                         rss_download_torrents.append(media_info)
+                        download_items.append([res])
+                    else:
+                        download_items[rss_download_torrents.index(media_info)].append(res)
                 elif taskinfo.get("uses") == "R":
                     # 订阅
                     # 订阅类型的 保持现状直接插入数据库
-                    SqlHelper.insert_rss_torrents(media_info)
+                    finished_torrents.add((meta_name, enclosure))
+                    rssd_medias.append(media_info)
                     if media_info not in rss_subscribe_torrents:
                         rss_subscribe_torrents.append(media_info)
                 elif taskinfo.get("uses") == "S":
                     # 搜索
                     # 搜索类型的 保持现状直接插入数据库
-                    SqlHelper.insert_rss_torrents(media_info)
+                    finished_torrents.add((meta_name, enclosure))
+                    rssd_medias.append(media_info)
                     if media_info not in rss_search_torrents:
                         rss_search_torrents.append(media_info)
             except Exception as e:
                 log_error("【RSSCHECKER】处理RSS发生错误：%s - %s" % (str(e), traceback.format_exc()))
+                failed_ids.add(id(res))
                 continue
+        SqlHelper.insert_rss_torrents_batch(rssd_medias)
         log_info("【RSSCHECKER】%s 处理结束，匹配到 %s 个有效资源" % (taskinfo.get("name"), res_num))
         # 添加下载
         if rss_download_torrents:
-            for media in rss_download_torrents:
+            for media, items in zip(rss_download_torrents, download_items):
                 ret, ret_msg = self.downloader.download(media_info=media,
                                                         is_paused=media.note.get("is_paused"),
                                                         tag=media.note.get("tags"),
@@ -287,6 +303,7 @@ class RssChecker(object):
                     SqlHelper.insert_userrss_task_history(taskid, media.org_string, Downloader().get_type().value)
                 else:
                     log_error("【RSSCHECKER】添加下载任务 %s 失败：%s" % (media.get_title_string(), ret_msg or "请检查下载任务是否已存在"))
+                    failed_ids.update(id(item) for item in items)
                     if ret_msg:
                         self.message.send_download_fail_message(media, ret_msg)
         # 添加订阅
@@ -308,32 +325,41 @@ class RssChecker(object):
                                                media_info=media,
                                                no_exists=no_exists)
 
+        # 登记已处理的条目，处理出错及下载失败的条目下次重新处理
+        RssHelper().update_processed(rss_url,
+                                     [res for res in rss_result if id(res) not in failed_ids],
+                                     key="userrss_%s" % taskid)
+
         # 更新状态
         counter = len(rss_download_torrents) + len(rss_subscribe_torrents) + len(rss_search_torrents)
         if counter:
             SqlHelper.update_userrss_task_info(taskid, counter)
 
-    def __parse_userrss_result(self, taskinfo):
+    def __parse_userrss_result(self, taskinfo, feed_key=None):
         """
         获取RSS链接数据，根据PARSER进行解析获取返回结果
+        :param taskinfo: 任务信息
+        :param feed_key: 调用方标识，有值时使用条件请求，内容未变化时返回空，且只返回该调用方未处理过的条目，
+                    处理后由调用方通过RssHelper().update_processed登记
+        :return: RSS地址，解析结果
         """
         rss_parser = self.get_userrss_parser(taskinfo.get("parser"))
         if not rss_parser:
             log_error("【RSSCHECKER】任务 %s 的解析配置不存在" % taskinfo.get("name"))
-            return []
+            return None, []
         if not rss_parser.get("format"):
             log_error("【RSSCHECKER】任务 %s 的解析配置不正确" % taskinfo.get("name"))
-            return []
+            return None, []
         try:
             rss_parser_format = json.loads(rss_parser.get("format"))
         except Exception as e:
             print(str(e))
             log_error("【RSSCHECKER】任务 %s 的解析配置不是合法的Json格式" % taskinfo.get("name"))
-            return []
+            return None, []
         # 拼装链接
         rss_url = taskinfo.get("address")
         if not rss_url:
-            return []
+            return None, []
         if rss_parser.get("params"):
             _dict = {
                 "TMDBKEY": Config().get_config("app").get("rmt_tmdbkey")
@@ -343,17 +369,20 @@ class RssChecker(object):
             except Exception as e:
                 log.console(str(e))
                 log_error("【RSSCHECKER】任务 %s 的解析配置附加参数不合法" % taskinfo.get("name"))
-                return []
+                return None, []
             rss_url = "%s?%s" % (rss_url, param_url) if rss_url.find("?") == -1 else "%s&%s" % (rss_url, param_url)
         # 请求数据
         try:
-            ret = RequestUtils().get_res(rss_url)
+            if feed_key:
+                ret = RssHelper().get_res(rss_url, key=feed_key)
+            else:
+                ret = RequestUtils().get_res(rss_url)
             if not ret:
-                return []
+                return rss_url, []
             ret.encoding = ret.apparent_encoding
         except Exception as e2:
             log.console(str(e2))
-            return []
+            return rss_url, []
         # 解析数据 XPATH
         rss_result = []
         if rss_parser.get("type") == "XML":
@@ -378,17 +407,17 @@ class RssChecker(object):
                     rss_result.append(rss_item)
             except Exception as err:
                 log_error("【RSSCHECKER】任务 %s 获取的订阅报文无法解析：%s" % (taskinfo.get("name"), str(err)))
-                return []
+                return rss_url, []
         elif rss_parser.get("type") == "JSON":
             try:
                 result_json = json.loads(ret.text)
             except Exception as err:
                 log_error("【RSSCHECKER】任务 %s 获取的订阅报文不是合法的Json格式：%s" % (taskinfo.get("name"), str(err)))
-                return []
+                return rss_url, []
             item_list = jsonpath.jsonpath(result_json, rss_parser_format.get("list"))[0]
             if not isinstance(item_list, list):
                 log_error("【RSSCHECKER】任务 %s 获取的订阅报文list后不是列表" % taskinfo.get("name"))
-                return []
+                return rss_url, []
             for item in item_list:
                 rss_item = {}
                 for key, attr in rss_parser_format.get("item", {}).items():
@@ -401,7 +430,9 @@ class RssChecker(object):
                     if value:
                         rss_item.update({key: value[0]})
                 rss_result.append(rss_item)
-        return rss_result
+        if feed_key:
+            return rss_url, RssHelper().filter_new_items(rss_url, rss_result, key=feed_key)
+        return rss_url, rss_result
 
     def __is_match_rss(self, taskinfo, media_info):
         """
@@ -466,9 +497,12 @@ class RssChecker(object):
         taskinfo = self.get_rsstask_info(taskid)
         if not taskinfo:
             return
-        rss_result = self.__parse_userrss_result(taskinfo)
+        _, rss_result = self.__parse_userrss_result(taskinfo)
         if len(rss_result) == 0:
             return []
+        # 批量查询已处理过的种子
+        finished_torrents = SqlHelper.get_userrss_finished(
+            [(self.__get_meta_name(res), res.get('enclosure')) for res in rss_result])
         for res in rss_result:
             try:
                 # 种子名
@@ -485,13 +519,8 @@ class RssChecker(object):
                 size = res.get('size')
                 # 发布日期
                 date = StringUtils.unify_datetime_str(res.get('date'))
-                # 年份
-                year = res.get('year')
-                if year and len(year) > 4:
-                    year = year[:4]
                 # 检查是不是处理过
-                meta_name = "%s %s" % (title, year) if year else title
-                finish_flag = SqlHelper.is_userrss_finished(meta_name, enclosure)
+                finish_flag = (self.__get_meta_name(res), enclosure) in finished_torrents
                 # 信息聚合
                 params = {
                     "title": title,
@@ -508,6 +537,17 @@ class RssChecker(object):
                 log_error("【RSSCHECKER】获取RSS报文发生错误：%s - %s" % (str(e), traceback.format_exc()))
         return rss_articles
 
+    @staticmethod
+    def __get_meta_name(res):
+        """
+        生成用于识别和判断是否处理过的名称：标题+年份
+        """
+        title = res.get('title')
+        year = res.get('year')
+        if year and len(year) > 4:
+            year = year[:4]
+        return "%s %s" % (title, year) if year else title
+
     def test_rss_articles(self, taskid, title):
         """
         测试RSS报文
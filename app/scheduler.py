@@ -10,9 +10,11 @@ from app.doubansync import DoubanSync
 from app.mediaserver import MediaServer
 from config import AUTO_REMOVE_TORRENTS_INTERVAL, PT_TRANSFER_INTERVAL, Config, METAINFO_SAVE_INTERVAL, \
     RELOAD_CONFIG_INTERVAL, SYNC_TRANSFER_INTERVAL, RSS_CHECK_INTERVAL, REFRESH_PT_DATA_INTERVAL, \
-    RSS_REFRESH_TMDB_INTERVAL, META_DELETE_UNKNOWN_INTERVAL, REFRESH_WALLPAPER_INTERVAL
+    RSS_REFRESH_TMDB_INTERVAL, META_DELETE_UNKNOWN_INTERVAL, REFRESH_WALLPAPER_INTERVAL, \
+    RSS_CALENDAR_REFRESH_INTERVAL
 from app.downloader import Downloader
 from app.rss import Rss
+from app.rsscalendar import RssCalendar
 from app.sites import Sites
 from app.sync import Sync
 from app.utils.commons import singleton
@@ -159,20 +161,14 @@ class Scheduler:
 
         # 媒体库同步
         if self.__media:
-            mediasync_interval = self.__media.get("mediasync_interval")
+            mediasync_interval, delta_interval = MediaServer().get_sync_intervals()
             if mediasync_interval:
-                if isinstance(mediasync_interval, str):
-                    if mediasync_interval.isdigit():
-                        mediasync_interval = int(mediasync_interval)
-                    else:
-                        try:
-                            mediasync_interval = round(float(mediasync_interval))
-                        except Exception as e:
-                            log.info("豆瓣同步服务启动失败：%s" % str(e))
-                            mediasync_interval = 0
-                if mediasync_interval:
-                    self.SCHEDULER.add_job(MediaServer().sync_mediaserver, 'interval', hours=mediasync_interval)
-                    log.info("媒体库同步服务启动")
+                self.SCHEDULER.add_job(MediaServer().sync_mediaserver, 'interval', hours=mediasync_interval)
+                # 两次全量同步之间增量同步
+                if delta_interval:
+                    self.SCHEDULER.add_job(MediaServer().sync_mediaserver, 'interval',
+                                           hours=delta_interval, kwargs={"delta": True})
+                log.info("媒体库同步服务启动")
 
         # 配置定时生效
         self.SCHEDULER.add_job(Config().init_config, 'interval', seconds=RELOAD_CONFIG_INTERVAL)
@@ -195,6 +191,9 @@ class Scheduler:
         # 豆瓣RSS转TMDB，定时更新TMDB数据
         self.SCHEDULER.add_job(Rss().refresh_rss_metainfo, 'interval', hours=RSS_REFRESH_TMDB_INTERVAL)
 
+        # 订阅日历，定时刷新上映日期缓存
+        self.SCHEDULER.add_job(RssCalendar().refresh, 'interval', hours=RSS_CALENDAR_REFRESH_INTERVAL)
+
         # 定时清除未识别的缓存
         self.SCHEDULER.add_job(MetaHelper().delete_unknown_meta, 'interval', hours=META_DELETE_UNKNOWN_INTERVAL)
 
@@ -49,19 +49,43 @@ class Searcher:
         :param in_from: 搜索渠道
         :return: 命中的资源媒体信息列表
         """
+        ret_array = []
+        for result in self.search_medias_iter(key_word=key_word,
+                                              filter_args=filter_args,
+                                              match_type=match_type,
+                                              match_media=match_media,
+                                              in_from=in_from):
+            ret_array.extend(result)
+        return ret_array
+
+    def search_medias_iter(self,
+                           key_word,
+                           filter_args: dict,
+                           match_type,
+                           match_media=None,
+                           in_from: SearchType = None):
+        """
+        根据关键字调用索引器检查媒体，每个索引器检索完成后立即返回其结果
+        :param key_word: 检索的关键字，不能为空
+        :param filter_args: 过滤条件
+        :param match_type: 匹配模式：0-识别并模糊匹配；1-识别并精确匹配；2-不识别匹配
+        :param match_media: 区配的媒体信息
+        :param in_from: 搜索渠道
+        :return: 生成器，每次返回一个索引器命中的资源媒体信息列表
+        """
         if not key_word:
-            return []
+            return
         if not self.indexer:
-            return []
+            return
         # 检索IMDBID
         if match_media and not match_media.imdb_id:
             match_media.set_tmdb_info(self.media.get_tmdb_info(mtype=match_media.type,
                                                                tmdbid=match_media.tmdb_id))
-        return self.indexer.search_by_keyword(key_word=key_word,
-                                              filter_args=filter_args,
-                                              match_type=match_type,
-                                              match_media=match_media,
-                                              in_from=in_from)
+        yield from self.indexer.search_by_keyword_iter(key_word=key_word,
+                                                       filter_args=filter_args,
+                                                       match_type=match_type,
+                                                       match_media=match_media,
+                                                       in_from=in_from)
 
     def search_one_media(self, media_info,
                          in_from: SearchType,
@@ -1,5 +1,6 @@
 import os
 import threading
+import time
 import traceback
 
 from watchdog.events import FileSystemEventHandler
@@ -8,13 +9,15 @@ from watchdog.observers.polling import PollingObserver
 
 import log
 from app.helper import SqlHelper
-from config import RMT_MEDIAEXT, Config
+from config import RMT_MEDIAEXT, Config, SYNC_EVENT_DEBOUNCE_SECONDS
 from app.filetransfer import FileTransfer
+from app.utils.cache_manager import cacheman
 from app.utils.commons import singleton
 from app.utils import PathUtils
 from app.utils.types import SyncType, OsType, RmtMode
 
 lock = threading.Lock()
+event_lock = threading.Lock()
 
 
 class FileMonitorHandler(FileSystemEventHandler):
@@ -46,9 +49,13 @@ class Sync(object):
     __observer = []
     __sync_path = None
     __sync_sys = OsType.LINUX
-    __synced_files = []
     __need_sync_paths = {}
     __sync_mod = None
+    # 待处理的文件事件：{目录: {"time": 最后事件时间, "files": {文件: 事件描述}}}
+    __pending_events = {}
+    # 监控目录前缀树
+    __path_tree = {}
+    __event_stop = None
 
     # 转移模式
     __sync_mode_dict = {
@@ -154,6 +161,7 @@ class Sync(object):
                                                      'onlylink': only_link, 'syncmod': path_syncmode}
                 else:
                     log.error("【Sync】%s 目录不存在！" % monpath)
+        self.__build_path_tree()
 
     def get_sync_dirs(self):
         """
@@ -163,126 +171,177 @@ class Sync(object):
             return []
         return [os.path.normpath(key) for key in self.sync_dir_config.keys()]
 
+    def __build_path_tree(self):
+        """
+        按路径层级构建监控目录前缀树，目的目录、未识别目录及媒体库目录标记为排除
+        """
+        path_tree = {}
+
+        def add_path(path, monitor=None, exclude=False):
+            if not path:
+                return
+            node = path_tree
+            for part in os.path.normpath(path).split(os.sep):
+                node = node.setdefault(part, {})
+            if monitor:
+                node["$monitor"] = monitor
+            if exclude:
+                node["$exclude"] = True
+
+        for monpath, target_dirs in self.sync_dir_config.items():
+            add_path(monpath, monitor=monpath)
+            add_path(target_dirs.get('target'), exclude=True)
+            add_path(target_dirs.get('unknown'), exclude=True)
+        for target_dir in self.filetransfer.get_target_dirs():
+            add_path(target_dir, exclude=True)
+        self.__path_tree = path_tree
+
+    def __match_path_tree(self, event_path):
+        """
+        查找文件所属的监控目录
+        :return: 最深一级的监控目录，不在监控目录或在排除目录下时返回None
+        """
+        monitor_dir = None
+        node = self.__path_tree
+        for part in os.path.normpath(event_path).split(os.sep):
+            node = node.get(part)
+            if node is None:
+                break
+            if node.get("$exclude"):
+                return None
+            if node.get("$monitor"):
+                monitor_dir = node.get("$monitor")
+        return monitor_dir
+
     def file_change_handler(self, event, text, event_path):
         """
-        处理文件变化
+        登记文件变化，同一文件的多次事件合并，由事件处理线程按目录批量处理
         :param event: 事件
         :param text: 事件描述
         :param event_path: 事件文件路径
         """
-        if not event.is_directory:
-            # 文件发生变化
+        if event.is_directory:
+            return
+        from_dir = os.path.dirname(event_path)
+        with event_lock:
+            dir_events = self.__pending_events.setdefault(from_dir, {"files": {}})
+            dir_events["time"] = time.time()
+            dir_events["files"][event_path] = text
+
+    def __pop_ready_events(self):
+        """
+        取出已超过合并等待时间的目录下的所有文件事件
+        """
+        ready_events = []
+        now = time.time()
+        with event_lock:
+            for from_dir in list(self.__pending_events):
+                if now - self.__pending_events[from_dir].get("time") < SYNC_EVENT_DEBOUNCE_SECONDS:
+                    continue
+                ready_events.extend(self.__pending_events.pop(from_dir).get("files").items())
+        return ready_events
+
+    def __event_worker(self, stop_event):
+        """
+        事件处理线程，批量处理合并后的文件事件，识别转移的文件统一交给transfer_mon_files
+        """
+        while not stop_event.wait(1):
             try:
-                if not os.path.exists(event_path):
-                    return
-                log.debug("【Sync】文件%s：%s" % (text, event_path))
-                # 判断是否处理过了
-                need_handler_flag = False
-                try:
-                    lock.acquire()
-                    if event_path not in self.__synced_files:
-                        self.__synced_files.append(event_path)
-                        need_handler_flag = True
-                finally:
-                    lock.release()
-                if not need_handler_flag:
-                    log.debug("【Sync】文件已处理过：%s" % event_path)
-                    return
-                # 不是监控目录下的文件不处理
-                is_monitor_file = False
-                for tpath in self.sync_dir_config.keys():
-                    if PathUtils.is_path_in_path(tpath, event_path):
-                        is_monitor_file = True
-                        break
-                if not is_monitor_file:
-                    return
-                # 目的目录的子文件不处理
-                for tpath in self.sync_dir_config.values():
-                    if not tpath:
-                        continue
-                    if PathUtils.is_path_in_path(tpath.get('target'), event_path):
-                        return
-                    if PathUtils.is_path_in_path(tpath.get('unknown'), event_path):
-                        return
-                # 媒体库目录及子目录不处理
-                if self.filetransfer.is_target_dir_path(event_path):
-                    return
-                # 回收站及隐藏的文件不处理
-                if PathUtils.is_invalid_path(event_path):
-                    return
-                # 上级目录
-                from_dir = os.path.dirname(event_path)
-                # 找到是哪个监控目录下的
-                monitor_dir = event_path
-                is_root_path = False
-                for m_path in self.sync_dir_config.keys():
-                    if PathUtils.is_path_in_path(m_path, event_path):
-                        monitor_dir = m_path
-                    if m_path == from_dir:
-                        is_root_path = True
-
-                # 查找目的目录
-                target_dirs = self.sync_dir_config.get(monitor_dir)
-                target_path = target_dirs.get('target')
-                unknown_path = target_dirs.get('unknown')
-                onlylink = target_dirs.get('onlylink')
-                sync_mode = target_dirs.get('syncmod')
-
-                # 只做硬链接，不做识别重命名
-                if onlylink:
-                    if SqlHelper.is_sync_in_history(event_path, target_path):
-                        return
-                    log.info("【Sync】开始同步 %s" % event_path)
-                    ret = self.filetransfer.link_sync_files(src_path=monitor_dir,
-                                                            in_file=event_path,
-                                                            target_dir=target_path,
-                                                            sync_transfer_mode=sync_mode)
-                    if ret != 0:
-                        log.warn("【Sync】%s 同步失败，错误码：%s" % (event_path, ret))
-                    else:
-                        SqlHelper.insert_sync_history(event_path, monitor_dir, target_path)
-                        log.info("【Sync】%s 同步完成" % event_path)
-                # 识别转移
-                else:
-                    # 不是媒体文件不处理
-                    name = os.path.basename(event_path)
-                    if not name:
-                        return
-                    if name.lower() != "index.bdmv":
-                        ext = os.path.splitext(name)[-1]
-                        if ext.lower() not in RMT_MEDIAEXT:
-                            return
-                    # 监控根目录下的文件发生变化时直接发走
-                    if is_root_path:
-                        ret, ret_msg = self.filetransfer.transfer_media(in_from=SyncType.MON,
-                                                                        in_path=event_path,
-                                                                        target_dir=target_path,
-                                                                        unknown_dir=unknown_path,
-                                                                        rmt_mode=sync_mode)
-                        if not ret:
-                            log.warn("【Sync】%s 转移失败：%s" % (event_path, ret_msg))
-                    else:
-                        try:
-                            lock.acquire()
-                            if self.__need_sync_paths.get(from_dir):
-                                files = self.__need_sync_paths[from_dir].get('files')
-                                if not files:
-                                    files = [event_path]
-                                else:
-                                    if event_path not in files:
-                                        files.append(event_path)
-                                    else:
-                                        return
-                                self.__need_sync_paths[from_dir].update({'files': files})
-                            else:
-                                self.__need_sync_paths[from_dir] = {'target': target_path,
-                                                                    'unknown': unknown_path,
-                                                                    'syncmod': sync_mode,
-                                                                    'files': [event_path]}
-                        finally:
-                            lock.release()
+                ready_events = self.__pop_ready_events()
+                if not ready_events:
+                    continue
+                need_transfer = False
+                for event_path, text in ready_events:
+                    if self.__handle_file_event(event_path, text):
+                        need_transfer = True
+                if need_transfer:
+                    self.transfer_mon_files()
             except Exception as e:
-                log.error("【Sync】发生错误：%s - %s" % (str(e), traceback.format_exc()))
+                log.error("【Sync】处理目录监控事件出错：%s - %s" % (str(e), traceback.format_exc()))
+
+    def __handle_file_event(self, event_path, text):
+        """
+        处理文件变化
+        :param event_path: 事件文件路径
+        :param text: 事件描述
+        :return: 是否登记了待转移文件
+        """
+        try:
+            if not os.path.exists(event_path):
+                return False
+            log.debug("【Sync】文件%s：%s" % (text, event_path))
+            # 判断是否处理过了，文件大小或修改时间变化后视为新文件
+            file_stat = os.stat(event_path)
+            file_key = (event_path, file_stat.st_size, file_stat.st_mtime)
+            synced_files = cacheman["sync_files"]
+            if synced_files.has(file_key):
+                log.debug("【Sync】文件已处理过：%s" % event_path)
+                return False
+            synced_files.set(file_key, True)
+            # 找到是哪个监控目录下的，不是监控目录下的文件、目的目录及媒体库目录下的文件不处理
+            monitor_dir = self.__match_path_tree(event_path)
+            if not monitor_dir:
+                return False
+            # 回收站及隐藏的文件不处理
+            if PathUtils.is_invalid_path(event_path):
+                return False
+            # 上级目录
+            from_dir = os.path.dirname(event_path)
+            is_root_path = from_dir in self.sync_dir_config
+
+            # 查找目的目录
+            target_dirs = self.sync_dir_config.get(monitor_dir)
+            target_path = target_dirs.get('target')
+            unknown_path = target_dirs.get('unknown')
+            onlylink = target_dirs.get('onlylink')
+            sync_mode = target_dirs.get('syncmod')
+
+            # 只做硬链接，不做识别重命名
+            if onlylink:
+                if SqlHelper.is_sync_in_history(event_path, target_path):
+                    return False
+                log.info("【Sync】开始同步 %s" % event_path)
+                ret = self.filetransfer.link_sync_files(src_path=monitor_dir,
+                                                        in_file=event_path,
+                                                        target_dir=target_path,
+                                                        sync_transfer_mode=sync_mode)
+                if ret != 0:
+                    log.warn("【Sync】%s 同步失败，错误码：%s" % (event_path, ret))
+                else:
+                    SqlHelper.insert_sync_history(event_path, monitor_dir, target_path)
+                    log.info("【Sync】%s 同步完成" % event_path)
+                return False
+            # 识别转移
+            # 不是媒体文件不处理
+            name = os.path.basename(event_path)
+            if not name:
+                return False
+            if name.lower() != "index.bdmv":
+                ext = os.path.splitext(name)[-1]
+                if ext.lower() not in RMT_MEDIAEXT:
+                    return False
+            # 监控根目录下的文件发生变化时直接发走
+            if is_root_path:
+                ret, ret_msg = self.filetransfer.transfer_media(in_from=SyncType.MON,
+                                                                in_path=event_path,
+                                                                target_dir=target_path,
+                                                                unknown_dir=unknown_path,
+                                                                rmt_mode=sync_mode)
+                if not ret:
+                    log.warn("【Sync】%s 转移失败：%s" % (event_path, ret_msg))
+                return False
+            with lock:
+                if self.__need_sync_paths.get(from_dir):
+                    self.__need_sync_paths[from_dir].setdefault('files', set()).add(event_path)
+                else:
+                    self.__need_sync_paths[from_dir] = {'target': target_path,
+                                                        'unknown': unknown_path,
+                                                        'syncmod': sync_mode,
+                                                        'files': {event_path}}
+            return True
+        except Exception as e:
+            log.error("【Sync】发生错误：%s - %s" % (str(e), traceback.format_exc()))
+            return False
 
     def transfer_mon_files(self):
         """
@@ -298,7 +357,7 @@ class Sync(object):
                     bluray_dir = PathUtils.get_bluray_dir(path)
                     if not bluray_dir:
                         src_path = path
-                        files = target_info.get('files')
+                        files = sorted(target_info.get('files') or [])
                     else:
                         src_path = bluray_dir
                         files = []
@@ -326,6 +385,9 @@ class Sync(object):
         启动监控服务
         """
         self.__observer = []
+        if self.sync_dir_config:
+            self.__event_stop = threading.Event()
+            threading.Thread(target=self.__event_worker, args=(self.__event_stop,), daemon=True).start()
         for monpath in self.sync_dir_config.keys():
             if monpath and os.path.exists(monpath):
                 try:
@@ -351,6 +413,9 @@ class Sync(object):
             for observer in self.__observer:
                 observer.stop()
         self.__observer = []
+        if self.__event_stop:
+            self.__event_stop.set()
+            self.__event_stop = None
 
     def transfer_all_sync(self):
         """
@@ -4,6 +4,7 @@ from .http_utils import RequestUtils
 from .json_utils import JsonUtils
 from .number_utils import NumberUtils
 from .path_utils import PathUtils
+from .rss_utils import RssUtils
 from .string_utils import StringUtils
 from .system_utils import SystemUtils
 from .tokens import Tokens
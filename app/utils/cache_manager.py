@@ -2,7 +2,9 @@
 from cacheout import CacheManager, LRUCache
 
 CACHES = {
-    "tmdb_supply": {'maxsize': 200}
+    "tmdb_supply": {'maxsize': 200},
+    # 目录监控已处理文件，按(路径, 大小, 修改时间)去重，保留7天
+    "sync_files": {'maxsize': 50000, 'ttl': 7 * 24 * 3600}
 }
 
 cacheman = CacheManager(CACHES, cache_class=LRUCache)
@@ -0,0 +1,170 @@
+import re
+from io import BytesIO
+
+from lxml import etree
+
+from app.utils.string_utils import StringUtils
+
+
+class RssUtils:
+    # XML声明中的编码
+    _XML_ENCODING_RE = re.compile(rb"^\s*<\?xml[^>]*encoding\s*=", re.I)
+    # 按声明解析即可的字节序标记
+    _XML_BOMS = (b"\xef\xbb\xbf", b"\xff\xfe", b"\xfe\xff")
+
+    @staticmethod
+    def get_xml_content(res):
+        """
+        获取交给XML解析的报文：报文有字节序标记或声明了编码时返回原始字节，由解析器按声明解码，
+        否则按HTTP头中的编码，或不是合法UTF-8时按探测到的编码解码后返回文本，避免没有声明的GBK等编码报文被当作UTF-8解析
+        :param res: 请求结果
+        """
+        content = res.content
+        if not content \
+                or content.startswith(RssUtils._XML_BOMS) \
+                or RssUtils._XML_ENCODING_RE.match(content[:256]):
+            return content
+        encoding = None
+        content_type = res.headers.get("Content-Type") or ""
+        if "charset=" in content_type.lower():
+            encoding = res.encoding
+        if not encoding:
+            # 没有声明时XML默认为UTF-8，不是合法的UTF-8时才探测编码
+            try:
+                content.decode("utf-8")
+                return content
+            except UnicodeDecodeError:
+                encoding = res.apparent_encoding
+        if not encoding or encoding.lower().replace("_", "-") in ["utf-8", "ascii"]:
+            return content
+        try:
+            return content.decode(encoding, errors="replace")
+        except LookupError:
+            return content
+
+    @staticmethod
+    def __iter_items(content):
+        """
+        流式解析XML，逐个返回item节点，处理完的节点随即释放，内存占用与报文大小无关
+        :param content: XML报文，文本按UTF-8编码后解析，字节按报文声明的编码解析
+        :return: item节点下的 {标签名: 第一个该标签节点} 及 torznab:attr 属性字典
+        """
+        if not content:
+            return
+        if isinstance(content, str):
+            content = content.encode("utf-8")
+        for _, elem in etree.iterparse(BytesIO(content), events=("end",), recover=True, huge_tree=True):
+            # 只匹配没有前缀的标签，<atom:link>、<media:title>等扩展标签不作为RSS的link、title
+            if not isinstance(elem.tag, str) or elem.prefix or etree.QName(elem).localname != "item":
+                continue
+            nodes = {}
+            attrs = {}
+            for child in elem.iter():
+                if child is elem or not isinstance(child.tag, str):
+                    continue
+                tag = etree.QName(child).localname
+                if tag == "attr":
+                    attrs[child.get("name")] = child.get("value")
+                elif not child.prefix and tag not in nodes:
+                    nodes[tag] = child
+            yield nodes, attrs
+            # 释放已处理的节点
+            elem.clear()
+            parent = elem.getparent()
+            while parent is not None and elem.getprevious() is not None:
+                del parent[0]
+
+    @staticmethod
+    def __node_text(nodes, tag, default=None):
+        node = nodes.get(tag)
+        if node is not None and node.text:
+            return node.text
+        return default
+
+    @staticmethod
+    def __node_attr(nodes, tag, attname, default=None):
+        node = nodes.get(tag)
+        if node is not None and node.get(attname):
+            return node.get(attname)
+        return default
+
+    @staticmethod
+    def __str_int(value):
+        if value and str(value).isdigit():
+            return int(value)
+        return 0
+
+    @staticmethod
+    def parse_rss_items(content):
+        """
+        解析RSS报文，逐个返回种子信息
+        :param content: RSS报文
+        :return: {title, enclosure, size, description, link, pubdate}
+        """
+        for nodes, _ in RssUtils.__iter_items(content):
+            try:
+                # 标题
+                title = RssUtils.__node_text(nodes, "title", default="")
+                if not title:
+                    continue
+                # 种子链接
+                enclosure = RssUtils.__node_attr(nodes, "enclosure", "url", default="")
+                if not enclosure:
+                    continue
+                # 发布日期
+                pubdate = RssUtils.__node_text(nodes, "pubDate", default="")
+                if pubdate:
+                    # 转换为时间
+                    pubdate = StringUtils.get_time_stamp(pubdate)
+                yield {'title': title,
+                       'enclosure': enclosure,
+                       'size': RssUtils.__str_int(RssUtils.__node_attr(nodes, "enclosure", "length", default=0)),
+                       'description': RssUtils.__node_text(nodes, "description", default=""),
+                       'link': RssUtils.__node_text(nodes, "link", default=""),
+                       'pubdate': pubdate}
+            except Exception as err:
+                print(str(err))
+                continue
+
+    @staticmethod
+    def parse_torznab_items(content):
+        """
+        解析Torznab报文，逐个返回种子信息
+        :param content: Torznab报文
+        :return: {indexer_id, indexer, title, enclosure, description, size, seeders, peers, freeleech,
+                  downloadvolumefactor, uploadvolumefactor, page_url, imdbid}
+        """
+        for nodes, attrs in RssUtils.__iter_items(content):
+            try:
+                # 标题
+                title = RssUtils.__node_text(nodes, "title", default="")
+                if not title:
+                    continue
+                # 种子链接
+                enclosure = RssUtils.__node_attr(nodes, "enclosure", "url", default="")
+                if not enclosure:
+                    continue
+                # indexer id
+                indexer_id = RssUtils.__node_attr(nodes, "jackettindexer", "id",
+                                                  default=RssUtils.__node_attr(nodes, "prowlarrindexer", "id", ""))
+                # indexer
+                indexer = RssUtils.__node_text(nodes, "jackettindexer",
+                                               default=RssUtils.__node_text(nodes, "prowlarrindexer", default=""))
+                # 下载因子
+                downloadvolumefactor = attrs.get("downloadvolumefactor") or 1.0
+                yield {'indexer_id': indexer_id,
+                       'indexer': indexer,
+                       'title': title,
+                       'enclosure': enclosure,
+                       'description': RssUtils.__node_text(nodes, "description", default=""),
+                       'size': RssUtils.__str_int(RssUtils.__node_text(nodes, "size", default=0)),
+                       'seeders': attrs.get("seeders") or 0,
+                       'peers': attrs.get("peers") or 0,
+                       'freeleech': float(downloadvolumefactor) == 0,
+                       'downloadvolumefactor': downloadvolumefactor,
+                       'uploadvolumefactor': attrs.get("uploadvolumefactor") or 1.0,
+                       'page_url': RssUtils.__node_text(nodes, "comments", default=""),
+                       'imdbid': attrs.get("imdbid") or ""}
+            except Exception as err:
+                print(str(err))
+                continue
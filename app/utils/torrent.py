@@ -1,7 +1,7 @@
+import base64
 import os.path
 import re
 from urllib.parse import quote
-import bencode
 from lxml import etree
 
 from app.utils.torrentParser import TorrentParser
@@ -75,7 +75,7 @@ class Torrent:
             if req and req.status_code == 200:
                 if not req.content:
                     return None, "未下载到种子数据"
-                metadata = bencode.bdecode(req.content)
+                metadata, _, _ = TorrentParser.decode(req.content)
                 if not metadata or not isinstance(metadata, dict):
                     return None, "不正确的种子文件"
                 return req.content, ""
@@ -86,6 +86,48 @@ class Torrent:
         except Exception as err:
             return None, "下载种子文件出现异常：%s，可能站点Cookie已过期或触发了站点首次种子下载" % str(err)
 
+    @staticmethod
+    def get_infohash(content):
+        """
+        在本地计算种子的InfoHash，支持种子文件内容及磁力链
+        :param content: 种子文件内容或磁力链
+        :return: 40位小写十六进制InfoHash，无法计算时返回None
+        """
+        if not content:
+            return None
+        if isinstance(content, str):
+            if not content.startswith("magnet:"):
+                return None
+            hash_text = re.search(r"urn:btih:([0-9a-z]+)", content, re.IGNORECASE)
+            if not hash_text:
+                return None
+            hash_text = hash_text.group(1)
+            if len(hash_text) == 40:
+                return hash_text.lower()
+            if len(hash_text) == 32:
+                try:
+                    return base64.b32decode(hash_text.upper()).hex()
+                except Exception as err:
+                    print(str(err))
+            return None
+        torrent_info = Torrent.get_torrent_info(content)
+        return torrent_info.get("infohash") if torrent_info else None
+
+    @staticmethod
+    def get_torrent_info(content):
+        """
+        解析种子文件内容，获取InfoHash、名称及文件清单
+        :param content: 种子文件内容
+        :return: {infohash, name, size, files: [{path, size}]}，解析失败时返回None
+        """
+        if not content or isinstance(content, str):
+            return None
+        try:
+            return TorrentParser.parse(content)
+        except Exception as err:
+            print(str(err))
+            return None
+
     @staticmethod
     def save_torrent_file(url, path, cookie, ua):
         """
@@ -259,17 +301,12 @@ class Torrent:
     def get_torrent_files(path):
         """
         解析Torrent文件，获取文件清单
+        :return: 文件在种子中的相对路径列表
         """
         if not path or not os.path.exists(path):
             return []
-        file_names = []
-        try:
-            torrent = TorrentParser().readFile(path=path)
-            if torrent.get("torrent"):
-                files = torrent.get("torrent").get("info", {}).get("files") or []
-                for item in files:
-                    if item.get("path"):
-                        file_names.append(item["path"][0])
-        except Exception as err:
-            print(str(err))
-        return file_names
+        with open(path, "rb") as f:
+            torrent_info = Torrent.get_torrent_info(f.read())
+        if not torrent_info:
+            return []
+        return [file.get("path") for file in torrent_info.get("files")]
@@ -1,283 +1,124 @@
-import io
 import hashlib
-import urllib.parse
 
 
 class TorrentParser:
-    level = -1  # Pretty printing when self.logging
-    debug = False
-    info_start = 0
-    info_end = 0
-    info_start_dict = 0
-    open_dicts = 0
-    file = None
-
-    def log(self, text):
-        if self.debug:
-            print("  " * (self.level + text))
+    """
+    bencode解码，单次遍历memoryview，不逐字节读取：
+    pieces等大块二进制只返回memoryview切片不复制，同时记录info字典在原始内容中的位置用于计算InfoHash
+    """
+    # 只返回memoryview切片的键
+    _view_keys = {"pieces"}
 
     @staticmethod
-    def isNumeric(i):
-        try:
-            int(i)
-            return True
-        except ValueError:
-            return False
-
-    def readDict(self, str_data=None):
-
-        self.open_dicts += 1
-
-        self.level += 1
-
-        if str_data is not None:
-            if isinstance(str_data, str):
-                str_data = str_data.encode("utf-8")
-            self.file = io.BytesIO(str_data)
-
-        self.log("readDict at %i" % self.file.tell())
-        dictionary = {}
-        key = None
-        value = None
-
-        c = True
-        while c:
-            c = self.file.read(1)
-            try:
-                d = c.decode("utf-8")
-            except UnicodeDecodeError:
-                continue
-
-            if d == 'd':
-                # Recursion!
-                newD = self.readDict()
-                # Dictionaries can only be values
-                if value is None:
-                    value = newD
-
-            if d == 'l':
-                # List
-                self.level += 1
-                l = self.readList()
-                # Lists can only be values
-                if value is None:
-                    value = l
-                self.level -= 1
-
-            if self.isNumeric(d):
-                # String
-                self.level += 1
-                self.file.seek(-1, io.SEEK_CUR)  # Start of the string, ex. 6:foobar
-                s = self.readString()
-                if key is not None:
-                    # If the key is set, this is the value
-                    value = s
-                else:
-                    # If the key isn't set, this is the key
-                    key = s
-                    if key == "info":
-                        # Info data starts here
-                        self.info_start_dict = self.open_dicts
-                        self.info_start = self.file.tell()
-                self.level -= 1
-
-            if d == 'i':
-                # Integer
-                self.level += 1
-                self.file.seek(-1, io.SEEK_CUR)  # Start of the integer, ex. i42e
-                i = self.readInt()
-                if key is not None:
-                    # If the key is set, this is the value
-                    value = i
-                else:
-                    # If the key isn't set, this is the key
-                    key = i
-                self.level -= 1
-
-            if d == 'e':
-                # Dict close
-                self.level -= 1
-                if self.info_start_dict == self.open_dicts:
-                    # Info data ends
-                    self.info_end = self.file.tell() - 1
-                self.open_dicts -= 1
-                break
-
-            # Bencoded files are dictionaries so we need both key and value
-            if key is not None and value is not None:
-                dictionary[key] = value
-                key = None
-                value = None
-
-            if key is None and value is not None and str_data is not None:
-                return value
-
-        return dictionary
-
-    def readList(self):
-        self.log("readList at %i" % self.file.tell())
-        c = True
-
-        list_values = []
-
-        while c:
-            c = self.file.read(1)
-            try:
-                d = c.decode("utf-8")
-            except UnicodeDecodeError:
-                continue
-
-            if d == 'd':
-                newD = self.readDict()
-                list_values.append(newD)
-
-            if d == 'l':
-                # List
-                self.level += 1
-                l = self.readList()
-
-                list_values.append(l)
-
-                self.level -= 1
-
-            if self.isNumeric(d):
-                # String
-                self.level += 1
-                self.file.seek(-1, io.SEEK_CUR)  # Start of the string, ex. 6:foobar
-                s = self.readString()
-
-                list_values.append(s)
-
-                self.level -= 1
-
-            if d == 'i':
-                # Integer
-                self.level += 1
-                self.file.seek(-1, io.SEEK_CUR)  # Start of the integer, ex. i42e
-                i = self.readInt()
-
-                list_values.append(i)
-
-                self.level -= 1
-
-            if d == 'e':
-                # List end
-                self.level -= 1
-                break
-
-        return list_values
-
-    @staticmethod
-    def _readCharacter(fileObj):
-        try:
-            return fileObj.read(1).decode("utf-8")
-        except UnicodeDecodeError:
-            raise ValueError("Malformed integer: UnicodeDecodeError")
-
-    def readInt(self):
+    def decode(content):
         """
-        Ints must be of the form i[0-9]+e or i-[0-9]+e
+        解码bencode内容
+        :param content: 种子文件内容
+        :return: 解码后的数据，info字典的起始位置，结束位置（不含），无info时位置为None
         """
-        self.log("readInt at %i" % self.file.tell())
-
-        # Integers must be encapsulated, ex. i42e = 42
-
-        if not self._readCharacter(self.file) == 'i':
-            raise ValueError("Malformed integer - must lead with 'i'")
-
-        num = ""
-        while True:
-            # We read the file until 'e'
-            d = self.file.read(1).decode("utf-8")
-
-            if self.isNumeric(d) or d == '-':
-                num += d
-            elif d == 'e':
-                # Correctly read integer
-                break
-            else:
-                raise ValueError("Malformed integer element - {} + *{}*".format(num, d))
-
-        realInt = int(num)
-
-        self.level += 1
-        self.log("Int: %i" % realInt)
-        self.level -= 1
-        return realInt
-
-    def readString(self):
-        self.log("readString at %i" % self.file.tell())
-        # Read the length of the string
-        b = True
-        len_text = ""
-
-        # Read file until non-numeric value
-        while b:
-            b = self.file.read(1)
+        if isinstance(content, str):
+            content = content.encode("utf-8")
+        data = bytes(content)
+        view = memoryview(data)
+        length = len(data)
+        find = data.find
+        view_keys = TorrentParser._view_keys
+        info_span = [None, None]
+
+        def __string(pos):
+            colon = find(b":", pos)
+            if colon < 0:
+                raise ValueError("Malformed string at %s" % pos)
+            start = colon + 1
+            end = start + int(data[pos:colon])
+            if end > length:
+                raise ValueError("String out of range at %s" % pos)
+            return start, end
+
+        def __text(start, end):
             try:
-                d = b.decode("utf-8")
+                return data[start:end].decode("utf-8")
             except UnicodeDecodeError:
-                raise ValueError("Malformed UTF-8 string")
-            if self.isNumeric(d):
-                len_text += d
-            else:
-                break
-        # Now we have the length of the string
-        str_len = int(len_text)
-
-        # Read the string
-        string = self.file.read(str_len)
+                return data[start:end]
+
+        def __value(pos, depth):
+            c = data[pos]
+            # 整数 i42e
+            if c == 0x69:
+                end = find(b"e", pos)
+                if end < 0:
+                    raise ValueError("Malformed integer at %s" % pos)
+                return int(data[pos + 1:end]), end + 1
+            # 字符串 6:foobar
+            if 0x30 <= c <= 0x39:
+                start, end = __string(pos)
+                return __text(start, end), end
+            # 列表 l...e
+            if c == 0x6c:
+                pos += 1
+                values = []
+                while data[pos] != 0x65:
+                    value, pos = __value(pos, depth + 1)
+                    values.append(value)
+                return values, pos + 1
+            # 字典 d...e
+            if c == 0x64:
+                pos += 1
+                values = {}
+                while data[pos] != 0x65:
+                    start, end = __string(pos)
+                    key = __text(start, end)
+                    pos = end
+                    if key in view_keys and 0x30 <= data[pos] <= 0x39:
+                        start, end = __string(pos)
+                        values[key] = view[start:end]
+                        pos = end
+                        continue
+                    value_start = pos
+                    value, pos = __value(pos, depth + 1)
+                    if depth == 0 and key == "info":
+                        info_span[0], info_span[1] = value_start, pos
+                    values[key] = value
+                return values, pos + 1
+            raise ValueError("Unexpected byte %s at %s" % (chr(c), pos))
+
+        if not length:
+            raise ValueError("Empty content")
         try:
-            utfString = string.decode("utf-8")
-            self.level += 1
-            self.log("String: %s" % utfString)
-            self.level -= 1
-            return utfString
-        except UnicodeDecodeError:
-            # If we can't decode the string as UTF-8 then it's data
-            self.level += 1
-            self.log("Data")
-            self.level -= 1
-            # Return "raw" data
-            return string
-
-    def readFile(self, path):
+            ret, _ = __value(0, 0)
+        except IndexError:
+            raise ValueError("Unexpected end of content")
+        return ret, info_span[0], info_span[1]
 
-        self.file = open(path, "rb")
-
-        # I think that there can't be multiple dictionaries at root level
-        # Correct me if I'm wrong
-
-        dictionary = {}
-
-        # Read torrent file
-
-        c = self.file.read(1)
-        while c:
-            try:
-                d = c.decode("utf-8")
-            except UnicodeDecodeError:
-                continue
-            if d == 'd':
-                # Dictionary
-                self.open_dicts += 1
-                dictionary["torrent"] = self.readDict()
-            c = self.file.read(1)
-
-        # Calculate infohash
-        # Infohash is a SHA-1 hash of the value of the info key (bencoded dict)
-
-        self.file.seek(self.info_start)
-        infohash_data = self.file.read(self.info_end - self.info_start)
-
-        infohash = hashlib.sha1(infohash_data)
-
-        self.file.close()
-
-        # Infohash in a few different formats
-        extra = {"infohash": {"digest": infohash.digest(), "hex": infohash.hexdigest(),
-                              "url": urllib.parse.quote(infohash.digest())}}
-
-        dictionary["extra_data"] = extra
+    @staticmethod
+    def parse(content):
+        """
+        解析种子文件内容
+        :param content: 种子文件内容
+        :return: {infohash, name, size, files: [{path, size}]}，非种子文件时返回None
+        """
+        if isinstance(content, str):
+            content = content.encode("utf-8")
+        metadata, info_start, info_end = TorrentParser.decode(content)
+        if not isinstance(metadata, dict) or not isinstance(metadata.get("info"), dict):
+            return None
+        info = metadata.get("info")
+        name = TorrentParser.__str(info.get("name.utf-8") or info.get("name"))
+        files = []
+        if info.get("files"):
+            for item in info.get("files"):
+                path = item.get("path.utf-8") or item.get("path") or []
+                files.append({"path": "/".join([TorrentParser.__str(x) for x in path]),
+                              "size": item.get("length") or 0})
+        else:
+            files.append({"path": name, "size": info.get("length") or 0})
+        return {"infohash": hashlib.sha1(memoryview(content)[info_start:info_end]).hexdigest(),
+                "name": name,
+                "size": sum([file.get("size") for file in files]),
+                "files": files}
 
-        return dictionary
+    @staticmethod
+    def __str(value):
+        if isinstance(value, bytes):
+            return value.decode("utf-8", "ignore")
+        return str(value) if value is not None else ""
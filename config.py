@@ -35,6 +35,8 @@ METAINFO_SAVE_INTERVAL = 600
 RELOAD_CONFIG_INTERVAL = 600
 # SYNC目录同步聚合转移时间
 SYNC_TRANSFER_INTERVAL = 60
+# SYNC目录监控事件合并等待时间（秒），同一目录在该时间内无新事件时批量处理
+SYNC_EVENT_DEBOUNCE_SECONDS = 10
 # RSS队列中处理时间间隔
 RSS_CHECK_INTERVAL = 300
 # 站点流量数据刷新时间间隔（小时）
@@ -43,10 +45,48 @@ REFRESH_PT_DATA_INTERVAL = 6
 RSS_REFRESH_TMDB_INTERVAL = 6
 # 刷流删除的检查时间间隔
 BRUSH_REMOVE_TORRENTS_INTERVAL = 300
+# 刷流任务已处理RSS种子的保留天数及每个任务的最大保留数量
+BRUSH_RSS_SEEN_DAYS = 7
+BRUSH_RSS_SEEN_MAX = 5000
 # 定时清除未识别的缓存时间间隔（小时）
 META_DELETE_UNKNOWN_INTERVAL = 12
 # 定时刷新壁纸的间隔（小时）
 REFRESH_WALLPAPER_INTERVAL = 1
+# 索引器检索线程数
+SEARCH_INDEXER_THREADS = 20
+# 单个索引器检索超时时间（秒）
+SEARCH_INDEXER_TIMEOUT = 60
+# 索引器平均耗时超过该值（秒）时标记为慢速索引器
+SEARCH_INDEXER_SLOW_SECONDS = 20
+# 文件转移并发线程数
+FILE_TRANSFER_THREADS = 4
+# 文件识别时并发查询TMDB的线程数
+MEDIA_SEARCH_THREADS = 5
+# RSS订阅并发下载及识别的线程数
+RSS_SITE_THREADS = 10
+# RSS订阅单个站点的请求超时时间（秒）
+RSS_SITE_TIMEOUT = 30
+# 订阅日历并发查询的线程数
+RSS_CALENDAR_THREADS = 10
+# 订阅日历上映日期缓存有效期（秒）
+RSS_CALENDAR_CACHE_TTL = 12 * 3600
+# 订阅日历查询失败结果缓存有效期（秒），避免每次打开日历都重复查询失败的订阅
+RSS_CALENDAR_FAIL_CACHE_TTL = 1800
+# 订阅日历后台刷新间隔（小时）
+RSS_CALENDAR_REFRESH_INTERVAL = 6
+# 名称识别结果缓存数量
+META_PARSE_CACHE_SIZE = 5000
+# 种子文件缓存的最大占用空间（字节）
+TORRENT_CACHE_SIZE = 200 * 1024 * 1024
+# 媒体库同步时每页获取的项目数及并发获取的页数
+MEDIASERVER_PAGE_SIZE = 500
+MEDIASERVER_PAGE_THREADS = 3
+# 媒体库全量同步时每批写入数据库的项目数
+MEDIASYNC_BATCH_SIZE = 1000
+# 媒体库增量同步间隔（小时），只获取上次同步后新增或修改的媒体
+MEDIASYNC_DELTA_INTERVAL = 1
+# 剧集索引超过同步周期后仍可使用的时间（秒），覆盖同步本身的耗时，超过后实时查询媒体服务器
+MEDIASYNC_INDEX_GRACE = 1800
 # fanart的api，用于拉取封面图片
 FANART_MOVIE_API_URL = 'https://webservice.fanart.tv/v3/movies/%s?api_key=d2d31f9ecabea050fc7d68aa3146015f'
 FANART_TV_API_URL = 'https://webservice.fanart.tv/v3/tv/%s?api_key=d2d31f9ecabea050fc7d68aa3146015f'
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+"""
+制作组匹配性能对比：原整串扫描的后顾断言正则与分隔符位置锚定匹配
+运行：python -m tests.benchmark_release_groups [自定义制作组数量]
+使用tests/cases/meta_cases.py中的标题，可额外登记指定数量的自定义制作组，同时校验两者结果一致
+"""
+import re
+import sys
+import time
+
+from app.media.meta import release_groups as rg
+from tests.cases.meta_cases import meta_cases
+
+
+def legacy_match(name):
+    return '@'.join(re.findall(rg.release_groups, name))
+
+
+def run(func, titles, rounds=200):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for title in titles:
+            func(title)
+    return (time.perf_counter() - start) / rounds / len(titles) * 1000 * 1000
+
+
+if __name__ == '__main__':
+    custom_count = int(sys.argv[1]) if len(sys.argv) > 1 else 0
+    rg.register_release_groups(["CustomGroup%s(?:|WEB|TV)" % i for i in range(custom_count)])
+    test_titles = [case.get("title") + " " for case in meta_cases if case.get("title")]
+    test_titles += [title.replace("-", "-CustomGroup%s" % (custom_count - 1), 1) for title in test_titles] \
+        if custom_count else []
+    diff = [title for title in test_titles if legacy_match(title) != rg.rg_match(title)]
+    old_cost = run(legacy_match, test_titles)
+    new_cost = run(rg.rg_match, test_titles)
+    print("制作组 %s 个，标题 %s 个，识别出制作组 %s 个，结果不一致 %s 个" % (
+        sum([len(site) for site in rg.sites]) + len(rg.custom_groups), len(test_titles),
+        len([title for title in test_titles if rg.rg_match(title)]), len(diff)))
+    print("原匹配: %8.2fμs/标题  锚定匹配: %8.2fμs/标题  提速 %.1fx" % (old_cost, new_cost, old_cost / new_cost))
+    for title in diff:
+        print(title, legacy_match(title), rg.rg_match(title), sep="\n  ")
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""
+RSS/Torznab解析性能对比：minidom与流式解析
+运行：python -m tests.benchmark_rss_parser [RSS报文文件 ...]
+未指定文件时使用生成的RSS及Torznab报文
+"""
+import sys
+import time
+import tracemalloc
+import xml.dom.minidom
+
+from app.utils import DomUtils, RssUtils, StringUtils
+
+RSS_ITEM = '''<item>
+<title><![CDATA[The.Mandalorian.S02E%02d.1080p.WEB-DL.DDP5.1.H.264-NTb]]></title>
+<link>https://pt.example.com/details.php?id=%d</link>
+<description><![CDATA[曼达洛人 第二季 第%d集 | 类别：剧集]]></description>
+<enclosure url="https://pt.example.com/download.php?id=%d&amp;passkey=abc" length="%d" type="application/x-bittorrent"/>
+<pubDate>Fri, 30 Oct 2020 08:%02d:00 +0800</pubDate>
+</item>
+'''
+
+TORZNAB_ITEM = '''<item>
+<title>The.Mandalorian.S02E%02d.2160p.WEB-DL.DDP5.1.HDR.HEVC-NTb</title>
+<guid>https://indexer.example.com/%d</guid>
+<jackettindexer id="example">Example</jackettindexer>
+<comments>https://pt.example.com/details.php?id=%d</comments>
+<size>%d</size>
+<description>曼达洛人 第二季</description>
+<enclosure url="https://jackett.example.com/dl/example/?id=%d" length="0" type="application/x-bittorrent"/>
+<torznab:attr name="seeders" value="%d"/>
+<torznab:attr name="peers" value="3"/>
+<torznab:attr name="downloadvolumefactor" value="0"/>
+<torznab:attr name="uploadvolumefactor" value="1"/>
+<torznab:attr name="imdbid" value="tt8111088"/>
+</item>
+'''
+
+
+def gen_rss(count):
+    items = "".join(RSS_ITEM % (i % 99, i, i, i, 1024 ** 3 + i, i % 60) for i in range(count))
+    return ('<?xml version="1.0" encoding="utf-8"?><rss version="2.0"><channel><title>Example</title>%s'
+            '</channel></rss>' % items).encode("utf-8")
+
+
+def gen_torznab(count):
+    items = "".join(TORZNAB_ITEM % (i % 99, i, i, 1024 ** 3 + i, i, i % 500) for i in range(count))
+    return ('<?xml version="1.0" encoding="UTF-8"?><rss version="2.0" '
+            'xmlns:torznab="http://torznab.com/schemas/2015/feed"><channel>%s</channel></rss>' % items).encode("utf-8")
+
+
+def minidom_rss(content):
+    """
+    原minidom方式解析RSS
+    """
+    ret_array = []
+    dom_tree = xml.dom.minidom.parseString(content)
+    for item in dom_tree.documentElement.getElementsByTagName("item"):
+        title = DomUtils.tag_value(item, "title", default="")
+        if not title:
+            continue
+        enclosure = DomUtils.tag_value(item, "enclosure", "url", default="")
+        if not enclosure:
+            continue
+        size = DomUtils.tag_value(item, "enclosure", "length", default=0)
+        size = int(size) if size and str(size).isdigit() else 0
+        pubdate = DomUtils.tag_value(item, "pubDate", default="")
+        if pubdate:
+            pubdate = StringUtils.get_time_stamp(pubdate)
+        ret_array.append({'title': title,
+                          'enclosure': enclosure,
+                          'size': size,
+                          'description': DomUtils.tag_value(item, "description", default=""),
+                          'link': DomUtils.tag_value(item, "link", default=""),
+                          'pubdate': pubdate})
+    return ret_array
+
+
+def minidom_torznab(content):
+    """
+    原minidom方式解析Torznab
+    """
+    torrents = []
+    dom_tree = xml.dom.minidom.parseString(content)
+    for item in dom_tree.documentElement.getElementsByTagName("item"):
+        title = DomUtils.tag_value(item, "title", default="")
+        enclosure = DomUtils.tag_value(item, "enclosure", "url", default="")
+        if not title or not enclosure:
+            continue
+        attrs = {}
+        for torznab_attr in item.getElementsByTagName("torznab:attr"):
+            attrs[torznab_attr.getAttribute('name')] = torznab_attr.getAttribute('value')
+        torrents.append({'title': title,
+                         'enclosure': enclosure,
+                         'description': DomUtils.tag_value(item, "description", default=""),
+                         'size': DomUtils.tag_value(item, "size", default=0),
+                         'page_url': DomUtils.tag_value(item, "comments", default=""),
+                         'seeders': attrs.get("seeders")})
+    return torrents
+
+
+def stream_rss(content):
+    return list(RssUtils.parse_rss_items(content))
+
+
+def stream_torznab(content):
+    return list(RssUtils.parse_torznab_items(content))
+
+
+def measure(func, content, rounds=5):
+    """
+    返回平均耗时（毫秒）、峰值内存（KB）及解析条数
+    """
+    start = time.perf_counter()
+    for _ in range(rounds):
+        func(content)
+    cost = (time.perf_counter() - start) / rounds * 1000
+    tracemalloc.start()
+    result = func(content)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return cost, peak / 1024, len(result)
+
+
+def compare(name, content, old_func, new_func):
+    old_cost, old_peak, old_count = measure(old_func, content)
+    new_cost, new_peak, new_count = measure(new_func, content)
+    print("%-24s %8.1fKB  minidom: %8.1fms %10.1fKB %5d条  流式: %8.1fms %10.1fKB %5d条  提速 %.1fx" % (
+        name, len(content) / 1024, old_cost, old_peak, old_count, new_cost, new_peak, new_count,
+        old_cost / new_cost if new_cost else 0))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        for file in sys.argv[1:]:
+            with open(file, "rb") as f:
+                feed = f.read()
+            if b"torznab" in feed:
+                compare(file, feed, minidom_torznab, stream_torznab)
+            else:
+                compare(file, feed, minidom_rss, stream_rss)
+    else:
+        for num in [50, 500, 5000]:
+            compare("rss-%s" % num, gen_rss(num), minidom_rss, stream_rss)
+        for num in [100, 1000, 10000]:
+            compare("torznab-%s" % num, gen_torznab(num), minidom_torznab, stream_torznab)
@@ -0,0 +1,329 @@
+# -*- coding: utf-8 -*-
+"""
+种子解析性能对比：原逐字节解析器、bencode.py与memoryview单次遍历解析
+运行：python -m tests.benchmark_torrent_parser [种子文件 ...]
+未指定文件时使用生成的剧集合集种子
+"""
+import hashlib
+import io
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import urllib.parse
+
+import bencode
+
+from app.utils.torrentParser import TorrentParser
+
+
+class LegacyTorrentParser:
+    """
+    原逐字节读取的解析器（已去除调试日志），仅用于对比
+    """
+    info_start = 0
+    info_end = 0
+    info_start_dict = 0
+    open_dicts = 0
+    file = None
+
+    @staticmethod
+    def isNumeric(i):
+        try:
+            int(i)
+            return True
+        except ValueError:
+            return False
+
+    def readDict(self, str_data=None):
+
+        self.open_dicts += 1
+
+        if str_data is not None:
+            if isinstance(str_data, str):
+                str_data = str_data.encode("utf-8")
+            self.file = io.BytesIO(str_data)
+
+        dictionary = {}
+        key = None
+        value = None
+
+        c = True
+        while c:
+            c = self.file.read(1)
+            try:
+                d = c.decode("utf-8")
+            except UnicodeDecodeError:
+                continue
+
+            if d == 'd':
+                # Recursion!
+                newD = self.readDict()
+                # Dictionaries can only be values
+                if value is None:
+                    value = newD
+
+            if d == 'l':
+                # List
+                l = self.readList()
+                # Lists can only be values
+                if value is None:
+                    value = l
+
+            if self.isNumeric(d):
+                # String
+                self.file.seek(-1, io.SEEK_CUR)  # Start of the string, ex. 6:foobar
+                s = self.readString()
+                if key is not None:
+                    # If the key is set, this is the value
+                    value = s
+                else:
+                    # If the key isn't set, this is the key
+                    key = s
+                    if key == "info":
+                        # Info data starts here
+                        self.info_start_dict = self.open_dicts
+                        self.info_start = self.file.tell()
+
+            if d == 'i':
+                # Integer
+                self.file.seek(-1, io.SEEK_CUR)  # Start of the integer, ex. i42e
+                i = self.readInt()
+                if key is not None:
+                    # If the key is set, this is the value
+                    value = i
+                else:
+                    # If the key isn't set, this is the key
+                    key = i
+
+            if d == 'e':
+                # Dict close
+                if self.info_start_dict == self.open_dicts:
+                    # Info data ends
+                    self.info_end = self.file.tell() - 1
+                self.open_dicts -= 1
+                break
+
+            # Bencoded files are dictionaries so we need both key and value
+            if key is not None and value is not None:
+                dictionary[key] = value
+                key = None
+                value = None
+
+            if key is None and value is not None and str_data is not None:
+                return value
+
+        return dictionary
+
+    def readList(self):
+        c = True
+
+        list_values = []
+
+        while c:
+            c = self.file.read(1)
+            try:
+                d = c.decode("utf-8")
+            except UnicodeDecodeError:
+                continue
+
+            if d == 'd':
+                newD = self.readDict()
+                list_values.append(newD)
+
+            if d == 'l':
+                # List
+                l = self.readList()
+
+                list_values.append(l)
+
+            if self.isNumeric(d):
+                # String
+                self.file.seek(-1, io.SEEK_CUR)  # Start of the string, ex. 6:foobar
+                s = self.readString()
+
+                list_values.append(s)
+
+            if d == 'i':
+                # Integer
+                self.file.seek(-1, io.SEEK_CUR)  # Start of the integer, ex. i42e
+                i = self.readInt()
+
+                list_values.append(i)
+
+            if d == 'e':
+                # List end
+                break
+
+        return list_values
+
+    @staticmethod
+    def _readCharacter(fileObj):
+        try:
+            return fileObj.read(1).decode("utf-8")
+        except UnicodeDecodeError:
+            raise ValueError("Malformed integer: UnicodeDecodeError")
+
+    def readInt(self):
+        """
+        Ints must be of the form i[0-9]+e or i-[0-9]+e
+        """
+
+        # Integers must be encapsulated, ex. i42e = 42
+
+        if not self._readCharacter(self.file) == 'i':
+            raise ValueError("Malformed integer - must lead with 'i'")
+
+        num = ""
+        while True:
+            # We read the file until 'e'
+            d = self.file.read(1).decode("utf-8")
+
+            if self.isNumeric(d) or d == '-':
+                num += d
+            elif d == 'e':
+                # Correctly read integer
+                break
+            else:
+                raise ValueError("Malformed integer element - {} + *{}*".format(num, d))
+
+        realInt = int(num)
+
+        return realInt
+
+    def readString(self):
+        # Read the length of the string
+        b = True
+        len_text = ""
+
+        # Read file until non-numeric value
+        while b:
+            b = self.file.read(1)
+            try:
+                d = b.decode("utf-8")
+            except UnicodeDecodeError:
+                raise ValueError("Malformed UTF-8 string")
+            if self.isNumeric(d):
+                len_text += d
+            else:
+                break
+        # Now we have the length of the string
+        str_len = int(len_text)
+
+        # Read the string
+        string = self.file.read(str_len)
+        try:
+            utfString = string.decode("utf-8")
+            return utfString
+        except UnicodeDecodeError:
+            # If we can't decode the string as UTF-8 then it's data
+            # Return "raw" data
+            return string
+
+    def readFile(self, path):
+
+        self.file = open(path, "rb")
+
+        # I think that there can't be multiple dictionaries at root level
+        # Correct me if I'm wrong
+
+        dictionary = {}
+
+        # Read torrent file
+
+        c = self.file.read(1)
+        while c:
+            try:
+                d = c.decode("utf-8")
+            except UnicodeDecodeError:
+                continue
+            if d == 'd':
+                # Dictionary
+                self.open_dicts += 1
+                dictionary["torrent"] = self.readDict()
+            c = self.file.read(1)
+
+        # Calculate infohash
+        # Infohash is a SHA-1 hash of the value of the info key (bencoded dict)
+
+        self.file.seek(self.info_start)
+        infohash_data = self.file.read(self.info_end - self.info_start)
+
+        infohash = hashlib.sha1(infohash_data)
+
+        self.file.close()
+
+        # Infohash in a few different formats
+        extra = {"infohash": {"digest": infohash.digest(), "hex": infohash.hexdigest(),
+                              "url": urllib.parse.quote(infohash.digest())}}
+
+        dictionary["extra_data"] = extra
+
+        return dictionary
+
+
+def gen_torrent(file_count, piece_count):
+    files = [{"length": 1024 ** 3 + i, "path": ["Season %s" % (i // 100 + 1), "Show.S%02dE%03d.2160p.WEB-DL.mkv" % (
+        i // 100 + 1, i % 100 + 1)]} for i in range(file_count)]
+    return bencode.bencode({"announce": "https://tracker.example.com/announce.php?passkey=abc",
+                            "info": {"name": "Show.Complete.2160p.WEB-DL",
+                                     "piece length": 16 * 1024 * 1024,
+                                     "pieces": os.urandom(20 * piece_count),
+                                     "files": files}})
+
+
+def legacy_parse(content):
+    with tempfile.NamedTemporaryFile(suffix=".torrent", delete=False) as f:
+        f.write(content)
+    try:
+        torrent = LegacyTorrentParser().readFile(f.name)
+        files = torrent.get("torrent").get("info", {}).get("files") or []
+        return torrent.get("extra_data").get("infohash").get("hex"), [item["path"][0] for item in files]
+    finally:
+        os.remove(f.name)
+
+
+def bencode_parse(content):
+    info = bencode.bdecode(content).get("info")
+    return hashlib.sha1(bencode.bencode(info)).hexdigest(), ["/".join(item["path"]) for item in info.get("files")]
+
+
+def fast_parse(content):
+    torrent_info = TorrentParser.parse(content)
+    return torrent_info.get("infohash"), [file.get("path") for file in torrent_info.get("files")]
+
+
+def measure(func, content, rounds=3):
+    """
+    返回平均耗时（毫秒）、峰值内存（KB）及解析结果
+    """
+    start = time.perf_counter()
+    for _ in range(rounds):
+        func(content)
+    cost = (time.perf_counter() - start) / rounds * 1000
+    tracemalloc.start()
+    result = func(content)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return cost, peak / 1024, result
+
+
+def compare(name, content):
+    line = "%-28s %8.1fKB" % (name, len(content) / 1024)
+    results = []
+    for title, func in [("原解析器", legacy_parse), ("bencode.py", bencode_parse), ("memoryview", fast_parse)]:
+        cost, peak, result = measure(func, content)
+        results.append(result[0])
+        line += "  %s: %8.1fms %9.1fKB" % (title, cost, peak)
+    print(line + "  InfoHash一致：%s" % (len(set(results)) == 1))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        for file in sys.argv[1:]:
+            with open(file, "rb") as f:
+                compare(os.path.basename(file), f.read())
+    else:
+        for num_files, num_pieces in [(1, 1000), (100, 10000), (1000, 50000), (5000, 100000)]:
+            compare("files-%s pieces-%s" % (num_files, num_pieces), gen_torrent(num_files, num_pieces))
@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+"""
+自定义识别词性能对比：原逐条编译正则与预编译识别词
+运行：python -m tests.benchmark_words_helper [识别词数量]
+使用tests/cases/meta_cases.py中的标题，生成指定数量的识别词（默认300个，大部分与标题不相关），同时校验两者结果一致
+"""
+import sys
+import time
+from unittest import mock
+
+import regex as re
+
+from app.helper import SqlHelper
+from app.helper.words_helper import WordsHelper
+from tests.cases.meta_cases import meta_cases
+
+
+class LegacyWords:
+    """
+    原识别词处理逻辑，仅用于对比
+    """
+
+    def __init__(self, words):
+        self.ignored_words_info = words.get((1, 1))
+        self.ignored_words_noregex_info = words.get((1, 0))
+        self.replaced_words_info = words.get((2, 1))
+        self.replaced_words_noregex_info = words.get((2, 0))
+        self.replaced_offset_words_info = words.get((3, 1))
+        self.offset_words_info = words.get((4, 1))
+
+    def process(self, title):
+        msg = ""
+        used_ignored_words = []
+        used_replaced_words = []
+        used_offset_words = []
+        if self.ignored_words_info:
+            try:
+                ignored_words = []
+                for ignored_word_info in self.ignored_words_info:
+                    ignored_words.append(ignored_word_info[1])
+                ignored_words = "|".join(ignored_words)
+                ignored_words = re.compile(r'%s' % ignored_words)
+                used_ignored_words = list(set(re.findall(ignored_words, title)))
+                if used_ignored_words:
+                    title = re.sub(ignored_words, '', title)
+            except Exception as err:
+                msg = "【Meta】自定义屏蔽词设置有误：%s" % str(err)
+        if self.ignored_words_noregex_info:
+            try:
+                for ignored_word_noregex_info in self.ignored_words_noregex_info:
+                    ignored_word = ignored_word_noregex_info[1]
+                    if title.find(ignored_word) != -1:
+                        title = title.replace(ignored_word, '')
+                        used_ignored_words.append(ignored_word)
+            except Exception as err:
+                msg = "【Meta】自定义屏蔽词设置有误：%s" % str(err)
+        if self.replaced_words_info:
+            for replaced_word_info in self.replaced_words_info:
+                try:
+                    replaced = replaced_word_info[1]
+                    replace = replaced_word_info[2]
+                    replaced_word = "%s@%s" % (replaced, replace)
+                    if re.findall(r'%s' % replaced, title):
+                        used_replaced_words.append(replaced_word)
+                        title = re.sub(r'%s' % replaced, r'%s' % replace, title)
+                except Exception as err:
+                    msg = "【Meta】自定义替换词 %s 格式有误：%s" % (replaced_word_info, str(err))
+        if self.replaced_words_noregex_info:
+            for replaced_word_noregex_info in self.replaced_words_noregex_info:
+                try:
+                    replaced = replaced_word_noregex_info[1]
+                    replace = replaced_word_noregex_info[2]
+                    replaced_word = "%s@%s" % (replaced, replace)
+                    if title.find(replaced) != -1:
+                        used_replaced_words.append(replaced_word)
+                        title = title.replace(replaced, replace)
+                except Exception as err:
+                    msg = "【Meta】自定义替换词 %s 格式有误：%s" % (replaced_word_noregex_info, str(err))
+        if self.replaced_offset_words_info:
+            for replaced_offset_word_info in self.replaced_offset_words_info:
+                try:
+                    replaced = replaced_offset_word_info[1]
+                    replace = replaced_offset_word_info[2]
+                    front = replaced_offset_word_info[3]
+                    back = replaced_offset_word_info[4]
+                    offset = replaced_offset_word_info[5]
+                    replaced_word = "%s@%s" % (replaced, replace)
+                    if re.findall(r'%s' % replaced, title):
+                        used_replaced_words.append(replaced_word)
+                        title = re.sub(r'%s' % replaced, r'%s' % replace, title)
+                        title, msg = self.episode_offset(front, back, offset, used_offset_words, title)
+                except Exception as err:
+                    msg = "【Meta】自定义替换+集偏移词 %s 格式有误：%s" % (replaced_offset_word_info, str(err))
+        if self.offset_words_info:
+            for offset_word_info in self.offset_words_info:
+                front = offset_word_info[3]
+                back = offset_word_info[4]
+                offset = offset_word_info[5]
+                title, msg = self.episode_offset(front, back, offset, used_offset_words, title)
+        return title, msg, {"ignored": used_ignored_words,
+                            "replaced": used_replaced_words,
+                            "offset": used_offset_words}
+
+    @staticmethod
+    def episode_offset(front, back, offset, used_offset_words, title):
+        msg = ""
+        offset_num = int(offset)
+        offset_word = "%s@%s@%s" % (front, back, offset)
+        try:
+            if back and not re.findall(r'%s' % back, title):
+                return title, msg
+            if front and not re.findall(r'%s' % front, title):
+                return title, msg
+            offset_word_info_re = re.compile(r'(?<=%s[\W\w]*)[0-9]+(?=[\W\w]*%s)' % (front, back))
+            episode_nums_str = re.findall(offset_word_info_re, title)
+            if not episode_nums_str:
+                return title, msg
+            episode_nums_int = [int(x) for x in episode_nums_str]
+            episode_nums_dict = dict(zip(episode_nums_str, episode_nums_int))
+            used_offset_words.append(offset_word)
+            if offset_num < 0:
+                episode_nums_list = sorted(episode_nums_dict.items(), key=lambda x: x[1])
+            else:
+                episode_nums_list = sorted(episode_nums_dict.items(), key=lambda x: x[1], reverse=True)
+            for episode_num in episode_nums_list:
+                episode_offset_re = re.compile(
+                    r'(?<=%s[\W\w]*)%s(?=[\W\w]*%s)' % (front, episode_num[0], back))
+                title = re.sub(episode_offset_re, r'%s' % str(episode_num[1] + offset_num).zfill(2), title)
+            return title, msg
+        except Exception as err:
+            msg = "自定义集数偏移 %s 格式有误：%s" % (offset_word, str(err))
+            return title, msg
+
+
+def gen_words(count):
+    """
+    生成识别词，{(类型, 是否正则): [(ID, 被替换词, 替换词, 前定位词, 后定位词, 偏移)]}
+    """
+    words = {(1, 1): [], (1, 0): [], (2, 1): [], (2, 0): [], (3, 1): [], (4, 1): []}
+    # 与测试标题相关的识别词
+    words[(1, 1)].append((0, r"\[\d{4}年\d+月新番\]", "", "", "", 0))
+    words[(1, 0)].append((0, "@ADWeb", "", "", "", 0))
+    words[(2, 1)].append((0, r"B-Global\s+WEB-DL", "WEB-DL", "", "", 0))
+    words[(2, 1)].append((0, r"Tsuyoku\s+Natta", "Tsuyoku Natta", "", "", 0))
+    words[(2, 0)].append((0, "Agetetara", "Agetetara", "", "", 0))
+    words[(3, 1)].append((0, r"Naze ka Tsuyoku", "Naze ka Tsuyoku", "Natta S01E", "2022", 1))
+    words[(4, 1)].append((0, "", "", r"Bakka Agetetara.*S01E", r"\s+2022", -1))
+    # 其余与标题无关的识别词
+    for i in range(count):
+        kind = i % 6
+        if kind == 0:
+            words[(1, 1)].append((i, r"\[自定义屏蔽%s\]" % i, "", "", "", 0))
+        elif kind == 1:
+            words[(1, 0)].append((i, "自定义屏蔽%s" % i, "", "", "", 0))
+        elif kind == 2:
+            words[(2, 1)].append((i, r"Custom\.?Title\.?%s\s*(\d+)" % i, r"Custom Title %s \1" % i, "", "", 0))
+        elif kind == 3:
+            words[(2, 0)].append((i, "Custom.Name.%s" % i, "Custom Name %s" % i, "", "", 0))
+        elif kind == 4:
+            words[(3, 1)].append((i, r"Show%s[\.\s]+S01" % i, "Show%s S02" % i, r"Show%s S02E" % i, r"\s", -12))
+        else:
+            words[(4, 1)].append((i, "", "", r"第%s部.*第" % i, "集", 24))
+    return words
+
+
+def run(func, titles, rounds=5):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for title in titles:
+            func(title)
+    return (time.perf_counter() - start) / rounds / len(titles) * 1000 * 1000
+
+
+if __name__ == '__main__':
+    word_count = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    custom_words = gen_words(word_count)
+    with mock.patch.object(SqlHelper, "get_custom_words",
+                           side_effect=lambda enabled, wtype, regex: custom_words.get((wtype, regex))):
+        words_helper = WordsHelper()
+        words_helper.init_config()
+    legacy = LegacyWords(custom_words)
+    test_titles = [case.get("title") for case in meta_cases if case.get("title")]
+    diff = [title for title in test_titles if legacy.process(title) != words_helper.process(title)]
+    old_cost = run(legacy.process, test_titles)
+    new_cost = run(words_helper.process, test_titles)
+    print("识别词 %s 个，标题 %s 个，结果不一致 %s 个" % (sum([len(x) for x in custom_words.values()]),
+                                                 len(test_titles), len(diff)))
+    print("原处理: %8.1fμs/标题  预编译: %8.1fμs/标题  提速 %.1fx" % (old_cost, new_cost, old_cost / new_cost))
+    for title in diff:
+        print(title, legacy.process(title), words_helper.process(title), sep="\n  ")
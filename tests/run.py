@@ -1,11 +1,14 @@
 import unittest
 
 from tests.test_metainfo import MetaInfoTest
+from tests.test_torrent_parser import TorrentParserTest
 
 if __name__ == '__main__':
     suite = unittest.TestSuite()
     # 测试名称识别
     suite.addTest(MetaInfoTest('test_metainfo'))
+    # 测试种子解析
+    suite.addTest(unittest.defaultTestLoader.loadTestsFromTestCase(TorrentParserTest))
 
     # 运行测试
     runner = unittest.TextTestRunner()
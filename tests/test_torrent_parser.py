@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+import hashlib
+from unittest import TestCase
+
+from app.utils.torrentParser import TorrentParser
+
+
+def bencode(value):
+    """
+    生成测试用的bencode内容，字典按键排序
+    """
+    if isinstance(value, int):
+        return b"i%de" % value
+    if isinstance(value, str):
+        value = value.encode("utf-8")
+    if isinstance(value, bytes):
+        return b"%d:%s" % (len(value), value)
+    if isinstance(value, list):
+        return b"l" + b"".join(bencode(item) for item in value) + b"e"
+    if isinstance(value, dict):
+        return b"d" + b"".join(bencode(key) + bencode(value[key]) for key in sorted(value)) + b"e"
+    raise TypeError(type(value))
+
+
+class TorrentParserTest(TestCase):
+    def setUp(self) -> None:
+        self.single_info = {
+            "length": 1234567890,
+            "name": "Movie.2022.1080p.BluRay.x264-GROUP.mkv",
+            "piece length": 262144,
+            "pieces": b"\x00\xff" * 30
+        }
+        self.multi_info = {
+            "files": [
+                {"length": 1000, "path": ["Show.S01.1080p", "Season 1", "Show.S01E01.mkv"]},
+                {"length": 2000, "path": ["Show.S01.1080p", "Season 1", "Show.S01E02.mkv"]},
+                {"length": 30, "path": ["字幕", "Show.S01E01.chs.ass"]}
+            ],
+            "name": "Show.S01.1080p",
+            "piece length": 262144,
+            "pieces": b"\x12" * 40
+        }
+
+    def tearDown(self) -> None:
+        pass
+
+    def test_single_file(self):
+        content = bencode({"announce": "http://tracker/announce",
+                           "creation date": 1660000000,
+                           "info": self.single_info})
+        ret = TorrentParser.parse(content)
+        self.assertEqual(ret.get("infohash"), hashlib.sha1(bencode(self.single_info)).hexdigest())
+        self.assertEqual(ret.get("name"), "Movie.2022.1080p.BluRay.x264-GROUP.mkv")
+        self.assertEqual(ret.get("size"), 1234567890)
+        self.assertEqual(ret.get("files"), [{"path": "Movie.2022.1080p.BluRay.x264-GROUP.mkv", "size": 1234567890}])
+
+    def test_multi_file(self):
+        content = bencode({"announce": "http://tracker/announce",
+                           "comment": "test",
+                           "info": self.multi_info})
+        ret = TorrentParser.parse(content)
+        self.assertEqual(ret.get("infohash"), hashlib.sha1(bencode(self.multi_info)).hexdigest())
+        self.assertEqual(ret.get("name"), "Show.S01.1080p")
+        self.assertEqual(ret.get("size"), 3030)
+        self.assertEqual(ret.get("files"), [
+            {"path": "Show.S01.1080p/Season 1/Show.S01E01.mkv", "size": 1000},
+            {"path": "Show.S01.1080p/Season 1/Show.S01E02.mkv", "size": 2000},
+            {"path": "字幕/Show.S01E01.chs.ass", "size": 30}
+        ])
+
+    def test_utf8_names(self):
+        info = dict(self.multi_info)
+        info["name.utf-8"] = "剧集.S01"
+        info["files"] = [{"length": 10, "path": ["bad"], "path.utf-8": ["第一季", "第01集.mkv"]}]
+        ret = TorrentParser.parse(bencode({"info": info}))
+        self.assertEqual(ret.get("infohash"), hashlib.sha1(bencode(info)).hexdigest())
+        self.assertEqual(ret.get("name"), "剧集.S01")
+        self.assertEqual(ret.get("files"), [{"path": "第一季/第01集.mkv", "size": 10}])
+
+    def test_infohash_uses_raw_info(self):
+        # info字典不是按键排序时，InfoHash按原始字节计算，不重新编码
+        raw_info = b"d4:name4:test6:lengthi5e12:piece lengthi16384e6:pieces20:" + b"\x01" * 20 + b"e"
+        content = b"d8:announce3:url4:info" + raw_info + b"e"
+        ret = TorrentParser.parse(content)
+        self.assertEqual(ret.get("infohash"), hashlib.sha1(raw_info).hexdigest())
+        self.assertEqual(ret.get("size"), 5)
+
+    def test_pieces_not_copied(self):
+        metadata, info_start, info_end = TorrentParser.decode(bencode({"info": self.single_info}))
+        pieces = metadata.get("info").get("pieces")
+        self.assertIsInstance(pieces, memoryview)
+        self.assertEqual(bytes(pieces), self.single_info.get("pieces"))
+        self.assertEqual((info_start, info_end), (7, 7 + len(bencode(self.single_info))))
+
+    def test_not_torrent(self):
+        self.assertIsNone(TorrentParser.parse(bencode({"announce": "http://tracker/announce"})))
+        self.assertIsNone(TorrentParser.parse(bencode({"info": "not a dict"})))
+        self.assertIsNone(TorrentParser.parse(bencode([1, 2, 3])))
+        self.assertIsNone(TorrentParser.parse(b"i42e"))
+
+    def test_malformed(self):
+        content = bencode({"info": self.multi_info})
+        for bad in [b"",
+                    b"<html><body>404</body></html>",
+                    b"d4:info",
+                    content[:len(content) // 2],
+                    content[:-1],
+                    b"d4:name100:short",
+                    b"d4:namex:abce",
+                    b"d6:lengthi12",
+                    b"d6:lengthi1x2ee"]:
+            with self.assertRaises(ValueError, msg=bad):
+                TorrentParser.parse(bad)
@@ -28,10 +28,12 @@ from app.downloader import Qbittorrent, Transmission, Downloader
 from app.filterrules import FilterRule
 from app.mediaserver import Emby, Jellyfin, Plex
 from app.rss import Rss
+from app.rsscalendar import RssCalendar
 from app.sites import Sites
 from app.subtitle import Subtitle
 from app.media import Category, Media, MetaInfo
 from app.media.doubanv2api import DoubanApi
+from app.media.meta.release_groups import init_release_groups
 from app.filetransfer import FileTransfer
 from app.scheduler import restart_scheduler, stop_scheduler
 from app.sync import restart_monitor, stop_monitor
@@ -83,6 +85,7 @@ class WebAction:
             "delete_tmdb_cache": self.__delete_tmdb_cache,
             "movie_calendar_data": self.__movie_calendar_data,
             "tv_calendar_data": self.__tv_calendar_data,
+            "rss_calendar_data": self.__rss_calendar_data,
             "modify_tmdb_cache": self.__modify_tmdb_cache,
             "rss_detail": self.__rss_detail,
             "truncate_blacklist": self.__truncate_blacklist,
@@ -111,6 +114,7 @@ class WebAction:
             "clear_tmdb_cache": self.__clear_tmdb_cache,
             "check_site_attr": self.__check_site_attr,
             "refresh_process": self.__refresh_process,
+            "search_result_count": self.__search_result_count,
             "restory_backup": self.__restory_backup,
             "start_mediasync": self.__start_mediasync,
             "mediasync_state": self.__mediasync_state,
@@ -886,6 +890,7 @@ class WebAction:
         category_reload = False
         subtitle_reload = False
         sites_reload = False
+        release_groups_reload = False
         # 修改配置
         for key, value in cfgs:
             if key == "test" and value:
@@ -912,6 +917,8 @@ class WebAction:
                 subtitle_reload = True
             if key.startswith("message.switch"):
                 sites_reload = True
+            if key == "media.release_groups":
+                release_groups_reload = True
         # 保存配置
         if not config_test:
             self.config.save_config(cfg)
@@ -943,6 +950,9 @@ class WebAction:
         # 重载站点
         if sites_reload:
             Sites().init_config()
+        # 重载自定义制作组
+        if release_groups_reload:
+            init_release_groups()
 
         return {"code": 0}
 
@@ -1335,111 +1345,30 @@ class WebAction:
         """
         查询电影上映日期
         """
-        tid = data.get("id")
-        if tid and tid.startswith("DB:"):
-            doubanid = tid.replace("DB:", "")
-            douban_info = DoubanApi().movie_detail(doubanid)
-            if not douban_info:
-                return {"code": 1, "retmsg": "无法查询到豆瓣信息"}
-            poster_path = douban_info.get("cover_url") or ""
-            title = douban_info.get("title")
-            rating = douban_info.get("rating", {}) or {}
-            vote_average = rating.get("value") or "无"
-            release_date = douban_info.get("pubdate")
-            if release_date:
-                release_date = re.sub(r"\(.*\)", "", douban_info.get("pubdate")[0])
-            if not release_date:
-                return {"code": 1, "retmsg": "上映日期不正确"}
-            else:
-                return {"code": 0,
-                        "type": "电影",
-                        "title": title,
-                        "start": release_date,
-                        "id": tid,
-                        "year": release_date[0:4] if release_date else "",
-                        "poster": poster_path,
-                        "vote_average": vote_average
-                        }
-        else:
-            tmdb_info = Media().get_tmdb_info(mtype=MediaType.MOVIE, tmdbid=tid)
-            if not tmdb_info:
-                return {"code": 1, "retmsg": "无法查询到TMDB信息"}
-            poster_path = TMDB_IMAGE_W500_URL % tmdb_info.get('poster_path') if tmdb_info.get(
-                'poster_path') else ""
-            title = tmdb_info.get('title')
-            vote_average = tmdb_info.get("vote_average")
-            release_date = tmdb_info.get('release_date')
-            if not release_date:
-                return {"code": 1, "retmsg": "上映日期不正确"}
-            else:
-                return {"code": 0,
-                        "type": "电影",
-                        "title": title,
-                        "start": release_date,
-                        "id": tid,
-                        "year": release_date[0:4] if release_date else "",
-                        "poster": poster_path,
-                        "vote_average": vote_average
-                        }
+        events, retmsg = RssCalendar().get_movie_events(data.get("id"))
+        if not events:
+            return {"code": 1, "retmsg": retmsg}
+        return dict(events[0], code=0)
 
     @staticmethod
     def __tv_calendar_data(data):
         """
         查询电视剧上映日期
         """
-        tid = data.get("id")
         season = data.get("season")
-        name = data.get("name")
-        if tid and tid.startswith("DB:"):
-            doubanid = tid.replace("DB:", "")
-            douban_info = DoubanApi().tv_detail(doubanid)
-            if not douban_info:
-                return {"code": 1, "retmsg": "无法查询到豆瓣信息"}
-            poster_path = douban_info.get("cover_url") or ""
-            title = douban_info.get("title")
-            rating = douban_info.get("rating", {}) or {}
-            vote_average = rating.get("value") or "无"
-            release_date = re.sub(r"\(.*\)", "", douban_info.get("pubdate")[0])
-            if not release_date:
-                return {"code": 1, "retmsg": "上映日期不正确"}
-            else:
-                return {"code": 0,
-                        "type": "电视剧",
-                        "title": title,
-                        "start": release_date,
-                        "id": tid,
-                        "year": release_date[0:4] if release_date else "",
-                        "poster": poster_path,
-                        "vote_average": vote_average
-                        }
-        else:
-            tmdb_info = Media().get_tmdb_tv_season_detail(tmdbid=tid, season=season)
-            if not tmdb_info:
-                return {"code": 1, "retmsg": "无法查询到TMDB信息"}
-            episode_events = []
-            air_date = tmdb_info.get("air_date")
-            if not tmdb_info.get("poster_path"):
-                tv_tmdb_info = Media().get_tmdb_info(mtype=MediaType.TV, tmdbid=tid)
-                if tv_tmdb_info:
-                    poster_path = TMDB_IMAGE_W500_URL % tv_tmdb_info.get("poster_path")
-                else:
-                    poster_path = ""
-            else:
-                poster_path = TMDB_IMAGE_W500_URL % tmdb_info.get("poster_path")
-            year = air_date[0:4] if air_date else ""
-            for episode in tmdb_info.get("episodes"):
-                episode_events.append({
-                    "type": "剧集",
-                    "title": "%s 第%s季第%s集" % (
-                        name, season, episode.get("episode_number")) if season != 1 else "%s 第%s集" % (
-                        name, episode.get("episode_number")),
-                    "start": episode.get("air_date"),
-                    "id": tid,
-                    "year": year,
-                    "poster": poster_path,
-                    "vote_average": episode.get("vote_average") or "无"
-                })
-            return {"code": 0, "events": episode_events}
+        if str(season).isdigit():
+            season = int(season)
+        events, retmsg = RssCalendar().get_tv_events(data.get("id"), season, data.get("name"))
+        if retmsg:
+            return {"code": 1, "retmsg": retmsg}
+        return {"code": 0, "events": events}
+
+    @staticmethod
+    def __rss_calendar_data(data):
+        """
+        查询全部订阅的日历事件
+        """
+        return {"code": 0, "events": RssCalendar().get_events()}
 
     @staticmethod
     def __rss_detail(data):
@@ -2162,7 +2091,6 @@ class WebAction:
         """
         try:
             MetaHelper().clear_meta_data()
-            os.remove(MetaHelper().get_meta_data_path())
         except Exception as e:
             return {"code": 0, "msg": str(e)}
         return {"code": 0}
@@ -2193,6 +2121,16 @@ class WebAction:
         else:
             return {"code": 1, "value": 0, "text": "正在处理..."}
 
+    @staticmethod
+    def __search_result_count(data):
+        """
+        查询检索中已插入的结果数，页面据此提前展示及刷新检索结果
+        """
+        detail = ProgressHelper().get_process("search") or {}
+        return {"code": 0,
+                "count": SqlHelper.get_search_result_count(),
+                "searching": True if detail.get("enable") else False}
+
     @staticmethod
     def __restory_backup(data):
         """
@@ -33,6 +33,8 @@ def search_medias_for_web(content, ident_flag=True, filters=None, tmdbid=None, m
     if not key_word:
         log.info("【Web】%s 检索关键字有误！" % content)
         return -1, "%s 未识别到搜索关键字！" % content
+    # 清空上次的检索结果后再开始进度，页面据此判断检索中的结果均为本次结果
+    SqlHelper.delete_all_search_torrents()
     # 开始进度
     search_process = ProgressHelper()
     search_process.start('search')
@@ -148,13 +150,12 @@ def search_medias_for_web(content, ident_flag=True, filters=None, tmdbid=None, m
     # 整合高级查询条件
     if filters:
         filter_args.update(filters)
-    # 开始检索
+    # 开始检索，每个索引器返回结果后即插入数据库，页面无需等待所有站点检索完成
     log.info("【Web】开始检索 %s ..." % content)
-    media_list = Searcher().search_medias(key_word=first_search_name,
-                                          filter_args=filter_args,
-                                          match_type=1 if ident_flag else 2,
-                                          match_media=media_info,
-                                          in_from=SearchType.WEB)
+    media_list = __search_and_save(key_word=first_search_name,
+                                   filter_args=filter_args,
+                                   match_type=1 if ident_flag else 2,
+                                   match_media=media_info)
     # 使用第二名称重新搜索
     if ident_flag \
             and len(media_list) == 0 \
@@ -164,13 +165,10 @@ def search_medias_for_web(content, ident_flag=True, filters=None, tmdbid=None, m
         search_process.update(ptype='search',
                               text="%s 未检索到资源,尝试通过 %s 重新检索 ..." % (first_search_name, second_search_name))
         log.info("【Searcher】%s 未检索到资源,尝试通过 %s 重新检索 ..." % (first_search_name, second_search_name))
-        media_list = Searcher().search_medias(key_word=second_search_name,
-                                              filter_args=filter_args,
-                                              match_type=1,
-                                              match_media=media_info,
-                                              in_from=SearchType.WEB)
-    # 清空缓存结果
-    SqlHelper.delete_all_search_torrents()
+        media_list = __search_and_save(key_word=second_search_name,
+                                       filter_args=filter_args,
+                                       match_type=1,
+                                       match_media=media_info)
     # 结束进度
     search_process.end('search')
     if len(media_list) == 0:
@@ -178,14 +176,30 @@ def search_medias_for_web(content, ident_flag=True, filters=None, tmdbid=None, m
         return 1, "%s 未检索到任何资源" % content
     else:
         log.info("【Web】共检索到 %s 个有效资源" % len(media_list))
-        # 插入数据库
-        media_list = sorted(media_list, key=lambda x: "%s%s%s" % (str(x.res_order).rjust(3, '0'),
-                                                                  str(x.site_order).rjust(3, '0'),
-                                                                  str(x.seeders).rjust(10, '0')), reverse=True)
-        SqlHelper.insert_search_results(media_list)
         return 0, ""
 
 
+def __search_and_save(key_word, filter_args, match_type, match_media):
+    """
+    流式检索，每个索引器的结果排序后立即插入数据库
+    """
+    media_list = []
+    for result in Searcher().search_medias_iter(key_word=key_word,
+                                                filter_args=filter_args,
+                                                match_type=match_type,
+                                                match_media=match_media,
+                                                in_from=SearchType.WEB):
+        result = [media for media in result if media not in media_list]
+        if not result:
+            continue
+        result = sorted(result, key=lambda x: "%s%s%s" % (str(x.res_order).rjust(3, '0'),
+                                                          str(x.site_order).rjust(3, '0'),
+                                                          str(x.seeders).rjust(10, '0')), reverse=True)
+        SqlHelper.insert_search_results(result)
+        media_list.extend(result)
+    return media_list
+
+
 def search_media_by_message(input_str, in_from: SearchType, user_id=None):
     """
     输入字符串，解析要求并进行资源检索
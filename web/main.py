@@ -35,6 +35,7 @@ from app.mediaserver import MediaServer
 from app.searcher import Searcher
 from app.sites import Sites
 from app.media import MetaInfo, Media
+from app.media.meta.metainfo import get_meta_cache_info
 from web.apiv1 import apiv1, authorization
 from web.backend.WXBizMsgCrypt3 import WXBizMsgCrypt
 from web.action import WebAction
@@ -612,14 +613,8 @@ def create_flask_app():
     @login_required
     def rss_calendar():
         Today = datetime.datetime.strftime(datetime.datetime.now(), '%Y-%m-%d')
-        RssMovieIds = [movie[2] for movie in SqlHelper.get_rss_movies()]
-        RssTvItems = [{"id": tv[3], "season": int(str(tv[2]).replace("S", "")), "name": tv[0]} for tv in
-                      SqlHelper.get_rss_tvs()
-                      if tv[2]]
         return render_template("rss/rss_calendar.html",
-                               Today=Today,
-                               RssMovieIds=RssMovieIds,
-                               RssTvItems=RssTvItems)
+                               Today=Today)
 
     # 站点维护页面
     @App.route('/site', methods=['POST', 'GET'])
@@ -1211,7 +1206,8 @@ def create_flask_app():
                                CurrentPage=current_page,
                                TotalPage=total_page,
                                PageRange=page_range,
-                               PageNum=page_num)
+                               PageNum=page_num,
+                               MetaCacheInfo=get_meta_cache_info())
 
     # 手工识别页面
     @App.route('/unidentification', methods=['POST', 'GET'])